@@ -14,18 +14,16 @@ from .serializers import (
     KPISerializer, KPIValueSerializer, ReportSerializer
 )
 from core.permissions import CanViewAnalytics, CanEditAssets
+from core.mixins import OrgScopedQuerysetMixin
 from assets.models import Asset
-from iot.models import TelemetryData, Alert
+from iot.models import Alert
+from iot.quality import asset_quality
 
-class AssetHealthViewSet(viewsets.ModelViewSet):
+class AssetHealthViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = AssetHealthSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-    
-    def get_queryset(self):
-        user = self.request.user
-        return AssetHealth.objects.filter(
-            asset__organization=user.organization
-        ).select_related('asset')
+    queryset = AssetHealth.objects.select_related('asset')
+    organization_field = 'asset__organization'
     
     @action(detail=False, methods=['get'])
     def latest(self, request):
@@ -46,7 +44,7 @@ class AssetHealthViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Asset ID is required'}, status=400)
         
         try:
-            asset = Asset.objects.get(id=asset_id, organization=request.user.organization)
+            asset = Asset.objects.get(id=asset_id, organization_id=self.principal.organization_id)
             
             # Calculate health score based on various factors
             health_score = self._calculate_asset_health(asset)
@@ -81,26 +79,23 @@ class AssetHealthViewSet(viewsets.ModelViewSet):
         elif recent_alerts.filter(severity='warning').exists():
             score -= 10
         
-        # Deduct for telemetry anomalies
-        recent_telemetry = TelemetryData.objects.filter(
-            asset=asset,
-            timestamp__gte=timezone.now() - timedelta(hours=24)
-        )
-        if recent_telemetry.count() > 0:
-            # Check for any telemetry values outside normal range
-            # This is simplified - in production, you'd have proper anomaly detection
-            pass
+        # Deduct for poor telemetry quality (per-series counters, no raw scan)
+        quality = asset_quality(asset.id)['score']
+        if quality is not None:
+            score -= 20 * (1.0 - quality)
         
         return max(0.0, min(100.0, score))
     
     def _get_health_factors(self, asset):
+        quality = asset_quality(asset.id)
         factors = {
             'asset_status': asset.status,
             'recent_alerts': Alert.objects.filter(
                 asset=asset,
                 created_at__gte=timezone.now() - timedelta(days=7)
             ).count(),
-            'telemetry_quality': 0.95,  # Placeholder
+            'telemetry_quality': quality.pop('score'),
+            'telemetry_quality_checks': quality,
             'maintenance_status': 'good',  # Placeholder
         }
         return factors
@@ -117,25 +112,16 @@ class AssetHealthViewSet(viewsets.ModelViewSet):
         
         return recommendations
 
-class PerformanceMetricViewSet(viewsets.ModelViewSet):
+class PerformanceMetricViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = PerformanceMetricSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-    
-    def get_queryset(self):
-        user = self.request.user
-        return PerformanceMetric.objects.filter(
-            asset__organization=user.organization
-        ).select_related('asset')
+    queryset = PerformanceMetric.objects.select_related('asset')
+    organization_field = 'asset__organization'
 
-class KPIViewSet(viewsets.ModelViewSet):
+class KPIViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = KPISerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-    
-    def get_queryset(self):
-        user = self.request.user
-        return KPI.objects.filter(
-            organization=user.organization
-        ).select_related('organization')
+    queryset = KPI.objects.select_related('organization')
     
     def perform_create(self, serializer):
         serializer.save(organization=self.request.user.organization)
@@ -181,25 +167,16 @@ class KPIViewSet(viewsets.ModelViewSet):
         else:
             return 0.0
 
-class KPIValueViewSet(viewsets.ReadOnlyModelViewSet):
+class KPIValueViewSet(OrgScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = KPIValueSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-    
-    def get_queryset(self):
-        user = self.request.user
-        return KPIValue.objects.filter(
-            kpi__organization=user.organization
-        ).select_related('kpi')
+    queryset = KPIValue.objects.select_related('kpi')
+    organization_field = 'kpi__organization'
 
-class ReportViewSet(viewsets.ModelViewSet):
+class ReportViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = ReportSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-    
-    def get_queryset(self):
-        user = self.request.user
-        return Report.objects.filter(
-            organization=user.organization
-        ).select_related('organization', 'generated_by')
+    queryset = Report.objects.select_related('organization', 'generated_by')
     
     def perform_create(self, serializer):
         serializer.save(
@@ -12,6 +12,7 @@ from .serializers import (
     AssetRelationshipSerializer,
 )
 from core.permissions import CanEditAssets, CanViewAnalytics
+from core.mixins import OrgScopedQuerysetMixin
 
 
 # ============================
@@ -28,16 +29,10 @@ class AssetTypeViewSet(viewsets.ModelViewSet):
 # ============================
 # ASSET
 # ============================
-class AssetViewSet(viewsets.ModelViewSet):
+class AssetViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = AssetSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-
-    def get_queryset(self):
-        return (
-            Asset.objects
-            .filter(organization=self.request.user.organization)
-            .select_related('asset_type', 'organization', 'created_by')
-        )
+    queryset = Asset.objects.select_related('asset_type', 'organization', 'created_by')
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -127,27 +122,21 @@ class AssetViewSet(viewsets.ModelViewSet):
 # ============================
 # ASSET METRIC
 # ============================
-class AssetMetricViewSet(viewsets.ModelViewSet):
+class AssetMetricViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = AssetMetricSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-
-    def get_queryset(self):
-        return AssetMetric.objects.filter(
-            asset__organization=self.request.user.organization
-        ).select_related('asset')
+    queryset = AssetMetric.objects.select_related('asset')
+    organization_field = 'asset__organization'
 
 
 # ============================
 # ASSET RELATIONSHIP
 # ============================
-class AssetRelationshipViewSet(viewsets.ModelViewSet):
+class AssetRelationshipViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = AssetRelationshipSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-
-    def get_queryset(self):
-        return AssetRelationship.objects.filter(
-            parent_asset__organization=self.request.user.organization
-        ).select_related('parent_asset', 'child_asset')
+    queryset = AssetRelationship.objects.select_related('parent_asset', 'child_asset')
+    organization_field = 'parent_asset__organization'
 
 
 from django.shortcuts import render
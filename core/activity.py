@@ -0,0 +1,125 @@
+"""
+Throttled ``last_activity`` tracking.
+
+Polling clients hit the API every few seconds; writing ``last_activity``
+on each request doubled the write load. ``ActivityTracker`` records
+activity in memory instead:
+
+* a user whose stored ``last_activity`` (loaded with ``request.user``
+  anyway) is younger than ``USER_ACTIVITY_INTERVAL`` is skipped, which
+  also throttles across processes;
+* other users are queued, and the queue is written at most every
+  ``USER_ACTIVITY_FLUSH_SECONDS`` with one UPDATE per chunk of users.
+
+Requests flush when due on their way out. The shared tracker also runs a
+daemon thread that flushes every ``USER_ACTIVITY_FLUSH_SECONDS``, so
+activity is written when no further request arrives, and flushes what is
+left at interpreter exit. Activity queued when a process is killed is
+lost; the value is a hint, not a record.
+
+The UPDATE goes through the queryset, so no save signals (and no audit
+entries) fire.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+INTERVAL = getattr(settings, 'USER_ACTIVITY_INTERVAL', 60)
+FLUSH_SECONDS = getattr(settings, 'USER_ACTIVITY_FLUSH_SECONDS', 10)
+UPDATE_CHUNK = 1000
+
+
+def write_last_activity(pending):
+    """Apply {user id: last_activity} with one UPDATE per chunk."""
+    items = list(pending.items())
+    for start in range(0, len(items), UPDATE_CHUNK):
+        chunk = items[start:start + UPDATE_CHUNK]
+        CustomUser.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+            last_activity=Case(
+                *[When(pk=pk, then=Value(seen)) for pk, seen in chunk],
+                default=F('last_activity'),
+                output_field=DateTimeField(),
+            )
+        )
+
+
+class ActivityTracker:
+    def __init__(self, interval=INTERVAL, flush_seconds=FLUSH_SECONDS, clock=time.monotonic, background=False):
+        """``background``: flush from a daemon thread and at exit, see ``start``."""
+        self.interval = interval
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self.background = background
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._flushed_at = clock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def touch(self, user, now=None):
+        now = now or timezone.now()
+        last = user.last_activity
+        if last is not None and (now - last).total_seconds() < self.interval:
+            return False
+        with self._lock:
+            self.pending[user.pk] = now
+        if self.background and self._thread is None:
+            self.start()
+        # Keep the in-memory user consistent for the rest of the request
+        user.last_activity = now
+        return True
+
+    def take_pending(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self._flushed_at = self.clock()
+        return pending
+
+    def flush(self, force=False):
+        """Write queued activity when due (or ``force``); returns users written."""
+        if not self.pending:
+            return 0
+        if not force and self.clock() - self._flushed_at < self.flush_seconds:
+            return 0
+        pending = self.take_pending()
+        try:
+            write_last_activity(pending)
+        except Exception:
+            logger.exception('Could not write last_activity for %d users', len(pending))
+            return 0
+        return len(pending)
+
+    # ---------------------------
+    # Background flushing
+    # ---------------------------
+    def start(self):
+        """Flush from a daemon thread every ``flush_seconds``, and once at exit."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_seconds):
+            self.flush()
+            # The thread holds its own connection; don't keep it past its age
+            close_old_connections()
+
+    def stop(self):
+        self._stopped.set()
+        self.flush(force=True)
+
+
+activity_tracker = ActivityTracker(background=True)
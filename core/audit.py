@@ -0,0 +1,219 @@
+"""
+Buffered audit log writer.
+
+Model signals build ``AuditLog`` instances but never INSERT them one by
+one. An entry joins the in-process buffer once the transaction that made
+the change commits (a rolled-back change is never audited), and the
+buffer is written with a single ``bulk_create`` at the end of every
+request (``AuditMiddleware``), or earlier once it holds
+``AUDIT_BUFFER_SIZE`` entries.
+
+Model changes are only audited inside a request, so nothing waits in the
+buffer past the response. A request touching hundreds of rows pays one
+INSERT statement; write failures are logged and never reach the request.
+
+Which models and fields are audited is declared in ``AUDIT_MODELS``;
+everything else (telemetry, caches, the audit log itself) never is.
+"""
+import copy
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = getattr(settings, 'AUDIT_BUFFER_SIZE', 500)
+INSERT_CHUNK_SIZE = 500
+
+_DEFERRED = object()
+
+# '<app_label>.<Model>': the fields to audit - '__all__', a list of field
+# names, or {'exclude': [...]}. Models not listed are never audited, and
+# bookkeeping fields in NEVER_AUDITED never are.
+DEFAULT_AUDIT_MODELS = {
+    'core.Organization': '__all__',
+    'core.CustomUser': [
+        'email', 'first_name', 'last_name', 'organization', 'role',
+        'is_active', 'is_staff', 'is_superuser', 'phone', 'department',
+        'job_title', 'email_verified', 'phone_verified', 'two_factor_enabled',
+    ],
+    'assets.AssetType': '__all__',
+    'assets.Asset': '__all__',
+    'assets.AssetMetric': '__all__',
+    'assets.AssetRelationship': '__all__',
+    'iot.Device': {'exclude': ['connection_status', 'last_seen']},
+    'iot.Sensor': '__all__',
+    'iot.Alert': [
+        'severity', 'acknowledged', 'acknowledged_by', 'acknowledged_at',
+        'resolved', 'resolved_by', 'resolved_at',
+    ],
+    'analytics.KPI': '__all__',
+    'analytics.Report': ['name', 'report_type', 'format', 'parameters', 'status'],
+    'cybersecurity.ZeroTrustPolicy': '__all__',
+    'cybersecurity.ThreatDetectionRule': {
+        'exclude': ['detection_count', 'false_positive_count', 'last_triggered'],
+    },
+    'cybersecurity.AttackCampaign': '__all__',
+    'simulation.SimulationScenario': '__all__',
+    'simulation.DigitalTwin': {'exclude': ['current_state', 'historical_states', 'sync_status']},
+    'simulation.PredictiveModel': '__all__',
+}
+AUDIT_MODELS = getattr(settings, 'AUDIT_MODELS', DEFAULT_AUDIT_MODELS)
+NEVER_AUDITED = {'updated_at'}
+
+# model class -> tuple of audited fields, or None
+_audited_fields = {}
+_json = DjangoJSONEncoder()
+
+
+# ============================
+# CONFIGURATION
+# ============================
+def audited_fields(model):
+    """Concrete fields of ``model`` to audit, or None when it is not audited."""
+    try:
+        return _audited_fields[model]
+    except KeyError:
+        pass
+
+    config = AUDIT_MODELS.get(model._meta.concrete_model._meta.label)
+    fields = None
+    if config is not None:
+        concrete = [f for f in model._meta.concrete_fields if f.name not in NEVER_AUDITED]
+        if config == '__all__':
+            fields = tuple(concrete)
+        elif isinstance(config, dict):
+            excluded = set(config.get('exclude', ()))
+            fields = tuple(f for f in concrete if f.name not in excluded)
+        else:
+            wanted = set(config)
+            fields = tuple(f for f in concrete if f.name in wanted)
+    _audited_fields[model] = fields
+    return fields
+
+
+def serialize_value(field, value):
+    # JSON-ready; foreign keys by raw id, so no related rows are fetched
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    if field.is_relation:
+        return str(value)
+    try:
+        return _json.default(value)
+    except TypeError:
+        return str(value)
+
+
+def snapshot(instance, fields):
+    return {f.name: serialize_value(f, f.value_from_object(instance)) for f in fields}
+
+
+def stored_values(instance, fields):
+    """
+    {attname: value} of the just written ``fields`` of ``instance``,
+    normalized and copied so later in-place changes do not leak into it.
+    Deferred fields are left out rather than fetched.
+    """
+    values = {}
+    for field in fields:
+        if field.attname not in instance.__dict__:
+            continue
+        value = instance.__dict__[field.attname]
+        if value is not None:
+            try:
+                value = field.to_python(value)
+            except ValidationError:
+                pass
+        values[field.attname] = copy.deepcopy(value) if isinstance(value, (list, dict)) else value
+    return values
+
+
+def loaded_values(instance, fields):
+    """
+    {attname: value} references to the loaded ``fields`` of ``instance``,
+    taken for every audited instance a request loads, so nothing is
+    copied: list/dict values (which may be changed in place) are left out
+    and read back from the database if the instance is ever saved.
+    """
+    values = {}
+    for field in fields:
+        value = instance.__dict__.get(field.attname, _DEFERRED)
+        if value is not _DEFERRED and not isinstance(value, (list, dict)):
+            values[field.attname] = value
+    return values
+
+
+def diff(fields, before, instance):
+    """
+    (before_state, after_state) holding only the fields whose value
+    changed; ``before`` maps attnames to stored values.
+    """
+    old, new = {}, {}
+    for field in fields:
+        previous = before[field.attname]
+        current = field.value_from_object(instance)
+        if current is not None:
+            # In-memory values may not be normalized yet (datetime in a DateField)
+            try:
+                current = field.to_python(current)
+            except ValidationError:
+                pass
+        if previous != current:
+            old[field.name] = serialize_value(field, previous)
+            new[field.name] = serialize_value(field, current)
+    return old, new
+
+
+# ============================
+# BUFFER
+# ============================
+class AuditBuffer:
+    def __init__(self, max_size=BUFFER_SIZE):
+        self.max_size = max_size
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+            full = len(self._entries) >= self.max_size
+        if full:
+            self.flush()
+
+    def take(self):
+        with self._lock:
+            entries, self._entries = self._entries, []
+        return entries
+
+    def flush(self):
+        """Write everything buffered; returns the number of entries written."""
+        entries = self.take()
+        if not entries:
+            return 0
+        try:
+            AuditLog.objects.bulk_create(entries, batch_size=INSERT_CHUNK_SIZE)
+        except Exception:
+            logger.exception('Could not write %d audit log entries', len(entries))
+            return 0
+        return len(entries)
+
+
+audit_buffer = AuditBuffer()
+
+
+def record(entry):
+    """Queue an unsaved AuditLog for the next flush once the change commits."""
+    transaction.on_commit(lambda: audit_buffer.add(entry))
+
+
+def flush():
+    return audit_buffer.flush()
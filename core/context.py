@@ -0,0 +1,44 @@
+"""
+Current-request context, safe under WSGI, ASGI and Channels.
+
+``threading.local`` is shared by every coroutine running on the event
+loop's thread, so concurrent async requests overwrote each other's
+request and audit rows were attributed to the wrong user (or nobody).
+A ``ContextVar`` is copied into each asyncio task and carried into
+``sync_to_async`` threads by asgiref, so every request - and the sync
+view code it runs - sees only its own.
+
+``AuditMiddleware`` binds the request for HTTP. Code outside the request
+cycle that acts for a user (a consumer, a task) can bind one explicitly
+with ``request_context``.
+"""
+import contextvars
+from contextlib import contextmanager
+
+_current_request = contextvars.ContextVar('current_request', default=None)
+
+
+def get_request():
+    return _current_request.get()
+
+
+def set_request(request):
+    """Bind ``request``; returns a token for ``reset_request``."""
+    return _current_request.set(request)
+
+
+def reset_request(token):
+    _current_request.reset(token)
+
+
+def clear_request():
+    _current_request.set(None)
+
+
+@contextmanager
+def request_context(request):
+    token = set_request(request)
+    try:
+        yield request
+    finally:
+        reset_request(token)
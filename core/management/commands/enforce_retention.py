@@ -0,0 +1,138 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.retention import (
+    RETENTION_TARGETS,
+    apply_retention,
+    ensure_partitions,
+    is_mysql,
+    list_partitions,
+    organization_cutoffs,
+    partitioning_statements,
+    plan_retention,
+)
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f'{size:.1f} {unit}'
+        size /= 1024.0
+
+
+class Command(BaseCommand):
+    help = (
+        'Enforce Organization.data_retention_days on high-volume tables by '
+        'dropping expired day partitions and chunk-deleting the remainder.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report rows and bytes that would be reclaimed; change nothing.',
+        )
+        parser.add_argument(
+            '--archive', action='store_true',
+            help='Exchange expired partitions into <table>_archive_<partition> instead of dropping them.',
+        )
+        parser.add_argument(
+            '--table', action='append', dest='tables',
+            help='Limit to these tables (repeatable).',
+        )
+        parser.add_argument(
+            '--ahead-days', type=int, default=7,
+            help='Daily partitions to keep created in advance.',
+        )
+        parser.add_argument(
+            '--init-partitions', action='store_true',
+            help='Convert the selected tables to daily RANGE partitions (MySQL).',
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        targets = RETENTION_TARGETS
+        if options['tables']:
+            targets = [t for t in RETENTION_TARGETS if t.table in options['tables']]
+            if not targets:
+                raise CommandError('No retention-managed table matches --table')
+
+        if options['init_partitions']:
+            return self._init_partitions(targets, options)
+
+        if is_mysql() and not options['dry_run']:
+            for target in targets:
+                if not target.partitioned:
+                    continue
+                created = ensure_partitions(target, options['ahead_days'])
+                if created:
+                    self.stdout.write(f'{target.table}: created {created} future partition(s)')
+
+        plans = plan_retention(targets=targets)
+        self._report(plans)
+
+        if options['dry_run']:
+            return
+
+        for table, partitions, deleted in apply_retention(
+            plans, archive=options['archive'], chunk_size=options['chunk_size']
+        ):
+            action = 'archived' if options['archive'] else 'dropped'
+            self.stdout.write(self.style.SUCCESS(
+                f'{table}: {action} {partitions} partition(s), deleted {deleted} row(s)'
+            ))
+
+    def _report(self, plans):
+        total_rows = total_bytes = 0
+        for plan in plans:
+            self.stdout.write(self.style.MIGRATE_HEADING(plan.target.table))
+            for partition in plan.partitions:
+                self.stdout.write(
+                    f'  partition {partition.name}: ~{partition.rows} rows, '
+                    f'{_format_bytes(partition.size_bytes)}'
+                )
+            for organization, cutoff, rows, size in plan.deletes:
+                self.stdout.write(
+                    f'  {organization.name}: {rows} rows before {cutoff:%Y-%m-%d %H:%M}, '
+                    f'~{_format_bytes(size)}'
+                )
+            if not plan.partitions and not plan.deletes:
+                self.stdout.write('  nothing to reclaim')
+            total_rows += plan.rows
+            total_bytes += plan.size_bytes
+
+        self.stdout.write(
+            f'Total: {total_rows} rows, ~{_format_bytes(total_bytes)} reclaimable'
+        )
+
+    def _init_partitions(self, targets, options):
+        if not is_mysql():
+            raise CommandError('Partitioning is only supported on MySQL')
+
+        cutoffs = organization_cutoffs()
+        oldest = min(cutoffs.values()) if cutoffs else timezone.now() - timedelta(days=90)
+
+        for target in targets:
+            if not target.partitioned:
+                self.stdout.write(f'{target.table}: not partitionable, uses chunked deletes')
+                continue
+            if list_partitions(target.table):
+                self.stdout.write(f'{target.table}: already partitioned')
+                continue
+
+            statements = partitioning_statements(
+                target, oldest.date(), ahead_days=options['ahead_days']
+            )
+            for statement in statements:
+                self.stdout.write(f'{statement[:120]}...' if len(statement) > 120 else statement)
+                if not options['dry_run']:
+                    with connection.cursor() as cursor:
+                        cursor.execute(statement)
+
+            if not options['dry_run']:
+                self.stdout.write(self.style.WARNING(
+                    f'{target.table}: foreign keys dropped for partitioning; '
+                    f'referential integrity is enforced by the ORM only.'
+                ))
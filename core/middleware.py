@@ -1,13 +1,48 @@
-from django.utils.deprecation import MiddlewareMixin
-from .threadlocals import set_request, clear_request
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 
+from .activity import activity_tracker
+from .audit import flush as flush_audit_log
+from .context import reset_request, set_request
 
-class AuditMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        set_request(request)
 
-    def process_response(self, request, response):
-        if request.user.is_authenticated:
-            request.user.update_last_activity()
-        clear_request()
+class AuditMiddleware:
+    """
+    Binds the request for audit signals (core.context) and, once the
+    response is ready, records user activity and flushes the audit buffer.
+    Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = set_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request(token)
+        self.finish(request)
         return response
+
+    async def __acall__(self, request):
+        token = set_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_request(token)
+        # request.user is lazy and the flushes write: run them off the event loop
+        await sync_to_async(self.finish)(request)
+        return response
+
+    def finish(self, request):
+        if request.user.is_authenticated:
+            activity_tracker.touch(request.user)
+        activity_tracker.flush()
+        flush_audit_log()
@@ -0,0 +1,33 @@
+from .principal import get_principal
+
+
+class OrgScopedQuerysetMixin:
+    """
+    Restricts a viewset's ``queryset`` to the caller's organization.
+
+    ``organization_field`` is the lookup path from the model to its
+    organization (``'asset__organization'`` for models hanging off an
+    asset); the filter is applied on the foreign-key id, so no organization
+    row is loaded. Object permissions follow the same path (see
+    ``core.permissions``). Superusers see every organization when
+    ``superuser_sees_all`` is set.
+    """
+    organization_field = 'organization'
+    superuser_sees_all = False
+
+    @property
+    def principal(self):
+        return get_principal(self.request)
+
+    def get_queryset(self):
+        return self.scope_queryset(super().get_queryset())
+
+    def scope_queryset(self, queryset):
+        principal = self.principal
+        if self.superuser_sees_all and principal.is_superuser:
+            return queryset
+        if principal.organization_id is None:
+            return queryset.none()
+        if self.organization_field == 'pk':
+            return queryset.filter(pk=principal.organization_id)
+        return queryset.filter(**{f'{self.organization_field}_id': principal.organization_id})
@@ -105,6 +105,12 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
 
+# Roles granting each capability (CustomUser properties, core.principal)
+ORG_ADMIN_ROLES = frozenset({'superadmin', 'org_admin'})
+ASSET_EDITOR_ROLES = frozenset({'superadmin', 'org_admin', 'manager', 'operator'})
+ANALYTICS_ROLES = frozenset({'superadmin', 'org_admin', 'manager', 'analyst'})
+
+
 class CustomUser(AbstractUser):
     username = None
     email = models.EmailField(_('email address'), unique=True)
@@ -173,15 +179,15 @@ class CustomUser(AbstractUser):
 
     @property
     def is_org_admin(self):
-        return self.role in ['superadmin', 'org_admin']
+        return self.role in ORG_ADMIN_ROLES
 
     @property
     def can_edit_assets(self):
-        return self.role in ['superadmin', 'org_admin', 'manager', 'operator']
+        return self.role in ASSET_EDITOR_ROLES
 
     @property
     def can_view_analytics(self):
-        return self.role in ['superadmin', 'org_admin', 'manager', 'analyst']
+        return self.role in ANALYTICS_ROLES
 
     def update_last_activity(self):
         self.last_activity = timezone.now()
@@ -1,111 +1,74 @@
 from rest_framework import permissions
 
+from .principal import get_principal
+
+
+def _owns(request, view, obj):
+    # Same organization path the view scopes its queryset with
+    return get_principal(request).owns(obj, getattr(view, 'organization_field', None))
+
 
 class IsSuperAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        return bool(
-            request.user
-            and request.user.is_authenticated
-            and request.user.is_superuser
-        )
+        return get_principal(request).is_superuser
 
     def has_object_permission(self, request, view, obj):
-        return bool(
-            request.user
-            and request.user.is_authenticated
-            and request.user.is_superuser
-        )
+        return get_principal(request).is_superuser
 
 
 class IsOrganizationAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        user = request.user
-        return bool(
-            user
-            and user.is_authenticated
-            and getattr(user, 'role', None) in ['superadmin', 'org_admin']
-        )
+        return get_principal(request).is_org_admin
 
     def has_object_permission(self, request, view, obj):
-        user = request.user
-        if not user or not user.is_authenticated:
-            return False
-
-        user_org = getattr(user, 'organization', None)
-
-        if hasattr(obj, 'organization'):
-            return obj.organization == user_org
-
-        if hasattr(obj, 'user') and obj.user:
-            return obj.user.organization == user_org
-
-        return False
+        principal = get_principal(request)
+        return principal.is_authenticated and _owns(request, view, obj)
 
 
 class CanEditAssets(permissions.BasePermission):
     def has_permission(self, request, view):
-        user = request.user
+        principal = get_principal(request)
 
-        if not user or not user.is_authenticated:
+        if not principal.is_authenticated:
             return False
 
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        return bool(getattr(user, 'can_edit_assets', False))
+        return principal.can_edit_assets
 
     def has_object_permission(self, request, view, obj):
-        user = request.user
+        principal = get_principal(request)
 
-        if not user or not user.is_authenticated:
+        if not principal.is_authenticated:
             return False
 
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        obj_org = getattr(obj, 'organization', None)
-        user_org = getattr(user, 'organization', None)
-
-        return bool(
-            getattr(user, 'can_edit_assets', False)
-            and obj_org == user_org
-        )
+        return principal.can_edit_assets and _owns(request, view, obj)
 
 
 class CanViewAnalytics(permissions.BasePermission):
     def has_permission(self, request, view):
-        user = request.user
-        return bool(
-            user
-            and user.is_authenticated
-            and getattr(user, 'can_view_analytics', False)
-        )
+        return get_principal(request).can_view_analytics
 
     def has_object_permission(self, request, view, obj):
-        user = request.user
-        if not user or not user.is_authenticated:
-            return False
-
-        obj_org = getattr(obj, 'organization', None)
-        user_org = getattr(user, 'organization', None)
-
-        return bool(
-            getattr(user, 'can_view_analytics', False)
-            and obj_org == user_org
-        )
+        principal = get_principal(request)
+        return principal.can_view_analytics and _owns(request, view, obj)
 
 
 class IsObjectOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        user = request.user
+        principal = get_principal(request)
 
-        if not user or not user.is_authenticated:
+        if not principal.is_authenticated:
             return False
 
-        if hasattr(obj, 'user'):
-            return obj.user == user
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == principal.user_id
 
-        if hasattr(obj, 'created_by'):
-            return obj.created_by == user
+        if hasattr(obj, 'created_by_id'):
+            return obj.created_by_id == principal.user_id
 
         return False
@@ -0,0 +1,77 @@
+"""
+The caller of a request, resolved once.
+
+Permission classes and org-scoped querysets used to re-read
+``request.user.organization`` (a lazy related-object load) and re-test
+role lists on every check. ``get_principal`` builds a ``Principal`` with
+the organization id, role and capability flags the first time it is
+asked for during a request and caches it on the request; object checks
+compare foreign-key ids only, so they never load related objects.
+"""
+from .models import ANALYTICS_ROLES, ASSET_EDITOR_ROLES, ORG_ADMIN_ROLES, Organization
+
+
+class Principal:
+    __slots__ = (
+        'user_id', 'organization_id', 'role', 'is_authenticated', 'is_superuser',
+        'is_org_admin', 'can_edit_assets', 'can_view_analytics',
+    )
+
+    def __init__(self, user):
+        authenticated = bool(user and user.is_authenticated)
+        role = getattr(user, 'role', None) if authenticated else None
+
+        self.user_id = user.pk if authenticated else None
+        self.organization_id = getattr(user, 'organization_id', None) if authenticated else None
+        self.role = role
+        self.is_authenticated = authenticated
+        self.is_superuser = authenticated and bool(user.is_superuser)
+        self.is_org_admin = role in ORG_ADMIN_ROLES
+        self.can_edit_assets = role in ASSET_EDITOR_ROLES
+        self.can_view_analytics = role in ANALYTICS_ROLES
+
+    def __repr__(self):
+        return f'<Principal user={self.user_id} org={self.organization_id} role={self.role}>'
+
+    def owns(self, obj, organization_field=None):
+        """True when ``obj`` belongs to the principal's organization."""
+        return (
+            self.organization_id is not None
+            and object_organization_id(obj, organization_field) == self.organization_id
+        )
+
+
+def get_principal(request):
+    """The request's Principal, built on first use and cached on the request."""
+    user = getattr(request, 'user', None)
+    # DRF wraps the HttpRequest; cache on the underlying one so both share it
+    base = getattr(request, '_request', request)
+    principal = getattr(base, '_principal', None)
+    if principal is None or principal.user_id != getattr(user, 'pk', None):
+        principal = Principal(user)
+        base._principal = principal
+    return principal
+
+
+def object_organization_id(obj, organization_field=None):
+    """
+    Organization id of ``obj`` from its foreign-key ids. ``organization_field``
+    is a lookup path such as ``'device__asset__organization'``; intermediate
+    objects are expected to be select_related by the queryset.
+    """
+    if isinstance(obj, Organization):
+        return obj.pk
+
+    *related, last = (organization_field or 'organization').split('__')
+    target = obj
+    for name in related:
+        target = getattr(target, name, None)
+        if target is None:
+            return None
+    attname = f'{last}_id'
+    if hasattr(target, attname):
+        return getattr(target, attname)
+
+    # Objects owned by a user rather than an organization
+    user = getattr(obj, 'user', None)
+    return getattr(user, 'organization_id', None)
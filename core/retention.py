@@ -0,0 +1,389 @@
+"""
+Data retention driven by ``Organization.data_retention_days``.
+
+High-volume tables are RANGE-partitioned by day on MySQL. A partition is
+dropped (or exchanged into an archive table) once the policy of every
+organization with rows in it has expired it, which is a metadata-only
+operation; organizations with unlimited retention (no
+``data_retention_days``) keep every partition they have rows in. Rows that are
+expired for an organization with a shorter policy but still live in a
+kept partition are removed with small primary-key DELETE chunks, so no
+statement ever holds long table locks.
+
+On other backends, or before a table has been partitioned, everything
+goes through the chunked path. The compact store and the telemetry
+archive (epoch-millisecond and per-day chunk timestamps) are never
+partitioned and always take the chunked path.
+"""
+import logging
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Organization
+
+logger = logging.getLogger(__name__)
+
+DELETE_CHUNK_SIZE = 5000
+FUTURE_PARTITION = 'pfuture'
+
+# MySQL TO_DAYS() of a date is its proleptic ordinal shifted by one year
+TO_DAYS_OFFSET = 365
+
+
+def to_days(day):
+    return day.toordinal() + TO_DAYS_OFFSET
+
+
+def from_days(days):
+    return date.fromordinal(days - TO_DAYS_OFFSET)
+
+
+def day_start(days):
+    """Midnight UTC of a TO_DAYS() value, as a partition bound timestamp."""
+    return datetime.combine(from_days(days), time.min, tzinfo=dt_timezone.utc)
+
+
+class RetentionTarget:
+    # timestamp_type: 'datetime', 'epoch_ms' (BigIntegerField) or 'date'
+    def __init__(self, model_label, timestamp_field, organization_field, timestamp_type='datetime'):
+        self.model_label = model_label
+        self.timestamp_field = timestamp_field
+        self.organization_field = organization_field
+        self.timestamp_type = timestamp_type
+
+    @property
+    def partitioned(self):
+        """Whether the table may be day-partitioned (TO_DAYS of a datetime)."""
+        return self.timestamp_type == 'datetime'
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def timestamp_column(self):
+        return self.model._meta.get_field(self.timestamp_field).column
+
+    def bound(self, moment):
+        """An aware datetime as a value of the timestamp field."""
+        if self.timestamp_type == 'epoch_ms':
+            return int(moment.timestamp() * 1000)
+        if self.timestamp_type == 'date':
+            # A chunk holds a whole day: expired once the day is before the cutoff's
+            return moment.astimezone(dt_timezone.utc).date()
+        return moment
+
+    def expired_rows(self, organization_id, cutoff):
+        return self.model.objects.filter(**{
+            self.organization_field: organization_id,
+            f'{self.timestamp_field}__lt': self.bound(cutoff),
+        })
+
+    def rows_between(self, organization_ids, start, end):
+        """Rows of ``organization_ids`` in [start, end); ``start`` may be None."""
+        filters = {
+            f'{self.organization_field}__in': organization_ids,
+            f'{self.timestamp_field}__lt': end,
+        }
+        if start is not None:
+            filters[f'{self.timestamp_field}__gte'] = start
+        return self.model.objects.filter(**filters)
+
+
+RETENTION_TARGETS = [
+    RetentionTarget('iot.TelemetryData', 'timestamp', 'asset__organization'),
+    RetentionTarget('iot.Alert', 'created_at', 'asset__organization'),
+    RetentionTarget('core.AuditLog', 'timestamp', 'organization'),
+    RetentionTarget('simulation.Prediction', 'timestamp', 'asset__organization'),
+    RetentionTarget('iot.CompactTelemetry', 'ts', 'series__asset__organization', 'epoch_ms'),
+    RetentionTarget('iot.TelemetryChunk', 'day', 'series__asset__organization', 'date'),
+    RetentionTarget('iot.SeriesQualityDay', 'day', 'asset__organization', 'date'),
+]
+
+
+class Partition:
+    def __init__(self, name, less_than_days, rows, size_bytes):
+        self.name = name
+        self.less_than_days = less_than_days  # None for MAXVALUE
+        self.rows = rows
+        self.size_bytes = size_bytes
+
+
+class TablePlan:
+    def __init__(self, target):
+        self.target = target
+        self.partitions = []  # whole partitions to drop / archive
+        self.deletes = []  # (organization, cutoff, rows, estimated bytes)
+
+    @property
+    def rows(self):
+        return sum(p.rows for p in self.partitions) + sum(d[2] for d in self.deletes)
+
+    @property
+    def size_bytes(self):
+        return sum(p.size_bytes for p in self.partitions) + sum(d[3] for d in self.deletes)
+
+
+# -------------------------------------------------------------------
+# MySQL introspection
+# -------------------------------------------------------------------
+def is_mysql():
+    return connection.vendor == 'mysql'
+
+
+def list_partitions(table):
+    """Partitions of ``table`` ordered by bound; empty if not partitioned."""
+    if not is_mysql():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS,
+                   DATA_LENGTH + INDEX_LENGTH
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+              AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            [table],
+        )
+        partitions = []
+        for name, description, rows, size in cursor.fetchall():
+            bound = None if description == 'MAXVALUE' else int(description)
+            partitions.append(Partition(name, bound, rows or 0, size or 0))
+        return partitions
+
+
+def average_row_length(table):
+    if not is_mysql():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT AVG_ROW_LENGTH FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            """,
+            [table],
+        )
+        row = cursor.fetchone()
+        return (row[0] or 0) if row else 0
+
+
+# -------------------------------------------------------------------
+# Planning
+# -------------------------------------------------------------------
+def organization_cutoffs(now=None):
+    now = now or timezone.now()
+    return {
+        org_id: now - timedelta(days=days)
+        for org_id, days in Organization.objects.values_list('id', 'data_retention_days')
+        if days and days > 0
+    }
+
+
+def plan_retention(now=None, targets=None):
+    """
+    Work out what would be reclaimed without touching any data.
+    Row counts for partitions are InnoDB estimates; chunked deletes are
+    counted exactly and sized with the table's average row length.
+    """
+    now = now or timezone.now()
+    cutoffs = organization_cutoffs(now)
+    organizations = Organization.objects.in_bulk(list(cutoffs))
+    unlimited = list(Organization.objects.exclude(id__in=list(cutoffs)).values_list('id', flat=True))
+    plans = []
+
+    # A partition may only go once the longest policy has expired it
+    global_cutoff = min(cutoffs.values()) if cutoffs else None
+
+    for target in targets or RETENTION_TARGETS:
+        plan = TablePlan(target)
+        partitions = list_partitions(target.table) if target.partitioned else []
+
+        kept_from = None  # rows older than this are in dropped partitions
+        if global_cutoff is not None:
+            limit = to_days(global_cutoff.date())
+            lower = None
+            for partition in partitions:
+                if partition.less_than_days is None or partition.less_than_days > limit:
+                    break
+                if unlimited and target.rows_between(
+                    unlimited,
+                    day_start(lower) if lower is not None else None,
+                    day_start(partition.less_than_days),
+                ).exists():
+                    # Kept for an organization without a retention limit;
+                    # everything from here on goes through chunked deletes
+                    break
+                plan.partitions.append(partition)
+                lower = partition.less_than_days
+            if plan.partitions:
+                kept_from = plan.partitions[-1].less_than_days
+
+        row_length = average_row_length(target.table)
+        for org_id, cutoff in cutoffs.items():
+            queryset = target.expired_rows(org_id, cutoff)
+            if kept_from is not None:
+                queryset = queryset.filter(**{
+                    f'{target.timestamp_field}__gte': day_start(kept_from)
+                })
+            rows = queryset.count()
+            if rows:
+                plan.deletes.append((organizations[org_id], cutoff, rows, rows * row_length))
+
+        plans.append(plan)
+    return plans
+
+
+# -------------------------------------------------------------------
+# Applying
+# -------------------------------------------------------------------
+def _drop_partition(target, partition, archive):
+    qn = connection.ops.quote_name
+    table = qn(target.table)
+    with connection.cursor() as cursor:
+        if archive:
+            archive_table = qn(f'{target.table}_archive_{partition.name}')
+            cursor.execute(f'CREATE TABLE {archive_table} LIKE {table}')
+            cursor.execute(f'ALTER TABLE {archive_table} REMOVE PARTITIONING')
+            cursor.execute(
+                f'ALTER TABLE {table} EXCHANGE PARTITION {qn(partition.name)} '
+                f'WITH TABLE {archive_table}'
+            )
+        cursor.execute(f'ALTER TABLE {table} DROP PARTITION {qn(partition.name)}')
+
+
+def delete_in_chunks(model, queryset, chunk_size=DELETE_CHUNK_SIZE):
+    """
+    Delete the rows of ``queryset`` by primary key, ``chunk_size`` at a time.
+    Raw DELETEs: no per-row signals or cascade collection, short locks.
+    """
+    qn = connection.ops.quote_name
+    # CompositePrimaryKey (the compact store) deletes by row value
+    pk_fields = getattr(model._meta.pk, 'fields', None) or (model._meta.pk,)
+    columns = ', '.join(qn(field.column) for field in pk_fields)
+    row = '(' + ', '.join(['%s'] * len(pk_fields)) + ')' if len(pk_fields) > 1 else '%s'
+    if len(pk_fields) > 1:
+        columns = f'({columns})'
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        keys = ids if len(pk_fields) > 1 else [(pk,) for pk in ids]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {qn(model._meta.db_table)} WHERE {columns} IN '
+                f'({", ".join([row] * len(keys))})',
+                [
+                    field.get_db_prep_value(value, connection)
+                    for key in keys
+                    for field, value in zip(pk_fields, key)
+                ],
+            )
+            deleted += cursor.rowcount
+
+
+def apply_retention(plans, archive=False, chunk_size=DELETE_CHUNK_SIZE):
+    summary = []
+    for plan in plans:
+        target = plan.target
+        for partition in plan.partitions:
+            _drop_partition(target, partition, archive)
+            logger.info(
+                'Retention: %s partition %s on %s',
+                'archived' if archive else 'dropped', partition.name, target.table,
+            )
+
+        deleted = 0
+        for organization, cutoff, _rows, _size in plan.deletes:
+            deleted += delete_in_chunks(
+                target.model, target.expired_rows(organization.id, cutoff), chunk_size
+            )
+
+        summary.append((target.table, len(plan.partitions), deleted))
+    return summary
+
+
+# -------------------------------------------------------------------
+# Partition management (MySQL)
+# -------------------------------------------------------------------
+def _partition_clause(day):
+    bound = day + timedelta(days=1)
+    return f'PARTITION p{day:%Y%m%d} VALUES LESS THAN ({to_days(bound)})'
+
+
+def ensure_partitions(target, ahead_days=7, today=None):
+    """Split the MAXVALUE partition so daily partitions exist ``ahead_days`` out."""
+    partitions = list_partitions(target.table)
+    if not partitions:
+        return 0
+
+    today = today or timezone.now().date()
+    bounded = [p.less_than_days for p in partitions if p.less_than_days is not None]
+    next_day = from_days(max(bounded)) if bounded else today
+    last_day = today + timedelta(days=ahead_days)
+
+    clauses = []
+    while next_day <= last_day:
+        clauses.append(_partition_clause(next_day))
+        next_day += timedelta(days=1)
+    if not clauses:
+        return 0
+
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'ALTER TABLE {qn(target.table)} REORGANIZE PARTITION {FUTURE_PARTITION} INTO '
+            f'({", ".join(clauses)}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE)'
+        )
+    return len(clauses)
+
+
+def partitioning_statements(target, first_day, ahead_days=7, today=None):
+    """
+    DDL converting an unpartitioned table to daily RANGE partitions.
+
+    MySQL requires the partition column in the primary key and does not
+    allow foreign keys on partitioned InnoDB tables, so both are adjusted.
+    Rows older than ``first_day`` land in a single history partition.
+    """
+    qn = connection.ops.quote_name
+    table = qn(target.table)
+    pk = qn(target.model._meta.pk.column)
+    column = qn(target.timestamp_column)
+    today = today or timezone.now().date()
+
+    statements = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+            WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            """,
+            [target.table],
+        )
+        for (name,) in cursor.fetchall():
+            statements.append(f'ALTER TABLE {table} DROP FOREIGN KEY {qn(name)}')
+
+    statements.append(f'ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY ({pk}, {column})')
+
+    clauses = [f'PARTITION phistory VALUES LESS THAN ({to_days(first_day)})']
+    day = first_day
+    while day <= today + timedelta(days=ahead_days):
+        clauses.append(_partition_clause(day))
+        day += timedelta(days=1)
+    clauses.append(f'PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE')
+
+    statements.append(
+        f'ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS({column})) '
+        f'({", ".join(clauses)})'
+    )
+    return statements
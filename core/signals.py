@@ -1,10 +1,11 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import user_logged_in, user_logged_out
 from django.utils import timezone
 
+from .audit import audited_fields, diff, loaded_values, record, snapshot, stored_values
 from .models import AuditLog, CustomUser, UserSession
-from .threadlocals import get_request
+from .context import get_request
 
 
 # ============================
@@ -19,14 +20,6 @@ def get_client_ip(request):
     return request.META.get('REMOTE_ADDR')
 
 
-def serialize_instance(instance):
-    data = {}
-    for field in instance._meta.fields:
-        value = getattr(instance, field.name)
-        data[field.name] = str(value.pk) if hasattr(value, 'pk') else value
-    return data
-
-
 def get_device_type(user_agent):
     ua = (user_agent or '').lower()
     if 'mobile' in ua:
@@ -43,50 +36,107 @@ def get_device_type(user_agent):
 # ============================
 class AuditLogger:
     @staticmethod
-    def log_action(request, instance, action):
+    def log_action(request, instance, action, before_state=None, after_state=None):
         if not request or not request.user.is_authenticated:
             return
 
-        # Avoid recursive logging
-        if instance.__class__.__name__ in {'AuditLog', 'UserSession'}:
+        organization = getattr(request.user, 'organization', None)
+        if organization is None:
             return
 
-        try:
-            AuditLog.objects.create(
-                organization=getattr(request.user, 'organization', None),
-                user=request.user,
-                action=action,
-                model=instance.__class__.__name__,
-                object_id=str(instance.pk),
-                after_state=serialize_instance(instance),
-                ip_address=get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            )
-        except Exception:
-            # Never crash the request
-            pass
+        # Buffered; written in bulk at the end of the request (core.audit)
+        record(AuditLog(
+            organization=organization,
+            user=request.user,
+            action=action,
+            model=instance.__class__.__name__,
+            object_id=str(instance.pk),
+            before_state=before_state,
+            after_state=after_state,
+            ip_address=get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        ))
 
 
 # ============================
 # MODEL AUDIT SIGNALS
 # ============================
+# Only models and fields declared in core.audit.AUDIT_MODELS are audited.
+# Updates record the changed fields alone, diffed against the stored
+# values referenced when the instance was loaded (and after each save);
+# at pre_save the stored row is read only for fields that were not kept,
+# i.e. deferred or list/dict values, which load never copies.
+@receiver(post_init)
+def audit_post_init(sender, instance, **kwargs):
+    fields = audited_fields(sender)
+    if fields is None or not get_request():
+        return
+    instance._audit_stored = loaded_values(instance, fields)
+
+
+@receiver(pre_save)
+def audit_pre_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    fields = audited_fields(sender)
+    if fields is None or raw or instance._state.adding:
+        return
+    request = get_request()
+    if not request or not request.user.is_authenticated:
+        return
+
+    if update_fields is not None:
+        fields = [f for f in fields if f.name in update_fields or f.attname in update_fields]
+        if not fields:
+            # e.g. save(update_fields=['last_activity']): nothing audited changes
+            return
+
+    before = instance.__dict__.get('_audit_stored') or {}
+    missing = [f.attname for f in fields if f.attname not in before]
+    if missing:
+        row = sender._base_manager.filter(pk=instance.pk).values(*missing).first()
+        before = None if row is None else {**before, **row}
+    instance._audit_before = (fields, before)
+
+
 @receiver(post_save)
-def audit_post_save(sender, instance, created, **kwargs):
+def audit_post_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    fields = audited_fields(sender)
+    if fields is None or raw:
+        return
     request = get_request()
     if not request:
         return
 
-    action = 'CREATE' if created else 'UPDATE'
-    AuditLogger.log_action(request, instance, action)
+    audited, before = instance.__dict__.pop('_audit_before', (None, None))
+    # What was just written is the baseline for the next save
+    written = fields if update_fields is None else [
+        f for f in fields if f.name in update_fields or f.attname in update_fields
+    ]
+    instance._audit_stored = {
+        **instance.__dict__.get('_audit_stored', {}),
+        **stored_values(instance, written),
+    }
+
+    if created:
+        AuditLogger.log_action(request, instance, 'CREATE', after_state=snapshot(instance, fields))
+        return
+
+    if before is None:
+        return
+    before_state, after_state = diff(audited, before, instance)
+    if after_state:
+        AuditLogger.log_action(request, instance, 'UPDATE', before_state, after_state)
 
 
 @receiver(post_delete)
 def audit_post_delete(sender, instance, **kwargs):
+    fields = audited_fields(sender)
+    if fields is None:
+        return
     request = get_request()
     if not request:
         return
 
-    AuditLogger.log_action(request, instance, 'DELETE')
+    AuditLogger.log_action(request, instance, 'DELETE', before_state=snapshot(instance, fields))
 
 
 # ============================
@@ -1,9 +1,27 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase as DRFAPITestCase
 from rest_framework import status
+from django.utils import timezone
+from datetime import timedelta
 
-from .models import Organization
+from assets.models import AssetType
+from .activity import ActivityTracker
+from .audit import audit_buffer
+from .models import Organization, AuditLog
+from .context import clear_request, get_request, set_request
+from .middleware import AuditMiddleware
+from .permissions import IsOrganizationAdmin
+from .principal import get_principal
+from .retention import RETENTION_TARGETS, Partition, apply_retention, plan_retention, to_days
+from .views import OrganizationViewSet, UserViewSet
 
 User = get_user_model()
 
@@ -52,6 +70,274 @@ class UserModelTest(TestCase):
         self.assertEqual(self.user.full_name, 'Test User')
 
 
+class RetentionTest(TestCase):
+    def setUp(self):
+        self.short = Organization.objects.create(
+            name='Short Org', domain='short.com', slug='short',
+            contact_email='a@short.com', data_retention_days=7,
+        )
+        self.long = Organization.objects.create(
+            name='Long Org', domain='long.com', slug='long',
+            contact_email='a@long.com', data_retention_days=365,
+        )
+        for org in (self.short, self.long):
+            for age in (1, 30):
+                log = AuditLog.objects.create(
+                    organization=org, action='TEST', model='Test',
+                    object_id=str(age), ip_address='127.0.0.1',
+                )
+                AuditLog.objects.filter(pk=log.pk).update(
+                    timestamp=timezone.now() - timedelta(days=age)
+                )
+        self.targets = [t for t in RETENTION_TARGETS if t.table == 'audit_logs']
+
+    def test_dry_run_plan_counts_expired_rows_per_policy(self):
+        plan, = plan_retention(targets=self.targets)
+
+        self.assertEqual([d[0] for d in plan.deletes], [self.short])
+        self.assertEqual(plan.rows, 1)
+        self.assertEqual(AuditLog.objects.count(), 4)
+
+    def test_apply_deletes_only_expired_rows(self):
+        apply_retention(plan_retention(targets=self.targets))
+
+        self.assertEqual(AuditLog.objects.filter(organization=self.short).count(), 1)
+        self.assertEqual(AuditLog.objects.filter(organization=self.long).count(), 2)
+
+    def test_partitions_holding_unlimited_retention_rows_are_kept(self):
+        forever = Organization.objects.create(
+            name='Forever Org', domain='forever.com', slug='forever',
+            contact_email='a@forever.com', data_retention_days=0,
+        )
+        log = AuditLog.objects.create(
+            organization=forever, action='TEST', model='Test', object_id='400', ip_address='127.0.0.1',
+        )
+        AuditLog.objects.filter(pk=log.pk).update(timestamp=timezone.now() - timedelta(days=400))
+
+        today = timezone.now().date()
+        partitions = [
+            Partition('pold', to_days(today - timedelta(days=500)), 10, 100),
+            Partition('p400', to_days(today - timedelta(days=380)), 10, 100),
+            Partition('pfuture', None, 10, 100),
+        ]
+        with mock.patch('core.retention.list_partitions', return_value=partitions):
+            plan, = plan_retention(targets=self.targets)
+            self.assertEqual([p.name for p in plan.partitions], ['pold'])
+            self.assertEqual([d[0] for d in plan.deletes], [self.short])
+
+            log.delete()
+            plan, = plan_retention(targets=self.targets)
+            self.assertEqual([p.name for p in plan.partitions], ['pold', 'p400'])
+
+
+class AuditBufferTest(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Test Org', domain='testorg.com', contact_email='test@testorg.com'
+        )
+        self.user = User.objects.create_user(
+            email='audit@test.com', password='StrongPass123!', organization=self.org,
+        )
+        request = RequestFactory().post('/', HTTP_USER_AGENT='tests')
+        request.user = self.user
+        set_request(request)
+        self.addCleanup(clear_request)
+        self.addCleanup(audit_buffer.take)
+
+    def test_changes_are_written_in_one_bulk_insert_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                Organization.objects.create(
+                    name=f'Org {i}', domain=f'org{i}.com', slug=f'org{i}', contact_email=f'a@org{i}.com',
+                )
+            try:
+                with transaction.atomic():
+                    Organization.objects.create(
+                        name='Rolled back', domain='rb.com', slug='rb', contact_email='a@rb.com',
+                    )
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        self.assertEqual(AuditLog.objects.count(), 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(audit_buffer.flush(), 5)
+
+        log = AuditLog.objects.filter(action='CREATE').first()
+        self.assertEqual(log.model, 'Organization')
+        self.assertEqual(log.user_agent, 'tests')
+        self.assertIsInstance(log.after_state['created_at'], str)
+
+    def test_updates_record_only_changed_allowlisted_fields(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.org.name = 'Renamed Org'
+            self.org.save()
+            self.org.save()  # nothing changed
+            self.user.update_last_activity()  # not an audited field
+            self.user.role = 'manager'
+            self.user.last_activity = timezone.now()
+            self.user.save()
+        audit_buffer.flush()
+
+        user_log, org_log = AuditLog.objects.order_by('model')
+        self.assertEqual(org_log.before_state, {'name': 'Test Org'})
+        self.assertEqual(org_log.after_state, {'name': 'Renamed Org'})
+        self.assertEqual(user_log.after_state, {'role': 'manager'})
+        self.assertFalse(AuditLog.objects.filter(model='UserSession').exists())
+
+
+    def test_updates_diff_against_the_loaded_values_without_a_select(self):
+        org = Organization.objects.get(pk=self.org.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            org.name = 'Renamed Org'
+            with self.assertNumQueries(1):  # the UPDATE alone
+                org.save()
+            org.name = 'Renamed Again'
+            org.save()
+        audit_buffer.flush()
+
+        self.assertEqual(
+            sorted((log.before_state['name'], log.after_state['name'])
+                   for log in AuditLog.objects.filter(action='UPDATE')),
+            [('Renamed Org', 'Renamed Again'), ('Test Org', 'Renamed Org')],
+        )
+
+
+    def test_loading_copies_nothing_and_in_place_json_edits_are_diffed(self):
+        AssetType.objects.create(name='Pump', category='mechanical', specifications={'rpm': 1000})
+        audit_buffer.take()
+
+        with mock.patch('core.audit.copy.deepcopy') as deepcopy:
+            asset_type = AssetType.objects.get(name='Pump')
+        deepcopy.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            asset_type.specifications['rpm'] = 1200
+            with self.assertNumQueries(2):  # the JSON field read back, then the UPDATE
+                asset_type.save()
+        audit_buffer.flush()
+
+        log = AuditLog.objects.get(action='UPDATE')
+        self.assertEqual((log.before_state, log.after_state),
+                         ({'specifications': {'rpm': 1000}}, {'specifications': {'rpm': 1200}}))
+
+class ActivityTrackerTest(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(name='Test Org', domain='testorg.com', contact_email='test@testorg.com')
+        self.users = [
+            User.objects.create_user(email=f'poll{i}@test.com', password='StrongPass123!', organization=org)
+            for i in range(3)
+        ]
+        self.now = 0.0
+        self.tracker = ActivityTracker(interval=60, flush_seconds=10, clock=lambda: self.now)
+
+    def test_activity_is_throttled_and_written_in_bulk(self):
+        start = timezone.now()
+        for user in self.users:
+            self.assertTrue(self.tracker.touch(user, now=start))
+        # Polling again within the interval queues nothing new
+        self.assertFalse(self.tracker.touch(self.users[0], now=start + timedelta(seconds=5)))
+
+        self.assertEqual(self.tracker.flush(), 0)  # not due yet
+        self.now = 10.0
+        with self.assertNumQueries(1):
+            self.assertEqual(self.tracker.flush(), 3)
+        self.assertEqual(
+            set(User.objects.filter(pk__in=[u.pk for u in self.users]).values_list('last_activity', flat=True)),
+            {start},
+        )
+        self.assertFalse(AuditLog.objects.exists())
+
+        # A fresh request loads the stored value and stays throttled
+        user = User.objects.get(pk=self.users[0].pk)
+        self.assertFalse(self.tracker.touch(user, now=start + timedelta(seconds=30)))
+        self.assertTrue(self.tracker.touch(user, now=start + timedelta(seconds=61)))
+
+
+    def test_background_thread_flushes_without_further_requests(self):
+        tracker = ActivityTracker(interval=60, flush_seconds=10, clock=lambda: self.now, background=True)
+        written = []
+        with mock.patch('core.activity.write_last_activity', side_effect=written.append), \
+                mock.patch('core.activity.atexit.register') as register, \
+                mock.patch.object(tracker._stopped, 'wait', side_effect=[False, True]):
+            self.now = 10.0
+            tracker.touch(self.users[0])
+            tracker._thread.join(timeout=5)
+            register.assert_called_once_with(tracker.stop)
+
+            tracker.touch(self.users[1])
+            tracker.stop()
+        self.assertEqual([set(pending) for pending in written], [{self.users[0].pk}, {self.users[1].pk}])
+
+
+class RequestContextTest(TestCase):
+    def test_concurrent_async_requests_see_their_own_request(self):
+        seen = {}
+
+        async def view(request):
+            await asyncio.sleep(0)  # interleave with the other request
+            seen[request.path] = get_request()
+            return HttpResponse()
+
+        middleware = AuditMiddleware(view)
+        requests = [RequestFactory().get('/a'), RequestFactory().get('/b')]
+        for request in requests:
+            request.user = AnonymousUser()
+
+        async def serve():
+            await asyncio.gather(*(middleware(request) for request in requests))
+
+        async_to_sync(serve)()
+        self.assertIs(seen['/a'], requests[0])
+        self.assertIs(seen['/b'], requests[1])
+        self.assertIsNone(get_request())
+
+
+class PrincipalTest(TestCase):
+    def setUp(self):
+        self.org, self.other = [
+            Organization.objects.create(name=name, domain=f'{name}.com', slug=name, contact_email=f'a@{name}.com')
+            for name in ('alpha', 'beta')
+        ]
+        self.admin = User.objects.create_user(
+            email='admin@alpha.com', password='x', organization=self.org, role='org_admin',
+        )
+        self.peer = User.objects.create_user(
+            email='peer@alpha.com', password='x', organization=self.org, role='viewer',
+        )
+        self.stranger = User.objects.create_user(
+            email='stranger@beta.com', password='x', organization=self.other, role='viewer',
+        )
+
+    def request_for(self, user):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=user.pk)
+        return request
+
+    def test_principal_is_resolved_once_and_checks_objects_without_queries(self):
+        request = self.request_for(self.admin)
+        peer = User.objects.get(pk=self.peer.pk)
+        stranger = User.objects.get(pk=self.stranger.pk)
+
+        with self.assertNumQueries(0):
+            principal = get_principal(request)
+            self.assertIs(get_principal(request), principal)
+            self.assertTrue(principal.is_org_admin)
+            self.assertTrue(IsOrganizationAdmin().has_object_permission(request, None, peer))
+            self.assertFalse(IsOrganizationAdmin().has_object_permission(request, None, stranger))
+            self.assertTrue(principal.owns(self.org))
+
+    def test_viewsets_share_the_org_scoped_queryset(self):
+        view = UserViewSet(request=self.request_for(self.admin))
+        self.assertEqual(
+            set(view.get_queryset().values_list('email', flat=True)),
+            {'admin@alpha.com', 'peer@alpha.com'},
+        )
+
+        view = OrganizationViewSet(request=self.request_for(self.stranger))
+        self.assertEqual(list(view.get_queryset()), [self.other])
+
+
 # ============================
 # API TESTS
 # ============================
@@ -1,13 +1,3 @@
-import threading
-
-_thread_locals = threading.local()
-
-def set_request(request):
-    _thread_locals.request = request
-
-def get_request():
-    return getattr(_thread_locals, 'request', None)
-
-def clear_request():
-    if hasattr(_thread_locals, 'request'):
-        del _thread_locals.request
+# Deprecated: the current request lives in a ContextVar now (core.context),
+# which is also correct under ASGI. Kept for existing imports.
+from .context import clear_request, get_request, set_request  # noqa: F401
@@ -13,6 +13,7 @@ from .serializers import (
     PasswordChangeSerializer,
     ProfileUpdateSerializer
 )
+from .mixins import OrgScopedQuerysetMixin
 from .permissions import IsOrganizationAdmin, IsSuperAdmin
 
 import logging
@@ -23,16 +24,13 @@ logger = logging.getLogger(__name__)
 # ============================
 # ORGANIZATION
 # ============================
-class OrganizationViewSet(viewsets.ModelViewSet):
+class OrganizationViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = OrganizationSerializer
     permission_classes = [IsAuthenticated, IsSuperAdmin]
     lookup_field = 'slug'
-
-    def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser:
-            return Organization.objects.all()
-        return Organization.objects.filter(pk=user.organization_id)
+    queryset = Organization.objects.all()
+    organization_field = 'pk'
+    superuser_sees_all = True
 
     @action(detail=True, methods=['get'])
     def stats(self, request, slug=None):
@@ -78,21 +76,17 @@ class OrganizationViewSet(viewsets.ModelViewSet):
 # ============================
 # USERS
 # ============================
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    queryset = CustomUser.objects.all()
+    superuser_sees_all = True
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAuthenticated(), IsOrganizationAdmin()]
         return [IsAuthenticated()]
 
-    def get_queryset(self):
-        user = self.request.user
-        if user.is_superuser:
-            return CustomUser.objects.all()
-        return CustomUser.objects.filter(organization=user.organization)
-
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['organization'] = self.request.user.organization
@@ -1,9 +1,18 @@
+import logging
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.apps import apps
+from django.utils import timezone
 
-from .models import ThreatDetectionEvent
+from .models import ThreatDetectionEvent, ThreatDetectionRule
 from core.models import AuditLog
+from iot.signals import telemetry_batch_ingested
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=ThreatDetectionEvent)
@@ -61,3 +70,96 @@ def threat_detection_handler(sender, instance, created, **kwargs):
         ip_address='0.0.0.0',
         user_agent='system',
     )
+
+
+# ============================
+# THREAT RULES ON TELEMETRY
+# ============================
+RULE_OPERATORS = {
+    'gt': np.greater,
+    'gte': np.greater_equal,
+    'lt': np.less,
+    'lte': np.less_equal,
+    'eq': np.equal,
+    'ne': np.not_equal,
+}
+
+
+def evaluate_threat_rules(asset_ids, metrics, values, timestamps):
+    """
+    Match active threshold rules against one telemetry batch.
+
+    ``detection_logic``: ``{"metric": .., "operator": "gt"|"gte"|"lt"|"lte"|"eq"|"ne",
+    "threshold": .., "asset": <optional asset id>}``. One event per
+    (rule, asset) per batch, for the first matching point.
+    """
+    Asset = apps.get_model('assets', 'Asset')
+    unique_assets = set(asset_ids)
+    organizations = dict(
+        Asset.objects.filter(id__in=unique_assets).values_list('id', 'organization_id')
+    )
+    rules = [
+        rule for rule in ThreatDetectionRule.objects.filter(
+            is_active=True, organization_id__in=set(organizations.values())
+        )
+        if isinstance(rule.detection_logic, dict)
+        and rule.detection_logic.get('operator') in RULE_OPERATORS
+        and rule.detection_logic.get('metric') in metrics
+    ]
+    if not rules:
+        return []
+
+    metrics = np.asarray(metrics, dtype=object)
+    assets = np.asarray([str(asset_id) for asset_id in asset_ids], dtype=object)
+    owners = np.asarray([str(organizations.get(asset_id)) for asset_id in asset_ids], dtype=object)
+
+    events = []
+    for rule in rules:
+        logic = rule.detection_logic
+        try:
+            threshold = float(logic.get('threshold'))
+        except (TypeError, ValueError):
+            continue
+        mask = (
+            (metrics == logic['metric'])
+            & (owners == str(rule.organization_id))
+            & RULE_OPERATORS[logic['operator']](values, threshold)
+        )
+        if logic.get('asset'):
+            mask &= assets == str(logic['asset'])
+        seen = set()
+        for index in np.flatnonzero(mask):
+            if assets[index] in seen:
+                continue
+            seen.add(assets[index])
+            events.append((rule, asset_ids[index], float(values[index]), timestamps[index]))
+    return events
+
+
+def threat_rules_batch_check(sender, asset_ids, metrics, values, timestamps, **kwargs):
+    def check():
+        # Runs after the ingest commit: a failure here must not reach the writer
+        try:
+            events = evaluate_threat_rules(asset_ids, metrics, values, timestamps)
+            now = timezone.now()
+            with transaction.atomic():
+                for rule, asset_id, value, timestamp in events:
+                    ThreatDetectionEvent.objects.create(
+                        organization_id=rule.organization_id,
+                        rule=rule,
+                        asset_id=asset_id,
+                        timestamp=timestamp,
+                        severity=rule.severity,
+                        confidence=rule.confidence,
+                        telemetry_data={'metric': rule.detection_logic['metric'], 'value': value},
+                    )
+                    ThreatDetectionRule.objects.filter(pk=rule.pk).update(
+                        detection_count=F('detection_count') + 1, last_triggered=now,
+                    )
+        except Exception:
+            logger.exception('Threat rule check failed for %d telemetry points', len(values))
+
+    transaction.on_commit(check)
+
+
+telemetry_batch_ingested.connect(threat_rules_batch_check, dispatch_uid='threat_rules_batch_check')
@@ -4,7 +4,9 @@ from django.contrib.auth import get_user_model
 
 from core.models import Organization
 from assets.models import Asset, AssetType
-from cybersecurity.models import SecurityDigitalTwin, ZeroTrustPolicy
+from cybersecurity.models import SecurityDigitalTwin, ThreatDetectionEvent, ThreatDetectionRule, ZeroTrustPolicy
+from iot.ingest import ingest_telemetry
+from unittest import mock
 
 User = get_user_model()
 
@@ -93,3 +95,56 @@ class ZeroTrustPolicyModelTest(TestCase):
             organization=self.org,
         )
         self.assertIn('ZT Policy', str(policy))
+
+
+class TelemetryThreatRuleTest(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Test Org',
+            domain='testorg.com',
+            slug='testorg',
+            contact_email='test@testorg.com',
+        )
+        self.user = User.objects.create_user(
+            email='soc@test.com',
+            password='Test@12345',
+            organization=self.org,
+        )
+        self.asset = Asset.objects.create(
+            asset_id='ASSET015',
+            name='Valve',
+            asset_type=AssetType.objects.create(name='Test Type', category='electronic'),
+            organization=self.org,
+            created_by=self.user,
+        )
+        self.rule = ThreatDetectionRule.objects.create(
+            organization=self.org,
+            name='Overpressure',
+            rule_type='signature',
+            severity='high',
+            detection_logic={'metric': 'pressure', 'operator': 'gt', 'threshold': 10},
+        )
+
+    def test_rules_run_once_per_ingested_batch(self):
+        with mock.patch('iot.signals._schedule_anomaly_check'), \
+                self.captureOnCommitCallbacks(execute=True):
+            ingest_telemetry(self.org, [
+                {'asset_id': 'ASSET015', 'metric': 'pressure', 'value': value}
+                for value in (4, 12, 15, 3)
+            ] + [{'asset_id': 'ASSET015', 'metric': 'temperature', 'value': 99}])
+
+        event = ThreatDetectionEvent.objects.get(rule=self.rule)
+        self.assertEqual(event.asset_id, self.asset.id)
+        self.assertEqual(event.telemetry_data, {'metric': 'pressure', 'value': 12.0})
+        self.rule.refresh_from_db()
+        self.assertEqual(self.rule.detection_count, 1)
+
+    def test_failed_rule_check_is_logged_not_raised(self):
+        with mock.patch('iot.signals._schedule_anomaly_check'), \
+                mock.patch.object(ThreatDetectionEvent.objects, 'create', side_effect=RuntimeError), \
+                self.assertLogs('cybersecurity.signals', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            ingest_telemetry(self.org, [{'asset_id': 'ASSET015', 'metric': 'pressure', 'value': 12}])
+
+        self.rule.refresh_from_db()
+        self.assertEqual(self.rule.detection_count, 0)
@@ -21,19 +21,16 @@ from .serializers import (
     AttackCampaignSerializer,
 )
 from core.permissions import CanViewAnalytics, IsOrganizationAdmin
+from core.mixins import OrgScopedQuerysetMixin
 
 
 # ============================
 # SECURITY DIGITAL TWIN
 # ============================
-class SecurityDigitalTwinViewSet(viewsets.ModelViewSet):
+class SecurityDigitalTwinViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = SecurityDigitalTwinSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-
-    def get_queryset(self):
-        return SecurityDigitalTwin.objects.filter(
-            organization=self.request.user.organization
-        ).select_related('asset', 'asset__asset_type')
+    queryset = SecurityDigitalTwin.objects.select_related('asset', 'asset__asset_type')
 
     @action(detail=True, methods=['post'])
     def recalculate_score(self, request, pk=None):
@@ -75,14 +72,10 @@ class SecurityDigitalTwinViewSet(viewsets.ModelViewSet):
 # ============================
 # ZERO TRUST POLICY
 # ============================
-class ZeroTrustPolicyViewSet(viewsets.ModelViewSet):
+class ZeroTrustPolicyViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = ZeroTrustPolicySerializer
     permission_classes = [IsAuthenticated, IsOrganizationAdmin]
-
-    def get_queryset(self):
-        return ZeroTrustPolicy.objects.filter(
-            organization=self.request.user.organization
-        ).select_related('organization', 'created_by').prefetch_related('assets')
+    queryset = ZeroTrustPolicy.objects.select_related('organization', 'created_by').prefetch_related('assets')
 
     @action(detail=True, methods=['get'])
     def compliance(self, request, pk=None):
@@ -106,14 +99,10 @@ class ZeroTrustPolicyViewSet(viewsets.ModelViewSet):
 # ============================
 # THREAT DETECTION RULE
 # ============================
-class ThreatDetectionRuleViewSet(viewsets.ModelViewSet):
+class ThreatDetectionRuleViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = ThreatDetectionRuleSerializer
     permission_classes = [IsAuthenticated, IsOrganizationAdmin]
-
-    def get_queryset(self):
-        return ThreatDetectionRule.objects.filter(
-            organization=self.request.user.organization
-        ).select_related('created_by')
+    queryset = ThreatDetectionRule.objects.select_related('created_by')
 
     @action(detail=True, methods=['get'])
     def effectiveness(self, request, pk=None):
@@ -135,14 +124,10 @@ class ThreatDetectionRuleViewSet(viewsets.ModelViewSet):
 # ============================
 # THREAT DETECTION EVENT
 # ============================
-class ThreatDetectionEventViewSet(viewsets.ReadOnlyModelViewSet):
+class ThreatDetectionEventViewSet(OrgScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = ThreatDetectionEventSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-
-    def get_queryset(self):
-        return ThreatDetectionEvent.objects.filter(
-            organization=self.request.user.organization
-        ).select_related('rule', 'asset')
+    queryset = ThreatDetectionEvent.objects.select_related('rule', 'asset')
 
     @action(detail=False, methods=['get'])
     def summary(self, request):
@@ -175,14 +160,10 @@ class ThreatDetectionEventViewSet(viewsets.ReadOnlyModelViewSet):
 # ============================
 # ATTACK CAMPAIGN
 # ============================
-class AttackCampaignViewSet(viewsets.ModelViewSet):
+class AttackCampaignViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = AttackCampaignSerializer
     permission_classes = [IsAuthenticated, IsOrganizationAdmin]
-
-    def get_queryset(self):
-        return AttackCampaign.objects.filter(
-            organization=self.request.user.organization
-        ).select_related('organization', 'created_by').prefetch_related('target_assets')
+    queryset = AttackCampaign.objects.select_related('organization', 'created_by').prefetch_related('target_assets')
 
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
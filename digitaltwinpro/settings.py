@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.AuditMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -145,3 +146,53 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+
+
+# IoT telemetry pipeline
+TELEMETRY_INGEST_MAX_BATCH = 10000
+TELEMETRY_INGEST_CHUNK_SIZE = 2000
+TELEMETRY_ANOMALY_STATE_TIMEOUT = 60 * 60 * 24
+TELEMETRY_ROLLUP_MIN_BUCKETS = 60
+TELEMETRY_STORAGE_MODE = 'row'  # 'row', 'dual' or 'compact'
+TELEMETRY_ARCHIVE_AFTER_DAYS = 30
+TELEMETRY_LAST_VALUE_DEPTH = 100
+TELEMETRY_LAST_VALUE_TIMEOUT = 60 * 60 * 24
+TELEMETRY_LAST_VALUE_LOCAL_TTL = 1.0  # seconds
+TELEMETRY_WS_COALESCE_MS = 100  # live fan-out window, 10-1000
+TELEMETRY_WS_SEND_QUEUE_SIZE = 256  # frames per connection
+TELEMETRY_WS_OVERFLOW_POLICY = 'drop_oldest'  # 'drop_oldest', 'latest_per_series' or 'disconnect'
+TELEMETRY_MQTT_HOST = os.environ.get('MQTT_HOST', 'localhost')
+TELEMETRY_MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
+TELEMETRY_MQTT_USERNAME = os.environ.get('MQTT_USERNAME')
+TELEMETRY_MQTT_PASSWORD = os.environ.get('MQTT_PASSWORD')
+TELEMETRY_MQTT_TOPIC_PREFIX = 'digitwin'
+TELEMETRY_MQTT_BATCH_SIZE = 500
+TELEMETRY_MQTT_FLUSH_MS = 1000
+TELEMETRY_MQTT_DEVICE_FLUSH_SECONDS = 5
+TELEMETRY_MQTT_TABLE_REFRESH_SECONDS = 5
+TELEMETRY_MODBUS_BATCH_SIZE = 1000
+TELEMETRY_MODBUS_FLUSH_MS = 1000
+TELEMETRY_MODBUS_DEVICE_FLUSH_SECONDS = 5
+TELEMETRY_MODBUS_PLAN_REFRESH_SECONDS = 60
+TELEMETRY_MODBUS_MAX_CONCURRENCY = 256
+TELEMETRY_MODBUS_MIN_INTERVAL = 0.1  # seconds
+TELEMETRY_REGISTRY_SYNC_SECONDS = 2
+TELEMETRY_HEARTBEAT_TIMEOUT_SECONDS = 120  # silence before a device is marked disconnected
+TELEMETRY_COMMAND_ACK_TIMEOUT_SECONDS = 30
+TELEMETRY_COMMAND_BATCH_SIZE = 500  # commands per adapter call
+TELEMETRY_COMMAND_BULK_MAX_DEVICES = 10000
+TELEMETRY_COMMAND_PROTOCOLS = ('mqtt',)  # protocols whose gateway delivers commands
+TELEMETRY_COMMAND_STALE_SECONDS = 3600  # pending/sent commands older than this time out
+TELEMETRY_PAGE_SIZE = 1000  # keyset page for telemetry list endpoints
+TELEMETRY_MAX_PAGE_SIZE = 10000
+TELEMETRY_EXPORT_CHUNK_SIZE = 5000  # rows per server-side cursor fetch
+TELEMETRY_RESAMPLE_BUCKETS = 1000  # default points per resampled series
+TELEMETRY_RESAMPLE_MAX_BUCKETS = 1000
+TELEMETRY_QUERY_MAX_SERIES = 200  # series per dashboard query
+TELEMETRY_QUERY_BUCKETS = 60
+TELEMETRY_QUALITY_STUCK_RUN = 10  # identical consecutive values flagged as a stuck sensor
+TELEMETRY_QUALITY_GAP_FACTOR = 3.0  # sampling periods before an interval counts as a gap
+TELEMETRY_QUALITY_WINDOW_DAYS = 7  # days of quality counters behind asset health
+AUDIT_BUFFER_SIZE = 500  # audit entries held before an early bulk flush
+USER_ACTIVITY_INTERVAL = 60  # seconds between last_activity writes per user
+USER_ACTIVITY_FLUSH_SECONDS = 10  # queued activity is written in bulk at most this often
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import TelemetryData, Alert, Device, Sensor, Command
+from .models import TelemetryData, TelemetryRollup, TelemetryRollupCoverage, Alert, Device, Sensor, Command
 
 
 @admin.register(TelemetryData)
@@ -18,6 +18,30 @@ class TelemetryDataAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(TelemetryRollup)
+class TelemetryRollupAdmin(admin.ModelAdmin):
+    list_display = ('asset', 'metric', 'resolution', 'bucket', 'count', 'min_value', 'max_value', 'last_value')
+    list_filter = ('resolution', 'metric')
+    search_fields = ('asset__name', 'metric')
+    date_hierarchy = 'bucket'
+    list_select_related = ('asset',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TelemetryRollupCoverage)
+class TelemetryRollupCoverageAdmin(admin.ModelAdmin):
+    list_display = ('asset', 'covered_from', 'updated_at')
+    list_select_related = ('asset',)
+
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
     list_display = ('title', 'asset', 'severity', 'acknowledged', 'resolved', 'created_at')
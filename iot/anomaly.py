@@ -0,0 +1,207 @@
+"""
+Streaming anomaly detection for telemetry series.
+
+Each (asset, metric) series keeps a sliding window of its last
+``HISTORY_LIMIT`` values together with Welford running mean / M2, so a new
+point is scored and absorbed in O(1) instead of re-querying history.
+Window state lives in the shared Django cache and is rebuilt from the
+database only on a cache miss.
+
+Semantics match the original per-row check: a point is anomalous when it
+deviates from the mean of the previous window (last 24h, at most
+``HISTORY_LIMIT`` points, population std) by more than
+``ANOMALY_STD_THRESHOLD`` standard deviations, once the window holds at
+least ``MIN_HISTORY_REQUIRED`` points.
+
+Batches for the same series should not be processed concurrently; the
+last writer wins on the cached window.
+"""
+import hashlib
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal, getcontext
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .compact import VALUE_QUANTUM, from_epoch_ms, reads_compact, series_for, to_epoch_ms
+from .models import CompactTelemetry, TelemetryData
+
+# Ensure high precision for Decimal calculations
+getcontext().prec = 28
+
+ANOMALY_STD_THRESHOLD = Decimal('3.0')
+HISTORY_LIMIT = 20
+MIN_HISTORY_REQUIRED = 10
+HISTORY_WINDOW = timedelta(hours=24)
+
+STATE_TIMEOUT = getattr(settings, 'TELEMETRY_ANOMALY_STATE_TIMEOUT', 60 * 60 * 24)
+CACHE_PREFIX = 'iot:anomaly'
+
+
+def series_cache_key(asset_id, metric):
+    # Metric names are free text; hash them to stay within cache key rules
+    digest = hashlib.md5(metric.encode('utf-8')).hexdigest()
+    return f'{CACHE_PREFIX}:{asset_id}:{digest}'
+
+
+class SeriesWindow:
+    """
+    Sliding window with Welford running statistics.
+    Values are kept as Decimal to match the stored precision.
+    """
+    __slots__ = ('points', 'mean', 'm2')
+
+    def __init__(self):
+        self.points = deque()  # (timestamp, value), oldest first
+        self.mean = Decimal(0)
+        self.m2 = Decimal(0)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _add(self, value):
+        n = len(self.points)
+        delta = value - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value):
+        n = len(self.points)
+        if n == 0:
+            self.mean = Decimal(0)
+            self.m2 = Decimal(0)
+            return
+        old_mean = self.mean
+        self.mean = (old_mean * (n + 1) - value) / n
+        self.m2 -= (value - old_mean) * (value - self.mean)
+        if self.m2 < 0:
+            self.m2 = Decimal(0)
+
+    def expire(self, since):
+        while self.points and self.points[0][0] < since:
+            _, value = self.points.popleft()
+            self._remove(value)
+
+    def push(self, timestamp, value):
+        if len(self.points) >= HISTORY_LIMIT:
+            _, oldest = self.points.popleft()
+            self._remove(oldest)
+        self.points.append((timestamp, value))
+        self._add(value)
+
+    def std_dev(self):
+        if not self.points:
+            return Decimal(0)
+        return (self.m2 / Decimal(len(self.points))).sqrt()
+
+    @classmethod
+    def from_history(cls, rows):
+        """Build a window from (timestamp, value) pairs, oldest first."""
+        window = cls()
+        for timestamp, value in rows:
+            window.push(timestamp, value)
+        return window
+
+
+def _load_window(asset_id, metric, before):
+    since = before - HISTORY_WINDOW
+    if reads_compact():
+        series = series_for(asset_ids=[asset_id], metric=metric)
+        points = (
+            CompactTelemetry.objects
+            .filter(series_id__in=list(series), ts__gte=to_epoch_ms(since), ts__lt=to_epoch_ms(before))
+            .order_by('-ts')
+            .values_list('ts', 'value')[:HISTORY_LIMIT]
+        )
+        rows = [
+            (from_epoch_ms(ts), Decimal(repr(value)).quantize(VALUE_QUANTUM))
+            for ts, value in points
+        ]
+    else:
+        rows = list(
+            TelemetryData.objects
+            .filter(
+                asset_id=asset_id,
+                metric=metric,
+                timestamp__gte=since,
+                timestamp__lt=before,
+            )
+            .order_by('-timestamp')
+            .values_list('timestamp', 'value')[:HISTORY_LIMIT]
+        )
+    rows.reverse()
+    return SeriesWindow.from_history(rows)
+
+
+def evaluate(window, timestamp, value):
+    """
+    Score ``value`` against the window (before absorbing it).
+    Returns the anomaly details or None.
+    """
+    window.expire(timestamp - HISTORY_WINDOW)
+
+    if len(window) < MIN_HISTORY_REQUIRED:
+        return None
+
+    std_dev = window.std_dev()
+    if std_dev == 0:
+        return None  # Avoid division by zero / meaningless anomaly
+
+    threshold = ANOMALY_STD_THRESHOLD * std_dev
+    if abs(value - window.mean) > threshold:
+        return {
+            'average': window.mean,
+            'std_dev': std_dev,
+            'threshold': threshold,
+        }
+    return None
+
+
+def score_batch(rows):
+    """
+    Run the detector over a batch of telemetry rows without saving state.
+
+    ``rows`` are dicts with id, asset_id, metric, value and timestamp.
+    Windows are fetched from the cache in one round-trip and updated in
+    timestamp order. Returns (anomalies, windows): a list of (row, anomaly)
+    pairs and the updated windows for ``save_windows``.
+    """
+    series = {}
+    for row in sorted(rows, key=lambda r: r['timestamp']):
+        series.setdefault((row['asset_id'], row['metric']), []).append(row)
+
+    keys = {key: series_cache_key(*key) for key in series}
+    cached = cache.get_many(list(keys.values()))
+
+    anomalies = []
+    updated = {}
+    for key, points in series.items():
+        window = cached.get(keys[key])
+        if window is None:
+            window = _load_window(key[0], key[1], points[0]['timestamp'])
+
+        for row in points:
+            anomaly = evaluate(window, row['timestamp'], row['value'])
+            if anomaly:
+                anomalies.append((row, anomaly))
+            window.push(row['timestamp'], row['value'])
+
+        updated[keys[key]] = window
+
+    return anomalies, updated
+
+
+def save_windows(windows):
+    """Write windows from ``score_batch`` back in one round-trip."""
+    cache.set_many(windows, timeout=STATE_TIMEOUT)
+
+
+def detect_batch(rows):
+    """
+    ``score_batch`` and save the windows straight away.
+    Returns a list of (row, anomaly) pairs.
+    """
+    anomalies, windows = score_batch(rows)
+    save_windows(windows)
+    return anomalies
@@ -0,0 +1,330 @@
+"""
+Columnar archive for cold telemetry.
+
+Telemetry older than ``TELEMETRY_ARCHIVE_AFTER_DAYS`` is compacted into one
+TelemetryChunk per series per day and removed from the hot stores.
+
+Encoding (all of it vectorised, so reads decode straight into NumPy):
+
+* timestamps: delta-of-delta int64, zlib. Regular sampling turns into a
+  run of zeros.
+* values: Gorilla-style XOR of each float64 with its predecessor, byte
+  shuffled so the zero high bytes of similar values line up, then zlib.
+  ``np.bitwise_xor.accumulate`` undoes the XOR in one pass.
+"""
+import logging
+import zlib
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from core.retention import delete_in_chunks
+from .compact import reads_compact, resolve_series, series_for, to_epoch_ms, writes_compact, writes_rows
+from .models import CompactTelemetry, TelemetryChunk, TelemetryData
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = getattr(settings, 'TELEMETRY_ARCHIVE_AFTER_DAYS', 30)
+
+
+# -------------------------------------------------------------------
+# Codecs
+# -------------------------------------------------------------------
+def encode_timestamps(ts):
+    ts = np.asarray(ts, dtype='<i8')
+    dod = np.diff(np.diff(ts, prepend=0), prepend=0)
+    return zlib.compress(dod.tobytes())
+
+
+def decode_timestamps(blob):
+    dod = np.frombuffer(zlib.decompress(bytes(blob)), dtype='<i8')
+    return np.cumsum(np.cumsum(dod))
+
+
+def encode_values(values):
+    bits = np.asarray(values, dtype='<f8').view('<u8')
+    previous = np.concatenate((np.zeros(1, dtype='<u8'), bits[:-1]))
+    xored = bits ^ previous
+    shuffled = xored.view(np.uint8).reshape(-1, 8).T
+    return zlib.compress(np.ascontiguousarray(shuffled).tobytes())
+
+
+def decode_values(blob, count):
+    shuffled = np.frombuffer(zlib.decompress(bytes(blob)), dtype=np.uint8)
+    xored = np.ascontiguousarray(shuffled.reshape(8, count).T).view('<u8').ravel()
+    return np.bitwise_xor.accumulate(xored).view('<f8')
+
+
+def build_chunk(series_id, day, ts, values):
+    order = np.argsort(ts, kind='stable')
+    ts, values = ts[order], values[order]
+    # One point per timestamp; the first written wins, as in the compact store
+    first = np.concatenate(([True], ts[1:] != ts[:-1]))
+    ts, values = ts[first], values[first]
+    return TelemetryChunk(
+        series_id=series_id,
+        day=day,
+        count=len(ts),
+        start_ts=int(ts[0]),
+        end_ts=int(ts[-1]),
+        min_value=float(values.min()),
+        max_value=float(values.max()),
+        sum=float(values.sum()),
+        timestamps=encode_timestamps(ts),
+        values=encode_values(values),
+    )
+
+
+def decode_chunk(chunk):
+    return decode_timestamps(chunk.timestamps), decode_values(chunk.values, chunk.count)
+
+
+# -------------------------------------------------------------------
+# Archiving
+# -------------------------------------------------------------------
+def _day_bounds(day):
+    start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def _hot_day_points(day):
+    """Yield ((asset_id, metric, unit), ts array, value array) per series for ``day``."""
+    start, end = _day_bounds(day)
+
+    if writes_rows():
+        day_rows = TelemetryData.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        keys = list(day_rows.order_by().values_list('asset_id', 'metric').distinct())
+        for asset_id, metric in keys:
+            rows = list(
+                day_rows.filter(asset_id=asset_id, metric=metric)
+                .order_by('timestamp')
+                .values_list('timestamp', 'value', 'unit')
+            )
+            if not rows:
+                continue
+            ts = np.fromiter((to_epoch_ms(r[0]) for r in rows), dtype='<i8', count=len(rows))
+            values = np.fromiter((float(r[1]) for r in rows), dtype='<f8', count=len(rows))
+            yield (asset_id, metric, rows[0][2]), ts, values
+        return
+
+    series = series_for()
+    start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+    for series_id, (asset_id, metric, unit) in series.items():
+        points = list(
+            CompactTelemetry.objects
+            .filter(series_id=series_id, ts__gte=start_ms, ts__lt=end_ms)
+            .order_by('ts')
+            .values_list('ts', 'value')
+        )
+        if points:
+            ts = np.array([p[0] for p in points], dtype='<i8')
+            values = np.array([p[1] for p in points], dtype='<f8')
+            yield (asset_id, metric, unit), ts, values
+
+
+def _delete_compact_range(series_id, start_ms, end_ms):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {qn(CompactTelemetry._meta.db_table)} '
+            f'WHERE {qn("series_id")} = %s AND {qn("ts")} >= %s AND {qn("ts")} < %s',
+            [series_id, start_ms, end_ms],
+        )
+
+
+def archive_day(day):
+    """
+    Compact one UTC day of hot telemetry into per-series chunks and drop
+    the hot rows. Late points for an already archived day are merged into
+    the existing chunk.
+    """
+    start, end = _day_bounds(day)
+    start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+    chunks = 0
+
+    for (asset_id, metric, unit), ts, values in _hot_day_points(day):
+        series_id = resolve_series({(asset_id, metric): unit})[(asset_id, metric)]
+
+        with transaction.atomic():
+            existing = (
+                TelemetryChunk.objects
+                .select_for_update()
+                .filter(series_id=series_id, day=day)
+                .first()
+            )
+            if existing:
+                old_ts, old_values = decode_chunk(existing)
+                ts = np.concatenate([old_ts, ts])
+                values = np.concatenate([old_values, values])
+
+            chunk = build_chunk(series_id, day, ts, values)
+            if existing:
+                chunk.pk = existing.pk
+                chunk.created_at = existing.created_at
+            chunk.save()
+
+            # Hot rows go in the same transaction, so a re-run never merges twice
+            if writes_compact():
+                _delete_compact_range(series_id, start_ms, end_ms)
+            if writes_rows():
+                delete_in_chunks(
+                    TelemetryData,
+                    TelemetryData.objects.filter(
+                        asset_id=asset_id, metric=metric,
+                        timestamp__gte=start, timestamp__lt=end,
+                    ),
+                )
+        chunks += 1
+
+    logger.info('Archived %d telemetry series for %s', chunks, day)
+    return chunks
+
+
+def _next_hot_day(start, cutoff):
+    """First UTC day in [start, cutoff) holding hot points, or None."""
+    start, cutoff = _day_bounds(start)[0], _day_bounds(cutoff)[0]
+    if writes_rows():
+        oldest = TelemetryData.objects.filter(
+            timestamp__gte=start, timestamp__lt=cutoff,
+        ).aggregate(oldest=Min('timestamp'))['oldest']
+        return oldest.astimezone(dt_timezone.utc).date() if oldest else None
+    oldest = CompactTelemetry.objects.filter(
+        ts__gte=to_epoch_ms(start), ts__lt=to_epoch_ms(cutoff),
+    ).aggregate(oldest=Min('ts'))['oldest']
+    return datetime.fromtimestamp(oldest / 1000.0, tz=dt_timezone.utc).date() if oldest is not None else None
+
+
+def archive_cold_telemetry(after_days=ARCHIVE_AFTER_DAYS):
+    """
+    Archive every whole day older than ``after_days`` that holds hot
+    points. Empty days are skipped by an index seek each, so a stray
+    ancient point costs one extra day, not one per calendar day since.
+    """
+    cutoff = (timezone.now() - timedelta(days=after_days)).date()
+    day = _next_hot_day(date.min, cutoff)
+    archived = 0
+    while day is not None:
+        archived += archive_day(day)
+        day = _next_hot_day(day + timedelta(days=1), cutoff)
+    return archived
+
+
+# -------------------------------------------------------------------
+# Reading
+# -------------------------------------------------------------------
+def archived_arrays(series_id, since, until):
+    chunks = TelemetryChunk.objects.filter(
+        series_id=series_id,
+        day__gte=since.date(),
+        day__lte=until.date(),
+    ).order_by('day')
+
+    parts_ts, parts_values = [], []
+    for chunk in chunks:
+        ts, values = decode_chunk(chunk)
+        parts_ts.append(ts)
+        parts_values.append(values)
+
+    if not parts_ts:
+        return np.empty(0, dtype='<i8'), np.empty(0, dtype='<f8')
+    return np.concatenate(parts_ts), np.concatenate(parts_values)
+
+
+def hot_arrays(asset_id, metric, series_id, since, until):
+    if reads_compact():
+        if series_id is None:
+            points = []
+        else:
+            points = list(
+                CompactTelemetry.objects
+                .filter(series_id=series_id, ts__gte=to_epoch_ms(since), ts__lt=to_epoch_ms(until))
+                .order_by('ts')
+                .values_list('ts', 'value')
+            )
+        ts = np.array([p[0] for p in points], dtype='<i8')
+        values = np.array([p[1] for p in points], dtype='<f8')
+        return ts, values
+
+    rows = list(
+        TelemetryData.objects
+        .filter(asset_id=asset_id, metric=metric, timestamp__gte=since, timestamp__lt=until)
+        .order_by('timestamp')
+        .values_list('timestamp', 'value')
+    )
+    ts = np.fromiter((to_epoch_ms(r[0]) for r in rows), dtype='<i8', count=len(rows))
+    values = np.fromiter((float(r[1]) for r in rows), dtype='<f8', count=len(rows))
+    return ts, values
+
+
+def series_arrays(asset_id, metric, since, until=None):
+    """
+    One series over [since, until) as (epoch-ms int64, float64) arrays,
+    merging archived chunks with hot rows.
+    """
+    until = until or timezone.now()
+    series = series_for(asset_ids=[asset_id], metric=metric)
+    series_id = next(iter(series), None)
+
+    parts = []
+    if series_id is not None:
+        parts.append(archived_arrays(series_id, since, until))
+    parts.append(hot_arrays(asset_id, metric, series_id, since, until))
+
+    ts = np.concatenate([p[0] for p in parts])
+    values = np.concatenate([p[1] for p in parts])
+
+    mask = (ts >= to_epoch_ms(since)) & (ts < to_epoch_ms(until))
+    ts, values = ts[mask], values[mask]
+    order = np.argsort(ts, kind='stable')
+    return ts[order], values[order]
+
+
+def archived_statistics(series, since=None, until=None):
+    """
+    count / sum / min / max / latest_ts of the archived points of ``series``
+    in [since, until). Whole chunks come from their stored summary; only
+    chunks straddling a bound are decoded.
+    """
+    since_ms = to_epoch_ms(since) if since is not None else None
+    until_ms = to_epoch_ms(until) if until is not None else None
+    chunks = TelemetryChunk.objects.filter(series_id__in=list(series))
+    whole, partial = chunks, TelemetryChunk.objects.none()
+    if since_ms is not None:
+        chunks = chunks.filter(end_ts__gte=since_ms)
+        whole = chunks.filter(start_ts__gte=since_ms)
+        partial = chunks.filter(start_ts__lt=since_ms)
+    if until_ms is not None:
+        whole = whole.filter(end_ts__lt=until_ms)
+        partial = chunks.filter(start_ts__lt=until_ms).exclude(pk__in=whole.values('pk'))
+
+    stats = whole.aggregate(
+        count=Sum('count'), sum=Sum('sum'),
+        min=Min('min_value'), max=Max('max_value'), latest_ts=Max('end_ts'),
+    )
+    stats['count'] = stats['count'] or 0
+    stats['sum'] = stats['sum'] or 0.0
+    for chunk in partial:
+        ts, values = decode_chunk(chunk)
+        mask = np.ones(ts.size, dtype=bool)
+        if since_ms is not None:
+            mask &= ts >= since_ms
+        if until_ms is not None:
+            mask &= ts < until_ms
+        ts, values = ts[mask], values[mask]
+        if not values.size:
+            continue
+        stats['count'] += int(values.size)
+        stats['sum'] += float(values.sum())
+        stats['min'] = min(v for v in (stats['min'], float(values.min())) if v is not None)
+        stats['max'] = max(v for v in (stats['max'], float(values.max())) if v is not None)
+        stats['latest_ts'] = max(v for v in (stats['latest_ts'], int(ts[-1])) if v is not None)
+    return stats
+
+
+def is_archived_range(since):
+    """True when part of a range starting at ``since`` lives in the archive."""
+    return since < timezone.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
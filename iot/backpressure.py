@@ -0,0 +1,93 @@
+"""
+Bounded outbound queues for WebSocket consumers.
+
+Consumer handlers never await the socket directly; they put frames on a
+per-connection ``SendQueue`` and a writer task drains it. When a client
+falls behind and the queue is full, ``TELEMETRY_WS_OVERFLOW_POLICY``
+decides what happens:
+
+* ``drop_oldest``       – the oldest queued frame is discarded
+* ``latest_per_series`` – a frame for a series that is already queued
+  replaces (or is merged into) the newest queued one in place; otherwise
+  the oldest frame is discarded. Below the limit every frame is queued.
+* ``disconnect``        – the connection is closed with code 4008
+"""
+import asyncio
+import itertools
+from collections import OrderedDict
+
+from django.conf import settings
+
+DROP_OLDEST = 'drop_oldest'
+LATEST_PER_SERIES = 'latest_per_series'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_OLDEST, LATEST_PER_SERIES, DISCONNECT)
+
+SEND_QUEUE_SIZE = getattr(settings, 'TELEMETRY_WS_SEND_QUEUE_SIZE', 256)
+OVERFLOW_POLICY = getattr(settings, 'TELEMETRY_WS_OVERFLOW_POLICY', DROP_OLDEST)
+
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+
+class QueueOverflow(Exception):
+    """Raised by a ``disconnect`` policy queue that is full."""
+
+
+class SendQueue:
+    def __init__(self, maxsize=SEND_QUEUE_SIZE, policy=OVERFLOW_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown overflow policy: {policy}')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.ready = asyncio.Event()
+        self._items = OrderedDict()
+        self._sequence = itertools.count()
+        self._latest = {}  # series -> key of its newest queued frame
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, text, series=None, merge=None):
+        """
+        Queue ``text``; returns ``(dropped, coalesced)`` frame counts.
+        Once the queue is full, ``latest_per_series`` coalesces a frame
+        into the newest queued frame of its series: ``merge(queued, new)``
+        combines the two, without it the new frame replaces the old.
+        """
+        full = len(self._items) >= self.maxsize
+        if full and self.policy == LATEST_PER_SERIES and series is not None:
+            queued = self._latest.get(series)
+            if queued is not None:
+                self._items[queued] = merge(self._items[queued], text) if merge else text
+                return 0, 1
+
+        dropped = 0
+        if full:
+            if self.policy == DISCONNECT:
+                raise QueueOverflow()
+            self._forget(*self._items.popitem(last=False))
+            dropped = 1
+
+        key = (next(self._sequence), series)
+        self._items[key] = text
+        if series is not None:
+            self._latest[series] = key
+        self.ready.set()
+        return dropped, 0
+
+    def _forget(self, key, text):
+        series = key[1]
+        if series is not None and self._latest.get(series) == key:
+            del self._latest[series]
+        return text
+
+    def pop(self):
+        if not self._items:
+            self.ready.clear()
+            return None
+        return self._forget(*self._items.popitem(last=False))
+
+    def clear(self):
+        self._items.clear()
+        self._latest.clear()
+        self.ready.clear()
@@ -0,0 +1,288 @@
+"""
+Device command dispatch.
+
+The API only records commands (``status='pending'``) and, once the
+transaction commits, hands their ids to the gateway that owns the device's
+protocol over the channel layer (``iot.commands.<protocol>``). Gateways
+run a ``CommandDispatcher``:
+
+* commands queue per device and leave in ``issued_at`` order, one in
+  flight per device, so a device never sees them reordered;
+* the heads of all idle devices go to the protocol adapter in one batch;
+* acknowledgements mark commands ``executed``/``failed``; a timing wheel
+  marks the silent ones ``timeout`` – the ``commands`` table is never polled;
+* status changes are written in bulk on every pass of the loop.
+
+Pending commands are also picked up when a gateway starts, so nothing is
+lost while it is down or when no channel layer is configured. Only
+protocols with a gateway adapter (``TELEMETRY_COMMAND_PROTOCOLS``) accept
+commands, and ``expire_stale_commands`` (a periodic task) times out
+commands still pending or sent after ``TELEMETRY_COMMAND_STALE_SECONDS``.
+"""
+import asyncio
+import logging
+from collections import defaultdict, deque, namedtuple
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Command
+from .wheel import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+ACK_TIMEOUT = getattr(settings, 'TELEMETRY_COMMAND_ACK_TIMEOUT_SECONDS', 30)
+BATCH_SIZE = getattr(settings, 'TELEMETRY_COMMAND_BATCH_SIZE', 500)
+BULK_MAX_DEVICES = getattr(settings, 'TELEMETRY_COMMAND_BULK_MAX_DEVICES', 10000)
+STALE_AFTER = getattr(settings, 'TELEMETRY_COMMAND_STALE_SECONDS', 60 * 60)
+# Protocols whose gateway runs a CommandDispatcher
+COMMAND_PROTOCOLS = tuple(getattr(settings, 'TELEMETRY_COMMAND_PROTOCOLS', ('mqtt',)))
+MESSAGE_CHUNK = 1000  # command ids per channel-layer message
+
+PendingCommand = namedtuple('PendingCommand', ['id', 'device_id', 'command_type', 'payload'])
+
+
+def command_channel(protocol):
+    return f'iot.commands.{protocol}'
+
+
+def dispatch_commands(commands):
+    """Notify gateways of new pending commands; [(command id, protocol)]."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        # Gateways pick pending commands up when they start
+        return
+    by_protocol = defaultdict(list)
+    for command_id, protocol in commands:
+        by_protocol[protocol].append(str(command_id))
+    for protocol, ids in by_protocol.items():
+        for start in range(0, len(ids), MESSAGE_CHUNK):
+            try:
+                async_to_sync(channel_layer.send)(command_channel(protocol), {
+                    'type': 'command.dispatch',
+                    'ids': ids[start:start + MESSAGE_CHUNK],
+                })
+            except Exception:
+                logger.exception('Command dispatch to %s gateways failed', protocol)
+
+
+def issue_commands(devices, command_type, payload=None, issued_by=None, metadata=None):
+    """
+    Record one pending command per device ([(device id, protocol)]) and
+    dispatch them once the transaction commits.
+    """
+    commands = Command.objects.bulk_create(
+        [
+            Command(
+                device_id=device_id,
+                command_type=command_type,
+                payload=payload or {},
+                issued_by=issued_by,
+                metadata=metadata or {},
+            )
+            for device_id, _protocol in devices
+        ],
+        batch_size=1000,
+    )
+    dispatched = [
+        (command.id, protocol) for command, (_device_id, protocol) in zip(commands, devices)
+    ]
+    transaction.on_commit(lambda: dispatch_commands(dispatched))
+    return commands
+
+
+def expire_stale_commands(stale_after=STALE_AFTER):
+    """
+    Time out commands still pending or sent ``stale_after`` seconds after
+    they were issued, e.g. while their gateway is down. Returns the count.
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return Command.objects.filter(
+        status__in=('pending', 'sent'), issued_at__lt=cutoff,
+    ).update(status='timeout')
+
+
+class CommandDispatcher:
+    def __init__(self, protocol, adapter, ack_timeout=ACK_TIMEOUT, batch_size=BATCH_SIZE,
+                 wheel=None, tick=1.0):
+        """``adapter``: async callable taking [PendingCommand], returning {id: error}."""
+        self.protocol = protocol
+        self.adapter = adapter
+        self.ack_timeout = ack_timeout
+        self.batch_size = batch_size
+        self.tick = tick
+        if wheel is None:
+            wheel = TimingWheel(tick=tick, slots=max(int(ack_timeout / tick) * 2, 64))
+        self.wheel = wheel
+
+        self.queues = defaultdict(deque)  # device id -> PendingCommand FIFO
+        self.in_flight = {}               # device id -> command id
+        self.devices = {}                 # in-flight command id -> device id
+        self.known = set()                # queued or in-flight command ids
+        self.sent = []                    # ids delivered since the last write
+        self.results = {}                 # command id -> (status, response, received_at)
+        self.stats = dict.fromkeys(
+            ('queued', 'sent', 'executed', 'failed', 'timeout', 'late_acks'), 0
+        )
+        self._wake = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    # ---------------------------
+    # Queueing
+    # ---------------------------
+    def load(self, command_ids=None):
+        commands = Command.objects.filter(status='pending', device__protocol=self.protocol)
+        if command_ids is not None:
+            commands = commands.filter(id__in=command_ids)
+        return [
+            PendingCommand(*row) for row in commands.order_by('issued_at').values_list(
+                'id', 'device_id', 'command_type', 'payload'
+            )
+        ]
+
+    def enqueue(self, commands):
+        for command in commands:
+            if command.id in self.known:
+                continue
+            self.known.add(command.id)
+            self.queues[command.device_id].append(command)
+            self.stats['queued'] += 1
+        self._wake.set()
+
+    # ---------------------------
+    # Delivery and completion
+    # ---------------------------
+    def _ready(self):
+        batch = []
+        for device_id in list(self.queues):
+            if len(batch) >= self.batch_size:
+                break
+            if device_id in self.in_flight:
+                continue
+            queue = self.queues[device_id]
+            batch.append(queue.popleft())
+            if not queue:
+                del self.queues[device_id]
+            self.in_flight[device_id] = batch[-1].id
+            self.devices[batch[-1].id] = device_id
+        return batch
+
+    async def deliver(self):
+        batch = self._ready()
+        if not batch:
+            return
+        if len(batch) == self.batch_size:
+            # More idle devices may be waiting; don't sit out a tick
+            self._wake.set()
+        try:
+            errors = await self.adapter(batch)
+        except Exception:
+            logger.exception('%s command adapter failed; retrying %d commands', self.protocol, len(batch))
+            for command in reversed(batch):
+                self._release(command.id)
+                self.queues[command.device_id].appendleft(command)
+            return
+        for command in batch:
+            error = errors.get(command.id)
+            if error:
+                self._finish(command.id, 'failed', {'error': error})
+            else:
+                self.sent.append(command.id)
+                self.stats['sent'] += 1
+                self.wheel.schedule(command.id, self.ack_timeout)
+
+    def _release(self, command_id):
+        device_id = self.devices.pop(command_id, None)
+        if device_id is not None and self.in_flight.get(device_id) == command_id:
+            del self.in_flight[device_id]
+
+    def _finish(self, command_id, status, response=None, received_at=None):
+        self.wheel.cancel(command_id)
+        self._release(command_id)
+        self.known.discard(command_id)
+        self.results[command_id] = (status, response, received_at)
+        self.stats[status] += 1
+        # The device's next command can go out
+        self._wake.set()
+
+    def acknowledge(self, command_id, ok=True, response=None):
+        """Record a device's reply; False if the command is not awaiting one."""
+        if command_id not in self.devices:
+            self.stats['late_acks'] += 1
+            return False
+        self._finish(command_id, 'executed' if ok else 'failed', response, timezone.now())
+        return True
+
+    def expire(self):
+        for command_id in self.wheel.advance():
+            self._finish(command_id, 'timeout')
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def _write(self, sent, results):
+        if sent:
+            Command.objects.filter(id__in=sent, status='pending').update(status='sent')
+        if results:
+            Command.objects.bulk_update(
+                [
+                    Command(id=command_id, status=status, response=response, response_received_at=at)
+                    for command_id, (status, response, at) in results.items()
+                ],
+                ['status', 'response', 'response_received_at'],
+                batch_size=1000,
+            )
+
+    async def flush(self):
+        async with self._lock:
+            sent, self.sent = self.sent, []
+            results, self.results = self.results, {}
+            if not sent and not results:
+                return
+            try:
+                await sync_to_async(self._write)(sent, results)
+            except Exception:
+                logger.exception('Writing %d command updates failed', len(sent) + len(results))
+                # Keep them for the next flush; newer results win
+                self.sent = sent + self.sent
+                self.results = {**results, **self.results}
+
+    # ---------------------------
+    # Loop
+    # ---------------------------
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    async def _listen(self, channel_layer):
+        while True:
+            message = await channel_layer.receive(command_channel(self.protocol))
+            try:
+                self.enqueue(await sync_to_async(self.load)(message.get('ids') or []))
+            except Exception:
+                logger.exception('Loading dispatched commands failed')
+
+    async def run(self):
+        self.enqueue(await sync_to_async(self.load)())
+        channel_layer = get_channel_layer()
+        listener = asyncio.ensure_future(self._listen(channel_layer)) if channel_layer else None
+        try:
+            while not self._stopped.is_set():
+                self._wake.clear()
+                self.expire()
+                await self.deliver()
+                await self.flush()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.tick)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if listener is not None:
+                listener.cancel()
+            await self.flush()
+        return self.stats
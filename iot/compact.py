@@ -0,0 +1,276 @@
+"""
+Compact telemetry store.
+
+``TELEMETRY_STORAGE_MODE`` selects where ingest writes points:
+
+* ``row``     – TelemetryData only (default)
+* ``dual``    – both stores, reads stay on TelemetryData (migration phase)
+* ``compact`` – CompactTelemetry only, reads served through
+  ``CompactTelemetryRecord`` so the existing serializers keep working
+
+A compact row is series id (int32) + epoch-ms timestamp (int64) + float64
+value + float64 quality, against a UUID key, asset FK, metric/unit text,
+Decimal value and JSON metadata per TelemetryData row.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q
+
+from assets.models import Asset
+from .models import CompactTelemetry, TelemetrySeries
+
+STORAGE_MODE = getattr(settings, 'TELEMETRY_STORAGE_MODE', 'row')
+INSERT_CHUNK_SIZE = getattr(settings, 'TELEMETRY_INGEST_CHUNK_SIZE', 2000)
+
+VALUE_QUANTUM = Decimal('0.000001')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# (asset_id, metric) -> series id; series are never renumbered, deleted
+# series are dropped through ``forget_series`` (post_delete, iot.signals)
+_series_ids = {}
+
+
+def writes_rows():
+    return STORAGE_MODE in ('row', 'dual')
+
+
+def writes_compact():
+    return STORAGE_MODE in ('compact', 'dual')
+
+
+def reads_compact():
+    return STORAGE_MODE == 'compact'
+
+
+def to_epoch_ms(timestamp):
+    return int(timestamp.timestamp() * 1000)
+
+
+def from_epoch_ms(ts):
+    return datetime.fromtimestamp(ts / 1000.0, tz=dt_timezone.utc)
+
+
+def epoch_us(timestamp):
+    """Exact epoch microseconds (``to_epoch_ms`` goes through a float)."""
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def compact_id(series_id, ts):
+    return f'{series_id}:{ts}'
+
+
+# -------------------------------------------------------------------
+# Series resolution
+# -------------------------------------------------------------------
+def resolve_series(units):
+    """
+    Map {(asset_id, metric): unit} to series ids, creating missing series.
+    Costs nothing for known series and two queries for a batch of new ones.
+    Ids read inside a transaction are cached only once it commits, so a
+    rolled-back series is never handed out again.
+    """
+    resolved = {key: _series_ids[key] for key in units if key in _series_ids}
+    missing = [key for key in units if key not in resolved]
+    if missing:
+        def load():
+            asset_ids = {asset_id for asset_id, _ in missing}
+            metrics = {metric for _, metric in missing}
+            for pk, asset_id, metric in TelemetrySeries.objects.filter(
+                asset_id__in=asset_ids, metric__in=metrics
+            ).values_list('id', 'asset_id', 'metric'):
+                if (asset_id, metric) in units:
+                    found[(asset_id, metric)] = pk
+
+        found = {}
+        load()
+        new = [key for key in missing if key not in found]
+        if new:
+            TelemetrySeries.objects.bulk_create(
+                [TelemetrySeries(asset_id=a, metric=m, unit=units[(a, m)]) for a, m in new],
+                ignore_conflicts=True,
+            )
+            load()
+
+        resolved.update(found)
+        transaction.on_commit(lambda: _series_ids.update(found))
+
+    return {key: resolved[key] for key in units}
+
+
+def forget_series(asset_id, metric):
+    _series_ids.pop((asset_id, metric), None)
+
+
+def series_for(asset_ids=None, metric=None, organization=None):
+    queryset = TelemetrySeries.objects.all()
+    if organization is not None:
+        queryset = queryset.filter(asset__organization=organization)
+    if asset_ids is not None:
+        queryset = queryset.filter(asset_id__in=asset_ids)
+    if metric:
+        queryset = queryset.filter(metric=metric)
+    return {pk: (asset_id, m, unit) for pk, asset_id, m, unit in queryset.values_list(
+        'id', 'asset_id', 'metric', 'unit'
+    )}
+
+
+# -------------------------------------------------------------------
+# Writing
+# -------------------------------------------------------------------
+def _stored_points(points):
+    """(series_id, ts) pairs of ``points`` already in the compact table."""
+    if not points:
+        return set()
+    stamps = [point.ts for point in points]
+    return set(CompactTelemetry.objects.filter(
+        series_id__in={point.series_id for point in points},
+        ts__gte=min(stamps),
+        ts__lte=max(stamps),
+    ).values_list('series_id', 'ts'))
+
+
+def write_compact(rows):
+    """
+    Store TelemetryData-shaped rows in the compact table.
+    Duplicate (series, timestamp) points keep the first value written: a
+    row whose point is already stored, or repeated earlier in the batch,
+    is skipped. Returns ``(written, ids)``, the rows actually stored and
+    their compact ids, in row order.
+    """
+    series = resolve_series({(row.asset_id, row.metric): row.unit for row in rows})
+
+    points = [
+        CompactTelemetry(
+            series_id=series[(row.asset_id, row.metric)],
+            ts=to_epoch_ms(row.timestamp),
+            value=float(row.value),
+            quality_score=row.quality_score,
+        )
+        for row in rows
+    ]
+    # The insert below ignores conflicts without saying which, so
+    # duplicates are found up front (a concurrent writer can still win
+    # the race; its point is kept and ours is dropped).
+    seen = _stored_points(points)
+    written, ids, fresh = [], [], []
+    for row, point in zip(rows, points):
+        key = (point.series_id, point.ts)
+        if key in seen:
+            continue
+        seen.add(key)
+        written.append(row)
+        ids.append(compact_id(*key))
+        fresh.append(point)
+
+    CompactTelemetry.objects.bulk_create(
+        fresh, batch_size=INSERT_CHUNK_SIZE, ignore_conflicts=True
+    )
+    return written, ids
+
+
+# -------------------------------------------------------------------
+# Reading
+# -------------------------------------------------------------------
+class CompactTelemetryRecord:
+    """
+    Read adapter exposing the TelemetryData attributes that
+    TelemetryDataSerializer and the templates use.
+    """
+    __slots__ = ('series_id', 'ts', 'asset_id', 'metric', 'unit', '_value', 'quality_score', '_asset')
+
+    metadata = {}
+
+    def __init__(self, series_id, ts, value, quality_score, asset_id, metric, unit):
+        self.series_id = series_id
+        self.ts = ts
+        self._value = value
+        self.quality_score = quality_score
+        self.asset_id = asset_id
+        self.metric = metric
+        self.unit = unit
+        self._asset = None
+
+    @property
+    def id(self):
+        return compact_id(self.series_id, self.ts)
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def value(self):
+        return Decimal(repr(self._value)).quantize(VALUE_QUANTUM)
+
+    @property
+    def timestamp(self):
+        return from_epoch_ms(self.ts)
+
+    @property
+    def asset(self):
+        if self._asset is None:
+            self._asset = Asset.objects.get(pk=self.asset_id)
+        return self._asset
+
+    def serializable_value(self, field_name):
+        # DRF's pk-only optimisation for the ``asset`` relation
+        if field_name == 'asset':
+            return self.asset_id
+        return getattr(self, field_name)
+
+
+def compact_position(timestamp, pk, descending=False):
+    """
+    Compact rows strictly after a cursor position. Compact points sort
+    before TelemetryData rows at the same timestamp (see iot.history).
+    """
+    if isinstance(pk, str):
+        series_id, ts = map(int, pk.split(':'))
+        if descending:
+            return Q(ts__lt=ts) | Q(ts=ts, series_id__lt=series_id)
+        return Q(ts__gt=ts) | Q(ts=ts, series_id__gt=series_id)
+    ms = epoch_us(timestamp) // 1000
+    return Q(ts__lte=ms) if descending else Q(ts__gt=ms)
+
+
+def compact_points(series, since=None, until=None, descending=False, limit=None, after=None):
+    """
+    Points for the given ``series`` map (see ``series_for``) as adapters,
+    ordered by (ts, series), strictly after the ``after`` cursor position.
+    """
+    queryset = CompactTelemetry.objects.filter(series_id__in=list(series))
+    if since is not None:
+        queryset = queryset.filter(ts__gte=to_epoch_ms(since))
+    if until is not None:
+        queryset = queryset.filter(ts__lt=to_epoch_ms(until))
+    if after is not None:
+        queryset = queryset.filter(compact_position(*after, descending=descending))
+
+    queryset = queryset.order_by(*(('-ts', '-series_id') if descending else ('ts', 'series_id')))
+    rows = queryset.values_list('series_id', 'ts', 'value', 'quality_score')
+    if limit is not None:
+        rows = rows[:limit]
+
+    return [
+        CompactTelemetryRecord(series_id, ts, value, quality, *series[series_id])
+        for series_id, ts, value, quality in rows
+    ]
+
+
+def compact_statistics(series, since, until=None):
+    queryset = CompactTelemetry.objects.filter(series_id__in=list(series), ts__gte=to_epoch_ms(since))
+    if until is not None:
+        queryset = queryset.filter(ts__lt=to_epoch_ms(until))
+    stats = queryset.aggregate(
+        count=Count('ts'),
+        avg_value=Avg('value'),
+        max_value=Max('value'),
+        min_value=Min('value'),
+        latest_ts=Max('ts'),
+    )
+    latest_ts = stats.pop('latest_ts')
+    stats['latest_timestamp'] = from_epoch_ms(latest_ts) if latest_ts is not None else None
+    return stats
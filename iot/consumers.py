@@ -1,5 +1,9 @@
+import asyncio
 import json
 import logging
+import time
+import uuid
+from collections import deque
 from typing import Set
 
 from channels.generic.websocket import AsyncWebsocketConsumer
@@ -7,37 +11,115 @@ from channels.db import database_sync_to_async
 from django.utils import timezone
 
 from assets.models import Asset
+from . import metrics
+from .backpressure import (
+    OVERFLOW_POLICY,
+    SEND_QUEUE_SIZE,
+    SLOW_CONSUMER_CLOSE_CODE,
+    QueueOverflow,
+    SendQueue,
+)
+from .fanout import COALESCE_MS, asset_group, batch_frame, merge_frames
 
 logger = logging.getLogger(__name__)
 
 MAX_ASSET_SUBSCRIPTIONS = 20  # Prevent abuse
+MAX_PENDING_FRAMES = 100  # per rate-limited asset; oldest frames are dropped
+
+
+def _normalize_asset_id(asset_id):
+    # Group names are built from the canonical UUID form used by iot.fanout
+    try:
+        return str(uuid.UUID(str(asset_id)))
+    except ValueError:
+        return asset_id
 
 
 # -------------------------------------------------------------------
 # Base Consumer with shared security logic
 # -------------------------------------------------------------------
 class BaseOrgConsumer(AsyncWebsocketConsumer):
+    # Outbound backpressure; subclasses may override the settings defaults
+    send_queue_size = SEND_QUEUE_SIZE
+    overflow_policy = OVERFLOW_POLICY
+
     async def connect(self):
         self.user = self.scope.get('user')
+        self.closed = True
+        self.asset_subscriptions: Set[str] = set()
+        self.outbox = None
+        self._writer = None
 
         if not self.user or not self.user.is_authenticated:
             await self.close(code=4001)
             return
 
-        if not hasattr(self.user, 'organization') or not self.user.organization:
+        # organization_id avoids a lazy FK load from async code
+        if not getattr(self.user, 'organization_id', None):
             await self.close(code=4002)
             return
 
-        self.organization_id = str(self.user.organization.id)
-        self.asset_subscriptions: Set[str] = set()
+        self.organization_id = str(self.user.organization_id)
+        self.closed = False
+
+        self.outbox = SendQueue(self.send_queue_size, self.overflow_policy)
+        metrics.register_queue(self.metrics_name, self.outbox)
 
         await self.accept()
+        self._writer = asyncio.ensure_future(self._drain_outbox())
 
     async def disconnect(self, close_code):
+        self._stop_outbox()
+
         # Cleanup all asset subscriptions
         for asset_id in list(self.asset_subscriptions):
             await self._unsubscribe_asset(asset_id)
 
+    # ---------------------------
+    # Outbound queue
+    # ---------------------------
+    @property
+    def metrics_name(self):
+        return type(self).__name__
+
+    def _stop_outbox(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        if self.outbox is not None:
+            metrics.unregister_queue(self.metrics_name, self.outbox)
+            self.outbox.clear()
+            self.outbox = None
+
+    async def queue_send(self, text, series=None, merge=None):
+        """Queue a text frame; never waits for the client."""
+        if self.outbox is None:
+            return
+        try:
+            dropped, coalesced = self.outbox.put(text, series, merge)
+        except QueueOverflow:
+            metrics.incr(self.metrics_name, 'slow_disconnects')
+            logger.warning('Closing slow %s connection', self.metrics_name)
+            self._stop_outbox()
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+            return
+
+        if dropped:
+            metrics.incr(self.metrics_name, 'frames_dropped', dropped)
+        if coalesced:
+            metrics.incr(self.metrics_name, 'frames_coalesced', coalesced)
+
+    async def _drain_outbox(self):
+        outbox = self.outbox
+        while True:
+            await outbox.ready.wait()
+            text = outbox.pop()
+            if text is None:
+                continue
+            await self.send(text_data=text)
+            metrics.incr(self.metrics_name, 'frames_sent')
+            await metrics.maybe_publish()
+
     # ---------------------------
     # Security helpers
     # ---------------------------
@@ -63,8 +145,7 @@ class BaseOrgConsumer(AsyncWebsocketConsumer):
             })
             return
 
-        group_name = f'asset_{asset_id}'
-        await self.channel_layer.group_add(group_name, self.channel_name)
+        await self.channel_layer.group_add(asset_group(asset_id), self.channel_name)
         self.asset_subscriptions.add(asset_id)
 
         await self.send_json({
@@ -73,19 +154,33 @@ class BaseOrgConsumer(AsyncWebsocketConsumer):
         })
 
     async def _unsubscribe_asset(self, asset_id: str):
-        group_name = f'asset_{asset_id}'
-        await self.channel_layer.group_discard(group_name, self.channel_name)
+        await self.channel_layer.group_discard(asset_group(asset_id), self.channel_name)
         self.asset_subscriptions.discard(asset_id)
 
     async def send_json(self, data: dict):
-        await self.send(text_data=json.dumps(data))
+        await self.queue_send(json.dumps(data))
 
 
 # -------------------------------------------------------------------
 # Telemetry Consumer
 # -------------------------------------------------------------------
 class TelemetryConsumer(BaseOrgConsumer):
+    """
+    Live telemetry per subscribed asset.
+
+    Frames arrive pre-encoded from ``iot.fanout`` and are forwarded as is.
+    A client may cap the update rate per asset with ``max_rate`` (updates
+    per second) in ``subscribe_asset``; frames arriving faster are held and
+    delivered together as one ``telemetry_batch`` frame.
+    """
+
     async def connect(self):
+        # asset_id -> min seconds between sends, last send, pending frames, flush task
+        self.min_intervals = {}
+        self.last_sent = {}
+        self.pending_frames = {}
+        self.flush_tasks = {}
+
         await super().connect()
         if self.closed:
             return
@@ -100,7 +195,10 @@ class TelemetryConsumer(BaseOrgConsumer):
         })
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.org_group, self.channel_name)
+        for task in self.flush_tasks.values():
+            task.cancel()
+        if not self.closed:
+            await self.channel_layer.group_discard(self.org_group, self.channel_name)
         await super().disconnect(close_code)
 
     async def receive(self, text_data):
@@ -109,10 +207,14 @@ class TelemetryConsumer(BaseOrgConsumer):
             msg_type = payload.get('type')
 
             if msg_type == 'subscribe_asset':
-                await self._subscribe_asset(payload.get('asset_id'))
+                asset_id = _normalize_asset_id(payload.get('asset_id'))
+                self._set_max_rate(asset_id, payload.get('max_rate'))
+                await self._subscribe_asset(asset_id)
 
             elif msg_type == 'unsubscribe_asset':
-                await self._unsubscribe_asset(payload.get('asset_id'))
+                asset_id = _normalize_asset_id(payload.get('asset_id'))
+                await self._unsubscribe_asset(asset_id)
+                self._set_max_rate(asset_id, None)
 
             elif msg_type == 'ping':
                 await self.send_json({
@@ -129,11 +231,52 @@ class TelemetryConsumer(BaseOrgConsumer):
         except Exception:
             logger.exception('Telemetry WS error')
 
+    # ---------------------------
+    # Rate limiting
+    # ---------------------------
+    def _set_max_rate(self, asset_id, max_rate):
+        try:
+            max_rate = float(max_rate) if max_rate is not None else 0.0
+        except (TypeError, ValueError):
+            max_rate = 0.0
+
+        # Faster than the fan-out window would never hold anything back
+        if max_rate <= 0 or max_rate >= 1000.0 / COALESCE_MS:
+            self.min_intervals.pop(asset_id, None)
+        else:
+            self.min_intervals[asset_id] = 1.0 / max_rate
+
     async def asset_telemetry(self, event):
-        await self.send_json({
-            'type': 'telemetry',
-            'data': event.get('data')
-        })
+        text = event['text']
+        asset_id = event.get('asset_id')
+        interval = self.min_intervals.get(asset_id)
+        if interval is None:
+            return await self.queue_send(text, series=asset_id, merge=merge_frames)
+
+        pending = self.pending_frames.setdefault(asset_id, deque(maxlen=MAX_PENDING_FRAMES))
+        if len(pending) == pending.maxlen:
+            metrics.incr(self.metrics_name, 'frames_dropped')
+        pending.append(text)
+        if asset_id in self.flush_tasks:
+            return
+
+        delay = self.last_sent.get(asset_id, 0.0) + interval - time.monotonic()
+        if delay <= 0:
+            return await self._flush_frames(asset_id)
+        self.flush_tasks[asset_id] = asyncio.ensure_future(self._flush_later(asset_id, delay))
+
+    async def _flush_later(self, asset_id, delay):
+        await asyncio.sleep(delay)
+        self.flush_tasks.pop(asset_id, None)
+        await self._flush_frames(asset_id)
+
+    async def _flush_frames(self, asset_id):
+        frames = self.pending_frames.pop(asset_id, None)
+        if not frames:
+            return
+        self.last_sent[asset_id] = time.monotonic()
+        text = frames[0] if len(frames) == 1 else batch_frame(asset_id, frames)
+        await self.queue_send(text, series=asset_id, merge=merge_frames)
 
 
 # -------------------------------------------------------------------
@@ -154,7 +297,8 @@ class AlertConsumer(BaseOrgConsumer):
         })
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.org_group, self.channel_name)
+        if not self.closed:
+            await self.channel_layer.group_discard(self.org_group, self.channel_name)
         await super().disconnect(close_code)
 
     async def alert_event(self, event):
@@ -182,11 +326,14 @@ class AssetConsumer(BaseOrgConsumer):
         })
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.org_group, self.channel_name)
+        if not self.closed:
+            await self.channel_layer.group_discard(self.org_group, self.channel_name)
         await super().disconnect(close_code)
 
     async def asset_status(self, event):
-        await self.send_json({
-            'type': 'asset_status',
-            'data': event.get('data')
-        })
+        data = event.get('data') or {}
+        # Only the newest status per asset (or device) matters to a client that is behind
+        await self.queue_send(
+            json.dumps({'type': 'asset_status', 'data': data}),
+            series=data.get('device_id') or data.get('asset_id'),
+        )
@@ -0,0 +1,124 @@
+"""
+Coalescing live telemetry fan-out.
+
+Ingest hands committed rows to ``publish_telemetry``. Points are buffered
+per asset for ``TELEMETRY_WS_COALESCE_MS`` and then sent to the asset's
+channel group as a single event per asset. Each frame is JSON-encoded once
+here and carried as text, so consumers forward the same string to every
+subscriber instead of calling ``json.dumps`` per socket.
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+COALESCE_MS = min(max(getattr(settings, 'TELEMETRY_WS_COALESCE_MS', 100), 10), 1000)
+
+
+def asset_group(asset_id):
+    return f'asset_{asset_id}'
+
+
+def encode_frame(asset_id, points):
+    """One ``telemetry`` frame for an asset; ``points`` are TelemetryData-shaped."""
+    return json.dumps({
+        'type': 'telemetry',
+        'asset_id': str(asset_id),
+        'data': [
+            {
+                'metric': point.metric,
+                'value': float(point.value),
+                'unit': point.unit,
+                'timestamp': point.timestamp.isoformat(),
+            }
+            for point in points
+        ],
+    }, separators=(',', ':'))
+
+
+def batch_frame(asset_id, frames):
+    """Join already encoded frames without decoding them again."""
+    return (
+        '{"type":"telemetry_batch","asset_id":%s,"frames":[%s]}'
+        % (json.dumps(str(asset_id)), ','.join(frames))
+    )
+
+
+def merge_frames(queued, new):
+    """
+    Merge two frames for one asset into a ``telemetry`` frame holding the
+    latest point per metric. Only used for clients that are behind.
+    """
+    latest = {}
+    asset_id = None
+    for text in (queued, new):
+        frame = json.loads(text)
+        asset_id = frame.get('asset_id', asset_id)
+        frames = frame['frames'] if frame.get('type') == 'telemetry_batch' else [frame]
+        for part in frames:
+            for point in part.get('data') or []:
+                current = latest.get(point['metric'])
+                if current is None or point['timestamp'] >= current['timestamp']:
+                    latest[point['metric']] = point
+    return json.dumps({
+        'type': 'telemetry',
+        'asset_id': asset_id,
+        'data': sorted(latest.values(), key=lambda p: p['timestamp']),
+    }, separators=(',', ':'))
+
+
+class TelemetryFanout:
+    """
+    Per-process buffer flushed by a timer thread, armed only while points
+    are pending. Points still buffered when the process exits are lost,
+    which is acceptable for a live view.
+    """
+
+    def __init__(self, window_ms=COALESCE_MS):
+        self.window = window_ms / 1000.0
+        self._pending = defaultdict(list)
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def add(self, rows):
+        with self._lock:
+            for row in rows:
+                self._pending[row.asset_id].append(row)
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            self._timer = None
+
+        channel_layer = get_channel_layer()
+        if channel_layer is None or not pending:
+            return
+
+        for asset_id, points in pending.items():
+            points.sort(key=lambda p: p.timestamp)
+            try:
+                async_to_sync(channel_layer.group_send)(asset_group(asset_id), {
+                    'type': 'asset.telemetry',
+                    'asset_id': str(asset_id),
+                    'text': encode_frame(asset_id, points),
+                })
+            except Exception:
+                logger.exception('Live telemetry fan-out failed for asset %s', asset_id)
+
+
+fanout = TelemetryFanout()
+
+
+def publish_telemetry(rows):
+    if rows and get_channel_layer() is not None:
+        fanout.add(rows)
@@ -0,0 +1,83 @@
+"""
+Shared write side of the protocol gateways (MQTT, Modbus).
+
+Gateways hand parsed TelemetryData rows and device sightings to a
+``TelemetryBatcher``; it writes the rows through ``write_telemetry`` in
+batches and leaves liveness to a ``HeartbeatTracker`` (``iot.heartbeat``),
+whose state it writes in bulk every ``device_flush_interval`` seconds.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+
+from .heartbeat import HeartbeatTracker, write_device_status
+from .ingest import write_telemetry
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+
+def connected_devices(protocol):
+    return list(
+        Device.objects.filter(protocol=protocol, connection_status='connected')
+        .values_list('id', flat=True)
+    )
+
+
+class TelemetryBatcher:
+    def __init__(self, batch_size, device_flush_interval, name='gateway', protocol=None,
+                 heartbeat=None):
+        self.batch_size = batch_size
+        self.device_flush_interval = device_flush_interval
+        self.name = name
+        self.protocol = protocol
+
+        self.rows = []
+        self.heartbeat = heartbeat or HeartbeatTracker()
+        self.stats = {'batches': 0, 'write_errors': 0}
+        self._lock = asyncio.Lock()
+        self._last_device_flush = time.monotonic()
+        self._watching = protocol is None
+
+    @property
+    def full(self):
+        return len(self.rows) >= self.batch_size
+
+    def add(self, rows):
+        self.rows.extend(rows)
+
+    def mark(self, device_id, status='connected', timeout=None):
+        self.heartbeat.mark(device_id, status, timeout)
+
+    def _write(self, rows, seen):
+        if rows:
+            write_telemetry(rows)
+        if seen:
+            write_device_status(seen)
+
+    async def flush(self, force=False):
+        async with self._lock:
+            if not self._watching:
+                # Devices left 'connected' by an earlier run time out like any other
+                self.heartbeat.watch(await sync_to_async(connected_devices)(self.protocol))
+                self._watching = True
+            self.heartbeat.expire()
+            await self.heartbeat.publish()
+
+            rows, self.rows = self.rows, []
+            seen = {}
+            if force or time.monotonic() - self._last_device_flush >= self.device_flush_interval:
+                seen = self.heartbeat.take_pending()
+                self._last_device_flush = time.monotonic()
+            if not rows and not seen:
+                return
+
+            try:
+                await sync_to_async(self._write)(rows, seen)
+                if rows:
+                    self.stats['batches'] += 1
+            except Exception:
+                self.stats['write_errors'] += 1
+                logger.exception('%s flush failed; dropped %d points', self.name, len(rows))
@@ -0,0 +1,130 @@
+"""
+Device liveness tracking for the protocol gateways.
+
+Every message marks its device alive in memory only. ``Device.last_seen``
+and ``connection_status`` are written in bulk once per flush interval
+with a single ``UPDATE ... CASE`` per chunk of devices. That is a
+queryset update, so ``updated_at`` is left alone. Devices that go quiet
+expire from a timing wheel and are marked ``disconnected``.
+
+Status *transitions*, not heartbeats, are pushed to the organization's
+``assets_<org>`` group as they happen, for ``AssetConsumer``.
+
+Each gateway process owns the devices of its protocol, so the tracker
+state is per process. The database is the shared view.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import Case, CharField, DateTimeField, F, Value, When
+from django.utils import timezone
+
+from .models import Device
+from .registry import registry
+from .wheel import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = getattr(settings, 'TELEMETRY_HEARTBEAT_TIMEOUT_SECONDS', 120)
+UPDATE_CHUNK = 1000
+
+
+def write_device_status(pending):
+    """Apply {device id: (status, last_seen or None)} with one UPDATE per chunk."""
+    items = list(pending.items())
+    for start in range(0, len(items), UPDATE_CHUNK):
+        chunk = items[start:start + UPDATE_CHUNK]
+        fields = {
+            'connection_status': Case(
+                *[When(id=pk, then=Value(status)) for pk, (status, _) in chunk],
+                default=F('connection_status'),
+                output_field=CharField(),
+            ),
+        }
+        seen = [When(id=pk, then=Value(last_seen)) for pk, (_, last_seen) in chunk if last_seen]
+        if seen:
+            fields['last_seen'] = Case(*seen, default=F('last_seen'), output_field=DateTimeField())
+        Device.objects.filter(id__in=[pk for pk, _ in chunk]).update(**fields)
+
+
+def status_messages(transitions):
+    """(group, message) pairs for AssetConsumer, resolved through the registry."""
+    messages = []
+    for device_pk, status, last_seen in transitions:
+        entry = registry.get(device_pk)
+        if entry is None:
+            continue
+        messages.append((f'assets_{entry.organization_id}', {
+            'type': 'asset.status',
+            'data': {
+                'asset_id': str(entry.asset_id),
+                'device_id': str(device_pk),
+                'connection_status': status,
+                'last_seen': last_seen.isoformat() if last_seen else None,
+            },
+        }))
+    return messages
+
+
+class HeartbeatTracker:
+    def __init__(self, timeout=TIMEOUT, wheel=None):
+        self.timeout = timeout
+        if wheel is None:
+            wheel = TimingWheel(tick=1.0, slots=max(int(timeout) * 2, 64))
+        self.wheel = wheel
+        self.status = {}       # device id -> last known connection status
+        self.pending = {}      # device id -> (status, last_seen) awaiting the DB
+        self.transitions = []  # (device id, status, last_seen) awaiting a push
+
+    def _set(self, device_pk, status, last_seen=None):
+        previous = self.status.get(device_pk)
+        self.status[device_pk] = status
+        if last_seen is None:
+            last_seen = self.pending.get(device_pk, (None, None))[1]
+        self.pending[device_pk] = (status, last_seen)
+        if previous != status:
+            self.transitions.append((device_pk, status, last_seen))
+
+    def beat(self, device_pk, when=None, timeout=None):
+        self.wheel.schedule(device_pk, timeout or self.timeout)
+        self._set(device_pk, 'connected', when or timezone.now())
+
+    def mark(self, device_pk, status, timeout=None):
+        if status == 'connected':
+            return self.beat(device_pk, timeout=timeout)
+        self.wheel.cancel(device_pk)
+        self._set(device_pk, status)
+
+    def watch(self, device_pks):
+        """Start timeouts for devices already connected (e.g. by a previous process)."""
+        for device_pk in device_pks:
+            if device_pk not in self.wheel:
+                self.status.setdefault(device_pk, 'connected')
+                self.wheel.schedule(device_pk, self.timeout)
+
+    def expire(self):
+        expired = self.wheel.advance()
+        for device_pk in expired:
+            self._set(device_pk, 'disconnected')
+        return expired
+
+    def take_pending(self):
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def take_transitions(self):
+        transitions, self.transitions = self.transitions, []
+        return transitions
+
+    async def publish(self):
+        transitions = self.take_transitions()
+        channel_layer = get_channel_layer()
+        if not transitions or channel_layer is None:
+            return
+        for group, message in await sync_to_async(status_messages)(transitions):
+            try:
+                await channel_layer.group_send(group, message)
+            except Exception:
+                logger.exception('Device status push to %s failed', group)
@@ -0,0 +1,234 @@
+"""
+Telemetry history across the hot store and the archive.
+
+``archive_day`` moves whole days of points out of the hot store into
+TelemetryChunk, so every read that can reach past
+``TELEMETRY_ARCHIVE_AFTER_DAYS`` goes through ``TelemetryHistory``, which
+merges both.
+
+Points come back ordered by ``(timestamp, id)``, the keyset the
+pagination and the export use. At equal timestamps archived points
+(``series:ms`` ids, ordered by series) sort before hot rows (UUID ids).
+"""
+import heapq
+from datetime import timedelta, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.db.models import Avg, Count, Max, Min
+
+from .archive import archived_statistics, decode_chunk
+from .compact import (
+    EPOCH,
+    CompactTelemetryRecord,
+    compact_points,
+    compact_statistics,
+    epoch_us,
+    from_epoch_ms,
+    reads_compact,
+    series_for,
+    to_epoch_ms,
+)
+from .models import TelemetryChunk
+from .pagination import PAGE_SIZE, keyset_position
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+def point_key(point):
+    """Sort key of a TelemetryData row or a CompactTelemetryRecord."""
+    if isinstance(point, CompactTelemetryRecord):
+        return (point.ts * 1000, 0, point.series_id)
+    return (epoch_us(point.timestamp), 1, point.pk.hex)
+
+
+def cursor_key(timestamp, pk):
+    """Sort key of a decoded cursor position (see ``point_key``)."""
+    if isinstance(pk, str):
+        series_id, ts = map(int, pk.split(':'))
+        return (ts * 1000, 0, series_id)
+    return (epoch_us(timestamp), 1, pk.hex)
+
+
+def _utc_day(moment):
+    return moment.astimezone(dt_timezone.utc).date()
+
+
+class TelemetryHistory:
+    """
+    Points of one read scope: the hot store (``rows``, a TelemetryData
+    queryset, or the compact points of ``series`` when reading the compact
+    store) and the archived chunks of ``series`` (see ``series_for``), both
+    restricted to the same assets and metric, within [since, until).
+    """
+
+    def __init__(self, rows, series, since=None, until=None):
+        self.rows = rows
+        self.series = series
+        self.since = since
+        self.until = until
+
+    @classmethod
+    def scoped(cls, rows, organization_id, asset_id=None, metric=None, since=None, until=None):
+        """History of ``rows`` (already scoped) plus the matching archived series."""
+        series = {}
+        if organization_id is not None:
+            series = series_for(
+                asset_ids=[asset_id] if asset_id else None,
+                metric=metric,
+                organization=organization_id,
+            )
+        return cls(rows, series, since, until)
+
+    # ---------------------------------------------------------------
+    # Points
+    # ---------------------------------------------------------------
+    def read(self, descending=False, after=None, limit=PAGE_SIZE):
+        """
+        Up to ``limit`` points strictly after the ``after`` cursor
+        position (``(timestamp, pk)``, see ``decode_cursor``).
+        """
+        hot = self.hot_points(descending, after, limit)
+        bound = point_key(hot[-1]) if len(hot) >= limit else None
+        archived = self.archived_points(descending, after, limit, bound)
+        return list(islice(
+            heapq.merge(archived, hot, key=point_key, reverse=descending), limit
+        ))
+
+    def hot_points(self, descending, after, limit):
+        if reads_compact():
+            return compact_points(self.series, self.since, self.until, descending, limit, after)
+
+        rows = self.rows
+        if self.since is not None:
+            rows = rows.filter(timestamp__gte=self.since)
+        if self.until is not None:
+            rows = rows.filter(timestamp__lt=self.until)
+        if after is not None:
+            rows = rows.filter(keyset_position(*after, descending=descending))
+        ordering = ('-timestamp', '-id') if descending else ('timestamp', 'id')
+        return list(rows.order_by(*ordering)[:limit])
+
+    def archived_points(self, descending, after, limit, bound=None):
+        """
+        Archived points after ``after``, decoded one day at a time until
+        ``limit`` are collected. ``bound`` is the key of the last hot point
+        of a full page: nothing past it can make the merged page.
+        """
+        if not self.series:
+            return []
+
+        chunks = TelemetryChunk.objects.filter(series_id__in=list(self.series))
+        lower = [self.since] if self.since is not None else []
+        upper = [self.until] if self.until is not None else []
+        if after is not None:
+            moment = EPOCH + cursor_key(*after)[0] * MICROSECOND
+            (upper if descending else lower).append(moment)
+        if bound is not None:
+            moment = EPOCH + bound[0] * MICROSECOND
+            (lower if descending else upper).append(moment)
+        if lower:
+            chunks = chunks.filter(day__gte=_utc_day(max(lower)))
+        if upper:
+            chunks = chunks.filter(day__lte=_utc_day(min(upper)))
+
+        days = list(
+            chunks.order_by('-day' if descending else 'day')
+            .values_list('day', flat=True).distinct()
+        )
+        points = []
+        for day in days:
+            points.extend(self._day_points(chunks.filter(day=day), descending, after))
+            if len(points) >= limit:
+                break
+        return points[:limit]
+
+    def _day_points(self, chunks, descending, after):
+        parts_ts, parts_values, parts_series = [], [], []
+        for chunk in chunks:
+            ts, values = decode_chunk(chunk)
+            parts_ts.append(ts)
+            parts_values.append(values)
+            parts_series.append(np.full(ts.size, chunk.series_id, dtype='<i8'))
+        if not parts_ts:
+            return []
+        ts = np.concatenate(parts_ts)
+        values = np.concatenate(parts_values)
+        series_ids = np.concatenate(parts_series)
+
+        mask = np.ones(ts.size, dtype=bool)
+        if self.since is not None:
+            mask &= ts >= to_epoch_ms(self.since)
+        if self.until is not None:
+            mask &= ts < to_epoch_ms(self.until)
+        if after is not None:
+            at, kind, tiebreak = cursor_key(*after)
+            us = ts * 1000
+            if descending:
+                same = (series_ids < tiebreak) if kind == 0 else np.ones(ts.size, dtype=bool)
+                mask &= (us < at) | ((us == at) & same)
+            else:
+                same = (series_ids > tiebreak) if kind == 0 else np.zeros(ts.size, dtype=bool)
+                mask &= (us > at) | ((us == at) & same)
+
+        ts, values, series_ids = ts[mask], values[mask], series_ids[mask]
+        order = np.lexsort((series_ids, ts))
+        if descending:
+            order = order[::-1]
+        return [
+            CompactTelemetryRecord(int(s), int(t), float(v), 1.0, *self.series[int(s)])
+            for t, v, s in zip(ts[order], values[order], series_ids[order])
+        ]
+
+    # ---------------------------------------------------------------
+    # Statistics
+    # ---------------------------------------------------------------
+    def hot_statistics(self):
+        if reads_compact():
+            return compact_statistics(self.series, self.since, self.until)
+
+        rows = self.rows
+        if self.since is not None:
+            rows = rows.filter(timestamp__gte=self.since)
+        if self.until is not None:
+            rows = rows.filter(timestamp__lt=self.until)
+        return rows.aggregate(
+            count=Count('id'),
+            avg_value=Avg('value'),
+            max_value=Max('value'),
+            min_value=Min('value'),
+            latest_timestamp=Max('timestamp'),
+        )
+
+    def statistics(self):
+        """count / avg / max / min / latest_timestamp over hot and archived points."""
+        stats = self.hot_statistics()
+        if not self.series:
+            return stats
+        archived = archived_statistics(self.series, self.since, self.until)
+        if not archived['count']:
+            return stats
+        return combine_statistics(stats, {
+            'count': archived['count'],
+            'avg_value': archived['sum'] / archived['count'],
+            'max_value': archived['max'],
+            'min_value': archived['min'],
+            'latest_timestamp': from_epoch_ms(archived['latest_ts']),
+        })
+
+
+def combine_statistics(first, second):
+    """``statistics``-shaped dicts of two disjoint sets of points, combined."""
+    if not second['count']:
+        return first
+    if not first['count']:
+        return second
+    count = first['count'] + second['count']
+    total = sum(float(stats['avg_value']) * stats['count'] for stats in (first, second))
+    return {
+        'count': count,
+        'avg_value': total / count,
+        'max_value': max(float(first['max_value']), float(second['max_value'])),
+        'min_value': min(float(first['min_value']), float(second['min_value'])),
+        'latest_timestamp': max(first['latest_timestamp'], second['latest_timestamp']),
+    }
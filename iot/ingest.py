@@ -0,0 +1,261 @@
+"""
+Bulk telemetry ingestion.
+
+Gateways push thousands of points per request, so this path never goes
+through ModelSerializer or per-row ``save()``: points are validated in
+plain Python, asset references are resolved with one query per batch and
+rows are scored for data quality (``iot.quality``) and written with
+``bulk_create``. Per-row post_save signals never
+fire for telemetry; rollups, the last-value cache, live fan-out, anomaly
+checks and threat rules hook into ``iot.signals.telemetry_batch_ingested``,
+which is sent once per batch.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from assets.models import Asset
+from .models import TelemetryData
+from .compact import write_compact, writes_compact, writes_rows
+from .quality import score_rows
+from .registry import AmbiguousDevice, registry
+from .signals import send_batch_ingested
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = getattr(settings, 'TELEMETRY_INGEST_MAX_BATCH', 10000)
+INSERT_CHUNK_SIZE = getattr(settings, 'TELEMETRY_INGEST_CHUNK_SIZE', 2000)
+MAX_REPORTED_ERRORS = 100
+
+VALUE_QUANTUM = Decimal('0.000001')  # TelemetryData.value has 6 decimal places
+VALUE_LIMIT = Decimal('1e8')  # max_digits=14 leaves 8 integer digits
+
+
+class TelemetryBatchError(Exception):
+    """Raised when a batch cannot be accepted at all (size, shape)."""
+
+
+class IngestResult:
+    def __init__(self, rows, errors, rejected):
+        self.rows = rows
+        self.errors = errors
+        self.rejected = rejected
+        # Accepted points the compact store already held (compact mode)
+        self.duplicates = 0
+
+    @property
+    def accepted(self):
+        return len(self.rows)
+
+    def as_dict(self):
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+        }
+
+
+# -------------------------------------------------------------------
+# Field parsing
+# -------------------------------------------------------------------
+def _parse_value(raw):
+    if isinstance(raw, bool) or raw is None:
+        raise ValueError('value must be a number')
+    try:
+        value = Decimal(str(raw))
+    except (InvalidOperation, ValueError):
+        raise ValueError('value must be a number')
+    if not value.is_finite():
+        raise ValueError('value must be finite')
+    # Check before quantizing: quantize raises InvalidOperation once the
+    # result needs more digits than the decimal context holds
+    if abs(value) >= VALUE_LIMIT:
+        raise ValueError('value out of range')
+    value = value.quantize(VALUE_QUANTUM)
+    if abs(value) >= VALUE_LIMIT:
+        raise ValueError('value out of range')
+    return value
+
+
+def _parse_timestamp(raw, now):
+    if raw in (None, ''):
+        return now
+    if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        # Epoch seconds; gateways sending milliseconds are detected by magnitude
+        seconds = raw / 1000.0 if raw > 1e11 else raw
+        try:
+            return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError('timestamp out of range')
+    if isinstance(raw, str):
+        parsed = parse_datetime(raw)
+        if parsed is not None:
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed, dt_timezone.utc)
+            return parsed
+    raise ValueError('timestamp must be ISO 8601 or epoch seconds')
+
+
+def _parse_unit(raw):
+    if not isinstance(raw, str) or len(raw) > 20:
+        raise ValueError('unit must be a string (max 20 characters)')
+    return raw
+
+
+def _resolve_sensor(organization, point):
+    """(asset pk, metric, unit) for a point addressed by ``device_id``/``sensor_id``."""
+    try:
+        resolved = registry.resolve(
+            point.get('device_id'), str(point['sensor_id']), organization_id=organization.id
+        )
+    except AmbiguousDevice:
+        raise ValueError('device_id matches several devices; use the device UUID')
+    if resolved is None:
+        raise ValueError('unknown device or sensor')
+    return resolved
+
+
+def _asset_key(point):
+    """Points reference an asset by primary key (``asset``) or code (``asset_id``)."""
+    if point.get('asset'):
+        return 'pk', str(point['asset'])
+    if point.get('asset_id'):
+        return 'code', str(point['asset_id'])
+    return None, None
+
+
+# -------------------------------------------------------------------
+# Batch building
+# -------------------------------------------------------------------
+def resolve_assets(organization, points):
+    """
+    Map every asset reference in the batch to an Asset primary key using
+    at most two queries, scoped to ``organization``.
+    """
+    pks, codes = set(), set()
+    for point in points:
+        if not isinstance(point, dict) or point.get('sensor_id') is not None:
+            continue
+        kind, key = _asset_key(point)
+        if kind == 'pk':
+            pks.add(key)
+        elif kind == 'code':
+            codes.add(key)
+
+    resolved = {}
+    if pks:
+        valid_pks = []
+        for key in pks:
+            try:
+                valid_pks.append(Asset._meta.pk.to_python(key))
+            except Exception:
+                continue
+        for pk in Asset.objects.filter(
+            organization=organization, id__in=valid_pks
+        ).values_list('id', flat=True):
+            resolved[('pk', str(pk))] = pk
+    if codes:
+        for code, pk in Asset.objects.filter(
+            organization=organization, asset_id__in=codes
+        ).values_list('asset_id', 'id'):
+            resolved[('code', code)] = pk
+    return resolved
+
+
+def build_telemetry_rows(organization, points):
+    """
+    Validate raw point dicts and turn them into unsaved TelemetryData rows.
+
+    A point names its series either by asset (``asset`` pk or ``asset_id``
+    code) plus ``metric``, or by ``device_id`` plus ``sensor_id``, which
+    are resolved through the in-process device registry.
+
+    Invalid points are skipped and reported; they never fail the batch.
+    """
+    if not isinstance(points, list):
+        raise TelemetryBatchError('Expected a list of telemetry points')
+    if len(points) > MAX_BATCH_SIZE:
+        raise TelemetryBatchError(
+            f'Batch too large: {len(points)} points (max {MAX_BATCH_SIZE})'
+        )
+
+    assets = resolve_assets(organization, points)
+    now = timezone.now()
+    rows, errors = [], []
+    rejected = 0
+
+    for index, point in enumerate(points):
+        try:
+            if not isinstance(point, dict):
+                raise ValueError('point must be an object')
+
+            if point.get('sensor_id') is not None:
+                asset_pk, metric, sensor_unit = _resolve_sensor(organization, point)
+            else:
+                asset_pk, metric, sensor_unit = assets.get(_asset_key(point)), point.get('metric'), ''
+            if asset_pk is None:
+                raise ValueError('unknown asset')
+
+            if not metric or not isinstance(metric, str) or len(metric) > 100:
+                raise ValueError('metric is required (max 100 characters)')
+
+            unit = _parse_unit(point.get('unit') or sensor_unit)
+
+            metadata = point.get('metadata') or {}
+            if not isinstance(metadata, dict):
+                raise ValueError('metadata must be an object')
+
+            rows.append(TelemetryData(
+                asset_id=asset_pk,
+                metric=metric,
+                value=_parse_value(point.get('value')),
+                unit=unit,
+                timestamp=_parse_timestamp(point.get('timestamp'), now),
+                metadata=metadata,
+            ))
+        except ValueError as exc:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'index': index, 'error': str(exc)})
+
+    return IngestResult(rows, errors, rejected)
+
+
+# -------------------------------------------------------------------
+# Writing
+# -------------------------------------------------------------------
+def write_telemetry(rows):
+    """
+    Persist already-validated TelemetryData rows in chunked bulk INSERTs,
+    to the row store, the compact store or both (TELEMETRY_STORAGE_MODE).
+    Returns the rows stored, without compact-only duplicates.
+    """
+    if not rows:
+        return rows
+
+    with transaction.atomic():
+        ids = [str(row.id) for row in rows]
+        score_rows(rows)
+        if writes_rows():
+            TelemetryData.objects.bulk_create(rows, batch_size=INSERT_CHUNK_SIZE)
+        if writes_compact():
+            written, compact_ids = write_compact(rows)
+            if not writes_rows():
+                # Points the compact store already held are not ingested again
+                rows, ids = written, compact_ids
+        send_batch_ingested(rows, ids)
+
+    logger.debug('Ingested %d telemetry points', len(rows))
+    return rows
+
+
+def ingest_telemetry(organization, points):
+    result = build_telemetry_rows(organization, points)
+    result.duplicates = len(result.rows) - len(write_telemetry(result.rows))
+    return result
@@ -0,0 +1,258 @@
+"""
+Last-value cache for the "latest telemetry" reads.
+
+Ingest writes every committed batch through to three newest-first rings
+of at most ``TELEMETRY_LAST_VALUE_DEPTH`` points:
+
+* per series (asset, metric)
+* per asset (all metrics)
+* per organization
+
+Rings live in the shared Django cache and in a small in-process copy that
+is trusted for ``TELEMETRY_LAST_VALUE_LOCAL_TTL`` seconds, so hot dashboard
+reads cost neither a database query nor a cache round-trip. A missing or
+too short ring is rebuilt from the database on read.
+
+Concurrent writers to the same ring from different processes use
+read-modify-write without locking; the last writer wins, and the next
+rebuild (or the cache timeout) repairs a ring that lost points.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from assets.models import Asset
+from .compact import series_for
+from .history import TelemetryHistory
+from .models import TelemetryData
+
+DEPTH = getattr(settings, 'TELEMETRY_LAST_VALUE_DEPTH', 100)
+CACHE_TIMEOUT = getattr(settings, 'TELEMETRY_LAST_VALUE_TIMEOUT', 60 * 60 * 24)
+LOCAL_TTL = getattr(settings, 'TELEMETRY_LAST_VALUE_LOCAL_TTL', 1.0)
+LOCAL_MAX_KEYS = 10000
+
+CACHE_PREFIX = 'iot:last'
+
+# key -> (stored_at, ring); ring is (complete, entries)
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+# Assets never change organization; asset id -> organization id
+_asset_orgs = {}
+
+
+class LastValue:
+    """
+    A cached point exposing the TelemetryData attributes that
+    TelemetryDataSerializer and the templates use.
+    """
+    __slots__ = ('id', 'asset_id', 'metric', 'timestamp', 'value', 'unit',
+                 'quality_score', 'metadata', 'asset')
+
+    def __init__(self, id, asset_id, metric, timestamp, value, unit, quality_score, metadata):
+        self.id = id
+        self.asset_id = asset_id
+        self.metric = metric
+        self.timestamp = timestamp
+        self.value = value
+        self.unit = unit
+        self.quality_score = quality_score
+        self.metadata = metadata
+        self.asset = None
+
+    @property
+    def pk(self):
+        return self.id
+
+    def serializable_value(self, field_name):
+        if field_name == 'asset':
+            return self.asset_id
+        return getattr(self, field_name)
+
+
+# -------------------------------------------------------------------
+# Keys and rings
+# -------------------------------------------------------------------
+def series_key(asset_id, metric):
+    digest = hashlib.md5(metric.encode('utf-8')).hexdigest()
+    return f'{CACHE_PREFIX}:s:{asset_id}:{digest}'
+
+
+def asset_key(asset_id):
+    return f'{CACHE_PREFIX}:a:{asset_id}'
+
+
+def organization_key(organization_id):
+    return f'{CACHE_PREFIX}:o:{organization_id}'
+
+
+def _entry(telemetry_id, asset_id, metric, timestamp, value, unit, quality_score, metadata):
+    return (str(telemetry_id), asset_id, metric, timestamp,
+            Decimal(value), unit, quality_score, metadata or {})
+
+
+def _merge(ring, entries):
+    complete, current = ring
+    seen = set()
+    merged = []
+    for entry in sorted(list(entries) + list(current), key=lambda e: e[3], reverse=True):
+        if entry[0] not in seen:
+            seen.add(entry[0])
+            merged.append(entry)
+    return complete and len(merged) <= DEPTH, tuple(merged[:DEPTH])
+
+
+def _local_get(keys):
+    found = {}
+    now = time.monotonic()
+    with _local_lock:
+        for key in keys:
+            item = _local.get(key)
+            if item and now - item[0] < LOCAL_TTL:
+                found[key] = item[1]
+    return found
+
+
+def _local_set(rings):
+    now = time.monotonic()
+    with _local_lock:
+        for key, ring in rings.items():
+            _local[key] = (now, ring)
+            _local.move_to_end(key)
+        while len(_local) > LOCAL_MAX_KEYS:
+            _local.popitem(last=False)
+
+
+def _get_rings(keys):
+    rings = _local_get(keys)
+    missing = [key for key in keys if key not in rings]
+    if missing:
+        shared = cache.get_many(missing)
+        _local_set(shared)
+        rings.update(shared)
+    return rings
+
+
+def _set_rings(rings):
+    _local_set(rings)
+    cache.set_many(rings, timeout=CACHE_TIMEOUT)
+
+
+def clear_local():
+    with _local_lock:
+        _local.clear()
+
+
+# -------------------------------------------------------------------
+# Write-through
+# -------------------------------------------------------------------
+def asset_organizations(asset_ids):
+    """Organization id per asset id (strings), one query for unseen assets."""
+    missing = [asset_id for asset_id in asset_ids if asset_id not in _asset_orgs]
+    if missing:
+        for pk, organization_id in Asset.objects.filter(id__in=missing).values_list(
+            'id', 'organization_id'
+        ):
+            _asset_orgs[str(pk)] = str(organization_id)
+    return {asset_id: _asset_orgs.get(asset_id) for asset_id in asset_ids}
+
+
+def record(rows, ids):
+    """Push committed TelemetryData-shaped rows (with their stored ids) into the rings."""
+    if not rows:
+        return
+
+    organizations = asset_organizations({str(row.asset_id) for row in rows})
+    updates = defaultdict(list)
+    for telemetry_id, row in zip(ids, rows):
+        entry = _entry(telemetry_id, row.asset_id, row.metric, row.timestamp,
+                       row.value, row.unit, row.quality_score, row.metadata)
+        updates[series_key(row.asset_id, row.metric)].append(entry)
+        updates[asset_key(row.asset_id)].append(entry)
+        organization_id = organizations.get(str(row.asset_id))
+        if organization_id:
+            updates[organization_key(organization_id)].append(entry)
+
+    # Merge against the shared copy, not a possibly stale local one
+    current = cache.get_many(list(updates))
+    _set_rings({
+        key: _merge(current.get(key, (False, ())), entries)
+        for key, entries in updates.items()
+    })
+
+
+# -------------------------------------------------------------------
+# Reading
+# -------------------------------------------------------------------
+def _load(asset_id=None, metric=None, organization_id=None):
+    """Rebuild a ring from the database (hot rows merged with the archive)."""
+    series = series_for(
+        asset_ids=[asset_id] if asset_id else None,
+        metric=metric,
+        organization=organization_id,
+    )
+    queryset = TelemetryData.objects.all()
+    if asset_id:
+        queryset = queryset.filter(asset_id=asset_id)
+    if metric:
+        queryset = queryset.filter(metric=metric)
+    if organization_id:
+        queryset = queryset.filter(asset__organization_id=organization_id)
+    points = TelemetryHistory(queryset, series).read(descending=True, limit=DEPTH)
+    entries = [
+        _entry(p.id, p.asset_id, p.metric, p.timestamp, p.value,
+               p.unit, p.quality_score, p.metadata)
+        for p in points
+    ]
+    return len(entries) < DEPTH, tuple(entries)
+
+
+def _ring(key, limit, **lookup):
+    ring = _get_rings([key]).get(key)
+    if ring is None or (not ring[0] and len(ring[1]) < limit):
+        ring = _load(**lookup)
+        _set_rings({key: ring})
+    return ring
+
+
+def _records(entries):
+    return [LastValue(*entry) for entry in entries]
+
+
+def latest_points(organization_id, asset_id=None, metric=None, limit=DEPTH):
+    """
+    Newest-first points for the organization, optionally narrowed to an
+    asset and/or metric. Returns None when the cache cannot answer (the
+    asset is unknown or foreign, or ``limit`` exceeds the ring depth) and
+    the caller should query the database instead.
+    """
+    if organization_id is None or limit > DEPTH:
+        return None
+    organization_id = str(organization_id)
+
+    if asset_id:
+        try:
+            asset_id = str(Asset._meta.pk.to_python(asset_id))
+        except Exception:
+            return None
+        if asset_organizations([asset_id])[asset_id] != organization_id:
+            return None
+        if metric:
+            key, lookup = series_key(asset_id, metric), {'asset_id': asset_id, 'metric': metric}
+        else:
+            key, lookup = asset_key(asset_id), {'asset_id': asset_id}
+        return _records(_ring(key, limit, **lookup)[1][:limit])
+
+    complete, entries = _ring(
+        organization_key(organization_id), limit, organization_id=organization_id
+    )
+    if metric:
+        entries = [entry for entry in entries if entry[2] == metric]
+        if len(entries) < limit and not complete:
+            return None
+    return _records(entries[:limit])
@@ -0,0 +1,41 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from iot.modbus import BATCH_SIZE, FLUSH_INTERVAL, MAX_CONCURRENCY, ModbusPoller
+
+
+class Command(BaseCommand):
+    help = (
+        'Poll every Modbus/TCP device from one asyncio loop and feed the '
+        'readings into the bulk ingest pipeline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--flush-ms', type=int, default=int(FLUSH_INTERVAL * 1000),
+            help='Write buffered readings at least this often.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=MAX_CONCURRENCY,
+            help='Maximum polls in flight at once.',
+        )
+
+    def handle(self, *args, **options):
+        stats = asyncio.run(self._run(options))
+        self.stdout.write(', '.join(f'{name}={value}' for name, value in stats.items()))
+
+    async def _run(self, options):
+        poller = ModbusPoller(
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_ms'] / 1000.0,
+            max_concurrency=options['concurrency'],
+        )
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, poller.stop)
+
+        self.stdout.write('Modbus poller started')
+        return await poller.run()
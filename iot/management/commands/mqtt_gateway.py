@@ -0,0 +1,55 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from iot.mqtt import AiomqttClient, MQTTGateway, TOPIC_PREFIX, BATCH_SIZE, FLUSH_INTERVAL
+
+
+class Command(BaseCommand):
+    help = (
+        'Subscribe to the MQTT broker and feed device telemetry into the '
+        'bulk ingest pipeline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=getattr(settings, 'TELEMETRY_MQTT_HOST', 'localhost'))
+        parser.add_argument('--port', type=int, default=getattr(settings, 'TELEMETRY_MQTT_PORT', 1883))
+        parser.add_argument('--username', default=getattr(settings, 'TELEMETRY_MQTT_USERNAME', None))
+        parser.add_argument('--password', default=getattr(settings, 'TELEMETRY_MQTT_PASSWORD', None))
+        parser.add_argument('--client-id', default=None)
+        parser.add_argument('--prefix', default=TOPIC_PREFIX, help='Root topic for device telemetry.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--flush-ms', type=int, default=int(FLUSH_INTERVAL * 1000),
+            help='Write buffered points at least this often.',
+        )
+
+    def handle(self, *args, **options):
+        gateway = MQTTGateway(
+            lambda: AiomqttClient(
+                options['host'],
+                options['port'],
+                username=options['username'],
+                password=options['password'],
+                client_id=options['client_id'],
+            ),
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_ms'] / 1000.0,
+        )
+        self.stdout.write(f'MQTT gateway connecting to {options["host"]}:{options["port"]}')
+        stats = asyncio.run(self._run(gateway))
+        self.stdout.write(', '.join(f'{name}={value}' for name, value in stats.items()))
+
+    async def _run(self, gateway):
+        task = asyncio.ensure_future(gateway.run())
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # run() flushed the buffer on the way out
+            return {**gateway.stats, **gateway.batcher.stats, **gateway.command_stats()}
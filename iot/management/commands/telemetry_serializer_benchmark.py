@@ -0,0 +1,63 @@
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from iot import fastjson
+from iot.models import TelemetryData
+from iot.serializers import TelemetryDataSerializer
+from iot.views import TELEMETRY_ROWS
+
+
+class Command(BaseCommand):
+    help = (
+        'Time DRF ModelSerializer + JSONRenderer against the fast row encoder '
+        'for a page of telemetry points (in memory, no database).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500, help='Points per payload (latest limit: 500).')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        asset_id = uuid.uuid4()
+        points = [
+            TelemetryData(
+                asset_id=asset_id,
+                metric='temperature',
+                value=Decimal(20 + i % 10).quantize(Decimal('0.000001')),
+                unit='C',
+                timestamp=now - timedelta(seconds=i),
+                metadata={'source': 'benchmark'},
+            )
+            for i in range(options['rows'])
+        ]
+
+        timings = {
+            'DRF serializer': self._time(
+                lambda: JSONRenderer().render(TelemetryDataSerializer(points, many=True).data),
+                options['repeat'],
+            ),
+            f'fast path ({"orjson" if fastjson.orjson else "json"})': self._time(
+                lambda: fastjson.dumps(TELEMETRY_ROWS.rows(points)), options['repeat'],
+            ),
+        }
+
+        baseline = next(iter(timings.values()))
+        for name, elapsed in timings.items():
+            self.stdout.write(
+                f'{name:<22} {elapsed * 1000:8.2f} ms per {options["rows"]} rows  '
+                f'({baseline / elapsed:.1f}x)'
+            )
+
+    def _time(self, func, repeat):
+        func()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat
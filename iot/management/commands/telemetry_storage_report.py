@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from iot.compact import write_compact
+from iot.models import CompactTelemetry, TelemetryData
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare row size and full-scan time of telemetry_data against the '
+        'compact telemetry store, optionally backfilling the compact store first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill-days', type=int, default=0,
+            help='Copy the last N days of telemetry_data into the compact store first.',
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill_days']:
+            copied = self._backfill(options['backfill_days'])
+            self.stdout.write(f'Backfilled {copied} points into the compact store')
+
+        for model in (TelemetryData, CompactTelemetry):
+            table = model._meta.db_table
+            rows, avg_row, data_bytes = self._table_stats(table)
+
+            started = time.perf_counter()
+            result = model.objects.aggregate(n=Count('*'), avg=Avg('value'))
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(self.style.MIGRATE_HEADING(table))
+            self.stdout.write(f'  rows:           {result["n"]} (estimate {rows})')
+            self.stdout.write(f'  avg row length: {avg_row} B')
+            self.stdout.write(f'  data + index:   {data_bytes} B')
+            self.stdout.write(f'  full scan avg:  {elapsed * 1000:.1f} ms')
+
+    def _table_stats(self, table):
+        if connection.vendor != 'mysql':
+            return None, None, None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT TABLE_ROWS, AVG_ROW_LENGTH, DATA_LENGTH + INDEX_LENGTH
+                FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+                """,
+                [table],
+            )
+            return cursor.fetchone() or (None, None, None)
+
+    def _backfill(self, days):
+        since = timezone.now() - timedelta(days=days)
+        rows = (
+            TelemetryData.objects
+            .filter(timestamp__gte=since)
+            .only('asset_id', 'metric', 'unit', 'value', 'timestamp', 'quality_score')
+            .order_by()
+        )
+        copied, batch = 0, []
+        for row in rows.iterator(chunk_size=BACKFILL_CHUNK_SIZE):
+            batch.append(row)
+            if len(batch) >= BACKFILL_CHUNK_SIZE:
+                write_compact(batch)
+                copied += len(batch)
+                batch = []
+        if batch:
+            write_compact(batch)
+            copied += len(batch)
+        return copied
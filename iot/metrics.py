@@ -0,0 +1,92 @@
+"""
+In-process counters for the iot WebSocket consumers.
+
+Every ASGI process keeps its own counters and live send queues, and
+publishes a snapshot to the shared cache at most every
+``PUBLISH_INTERVAL`` seconds. ``collect`` sums the snapshots of all
+processes that published recently.
+"""
+import os
+import socket
+import time
+import weakref
+from collections import defaultdict
+
+from django.core.cache import cache
+
+CACHE_PREFIX = 'iot:wsmetrics'
+INDEX_KEY = f'{CACHE_PREFIX}:index'
+PUBLISH_INTERVAL = 10.0
+SNAPSHOT_TIMEOUT = 60
+
+COUNTERS = ('frames_sent', 'frames_dropped', 'frames_coalesced', 'slow_disconnects')
+
+PROCESS_KEY = f'{CACHE_PREFIX}:{socket.gethostname()}:{os.getpid()}'
+
+_counters = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+_queues = defaultdict(weakref.WeakSet)
+_last_publish = 0.0
+
+
+def incr(consumer_type, name, amount=1):
+    _counters[consumer_type][name] += amount
+
+
+def register_queue(consumer_type, queue):
+    _queues[consumer_type].add(queue)
+
+
+def unregister_queue(consumer_type, queue):
+    _queues[consumer_type].discard(queue)
+
+
+def snapshot():
+    """{consumer type: counters plus connections and queue depth} for this process."""
+    result = {}
+    for consumer_type in set(_counters) | set(_queues):
+        depths = [len(queue) for queue in list(_queues[consumer_type])]
+        result[consumer_type] = {
+            **_counters[consumer_type],
+            'connections': len(depths),
+            'queue_depth': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+        }
+    return result
+
+
+async def maybe_publish():
+    global _last_publish
+    now = time.monotonic()
+    if now - _last_publish < PUBLISH_INTERVAL:
+        return
+    _last_publish = now
+
+    index = set(await cache.aget(INDEX_KEY) or ())
+    if PROCESS_KEY not in index:
+        index.add(PROCESS_KEY)
+        await cache.aset(INDEX_KEY, index, timeout=None)
+    await cache.aset(PROCESS_KEY, snapshot(), timeout=SNAPSHOT_TIMEOUT)
+
+
+def collect():
+    """Sum the snapshots published by all live processes."""
+    index = cache.get(INDEX_KEY) or set()
+    snapshots = cache.get_many(list(index))
+
+    stale = index - set(snapshots)
+    if stale:
+        cache.set(INDEX_KEY, index - stale, timeout=None)
+
+    totals = {}
+    for process in snapshots.values():
+        for consumer_type, values in process.items():
+            merged = totals.setdefault(consumer_type, defaultdict(int))
+            for name, value in values.items():
+                if name == 'max_queue_depth':
+                    merged[name] = max(merged[name], value)
+                else:
+                    merged[name] += value
+    return {
+        'processes': len(snapshots),
+        'consumers': {name: dict(values) for name, values in totals.items()},
+    }
@@ -0,0 +1,452 @@
+"""
+Modbus/TCP polling engine.
+
+One asyncio loop polls every ``protocol='modbus'`` device:
+
+* ``Device.configuration``: ``host`` (defaults to ``ip_address``),
+  ``port`` (502), ``unit_id`` (1), ``timeout`` (seconds)
+* ``Sensor.configuration``: ``register``, ``table`` (``holding`` or
+  ``input``), ``data_type`` (``uint16``, ``int16``, ``uint32``, ``int32``,
+  ``float32``), ``word_order`` (``big``/``little``), ``scale``, ``offset``,
+  optional ``unit_id``
+
+Sensors of a device that share a polling interval (``1 / sampling_rate``)
+form one job; their registers are merged into as few read requests as
+possible. Jobs sit on a heap ordered by due time, connections are pooled
+per (host, port) and reads go to ``TelemetryBatcher`` for batched writes.
+
+The client speaks the protocol directly (function codes 3 and 4), so no
+third-party Modbus library is needed; ``ModbusSimulator`` serves the same
+protocol in-process for tests.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import random
+import struct
+from collections import defaultdict, namedtuple
+from decimal import InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .gateway import TelemetryBatcher
+from .heartbeat import TIMEOUT as HEARTBEAT_TIMEOUT
+from .ingest import _parse_value
+from .models import Device, Sensor, TelemetryData
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'TELEMETRY_MODBUS_BATCH_SIZE', 1000)
+FLUSH_INTERVAL = getattr(settings, 'TELEMETRY_MODBUS_FLUSH_MS', 1000) / 1000.0
+DEVICE_FLUSH_INTERVAL = getattr(settings, 'TELEMETRY_MODBUS_DEVICE_FLUSH_SECONDS', 5)
+PLAN_REFRESH_INTERVAL = getattr(settings, 'TELEMETRY_MODBUS_PLAN_REFRESH_SECONDS', 60)
+MAX_CONCURRENCY = getattr(settings, 'TELEMETRY_MODBUS_MAX_CONCURRENCY', 256)
+MIN_INTERVAL = getattr(settings, 'TELEMETRY_MODBUS_MIN_INTERVAL', 0.1)
+DEFAULT_TIMEOUT = 2.0
+
+MAX_READ_REGISTERS = 125  # protocol limit for function codes 3/4
+MAX_REGISTER_GAP = 8  # read through gaps this small instead of issuing another request
+
+FUNCTION_CODES = {'holding': 3, 'input': 4}
+REGISTER_WIDTH = {'uint16': 1, 'int16': 1, 'uint32': 2, 'int32': 2, 'float32': 2}
+STRUCT_FORMATS = {'uint16': '>H', 'int16': '>h', 'uint32': '>I', 'int32': '>i', 'float32': '>f'}
+
+
+class ModbusError(Exception):
+    pass
+
+
+# -------------------------------------------------------------------
+# Register decoding
+# -------------------------------------------------------------------
+SensorRead = namedtuple('SensorRead', [
+    'sensor_id', 'metric', 'unit', 'register', 'data_type', 'word_order', 'scale', 'offset',
+])
+
+
+def decode_registers(registers, data_type='uint16', word_order='big'):
+    words = list(registers[:REGISTER_WIDTH[data_type]])
+    if word_order == 'little':
+        words.reverse()
+    raw = b''.join(word.to_bytes(2, 'big') for word in words)
+    return struct.unpack(STRUCT_FORMATS[data_type], raw)[0]
+
+
+def sensor_read(sensor):
+    """SensorRead for a sensor, or None when its configuration is not usable."""
+    config = sensor.configuration or {}
+    data_type = str(config.get('data_type', 'uint16'))
+    table = str(config.get('table', 'holding'))
+    if 'register' not in config or data_type not in REGISTER_WIDTH or table not in FUNCTION_CODES:
+        return None
+    try:
+        register = int(config['register'])
+        scale = float(config.get('scale', 1.0))
+        offset = float(config.get('offset', 0.0))
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= register <= 0xFFFF or not math.isfinite(scale) or not math.isfinite(offset):
+        return None
+    return SensorRead(
+        sensor.sensor_id,
+        sensor.name,
+        sensor.unit,
+        register,
+        data_type,
+        config.get('word_order', 'big'),
+        scale,
+        offset,
+    )
+
+
+# -------------------------------------------------------------------
+# Poll plan
+# -------------------------------------------------------------------
+ReadBlock = namedtuple('ReadBlock', ['unit_id', 'function', 'start', 'count', 'sensors'])
+PollJob = namedtuple('PollJob', ['device_id', 'asset_id', 'host', 'port', 'timeout', 'interval', 'blocks'])
+
+
+def job_key(job):
+    """Identity of a job that survives plan refreshes: device and register ranges."""
+    return job.device_id, tuple((b.unit_id, b.function, b.start, b.count) for b in job.blocks)
+
+
+def plan_blocks(reads):
+    """
+    Merge SensorReads of one (unit, function) into read requests covering
+    at most MAX_READ_REGISTERS registers, bridging gaps up to MAX_REGISTER_GAP.
+    Returns [(start, count, [SensorRead])].
+    """
+    blocks = []
+    for read in sorted(reads, key=lambda r: r.register):
+        end = read.register + REGISTER_WIDTH[read.data_type]
+        if blocks:
+            start, current_end, members = blocks[-1]
+            if (read.register - current_end <= MAX_REGISTER_GAP
+                    and max(end, current_end) - start <= MAX_READ_REGISTERS):
+                blocks[-1] = (start, max(end, current_end), members + [read])
+                continue
+        blocks.append((read.register, end, [read]))
+    return [(start, end - start, members) for start, end, members in blocks]
+
+
+def load_poll_plan():
+    """PollJobs for every active Modbus sensor, in two queries."""
+    devices = Device.objects.filter(protocol='modbus').prefetch_related(
+        Prefetch('sensors', queryset=Sensor.objects.filter(is_active=True))
+    )
+    jobs = []
+    for device in devices:
+        config = device.configuration or {}
+        host = config.get('host') or device.ip_address
+        if not host:
+            logger.warning('Modbus device %s has no host configured', device.device_id)
+            continue
+        try:
+            port = int(config.get('port', 502))
+            timeout = float(config.get('timeout', DEFAULT_TIMEOUT))
+            default_unit = int(config.get('unit_id', 1))
+        except (TypeError, ValueError):
+            port = None
+        if port is None or not 0 < port <= 0xFFFF or not timeout > 0:
+            logger.warning('Skipping Modbus device %s: invalid port, timeout or unit_id', device.device_id)
+            continue
+
+        # (interval) -> (unit_id, function) -> [SensorRead]
+        groups = defaultdict(lambda: defaultdict(list))
+        for sensor in device.sensors.all():
+            read = sensor_read(sensor)
+            if read is None or not sensor.sampling_rate or sensor.sampling_rate <= 0:
+                logger.warning('Skipping Modbus sensor %s: incomplete configuration', sensor.sensor_id)
+                continue
+            interval = max(1.0 / sensor.sampling_rate, MIN_INTERVAL)
+            sensor_config = sensor.configuration or {}
+            try:
+                unit_id = int(sensor_config.get('unit_id', default_unit))
+            except (TypeError, ValueError):
+                unit_id = None
+            if unit_id is None or not 0 <= unit_id <= 0xFF:
+                logger.warning('Skipping Modbus sensor %s: invalid unit_id', sensor.sensor_id)
+                continue
+            function = FUNCTION_CODES[str(sensor_config.get('table', 'holding'))]
+            groups[interval][(unit_id, function)].append(read)
+
+        for interval, tables in groups.items():
+            blocks = [
+                ReadBlock(unit_id, function, start, count, members)
+                for (unit_id, function), reads in sorted(tables.items())
+                for start, count, members in plan_blocks(reads)
+            ]
+            jobs.append(PollJob(device.id, device.asset_id, host, port, timeout, interval, blocks))
+    return jobs
+
+
+# -------------------------------------------------------------------
+# Client and connection pool
+# -------------------------------------------------------------------
+class ModbusTCPClient:
+    """Minimal Modbus/TCP client; one request in flight per connection."""
+
+    def __init__(self, host, port=502, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._transactions = itertools.count(1)
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = None
+
+    async def read_registers(self, unit_id, function, address, count):
+        async with self._lock:
+            transaction = next(self._transactions) & 0xFFFF
+            pdu = struct.pack('>BHH', function, address, count)
+            self._writer.write(struct.pack('>HHHB', transaction, 0, len(pdu) + 1, unit_id) + pdu)
+            await self._writer.drain()
+
+            header = await asyncio.wait_for(self._reader.readexactly(7), self.timeout)
+            reply_transaction, _protocol, length, _unit = struct.unpack('>HHHB', header)
+            body = await asyncio.wait_for(self._reader.readexactly(length - 1), self.timeout)
+
+        if reply_transaction != transaction:
+            raise ModbusError('Transaction id mismatch')
+        if body[0] & 0x80:
+            raise ModbusError(f'Exception code {body[1]} for function {function}')
+        byte_count = body[1]
+        return list(struct.unpack(f'>{byte_count // 2}H', body[2:2 + byte_count]))
+
+
+class ConnectionPool:
+    def __init__(self, client_factory=ModbusTCPClient):
+        self.client_factory = client_factory
+        self._clients = {}
+        self._connecting = defaultdict(asyncio.Lock)
+
+    async def get(self, host, port, timeout=DEFAULT_TIMEOUT):
+        # Jobs of several devices behind one gateway share its connection
+        async with self._connecting[(host, port)]:
+            client = self._clients.get((host, port))
+            if client is None or not client.connected:
+                client = self.client_factory(host, port, timeout)
+                await client.connect()
+                self._clients[(host, port)] = client
+            return client
+
+    async def discard(self, host, port):
+        client = self._clients.pop((host, port), None)
+        if client is not None:
+            await client.close()
+
+    async def close(self):
+        for key in list(self._clients):
+            await self.discard(*key)
+
+
+# -------------------------------------------------------------------
+# Poller
+# -------------------------------------------------------------------
+class ModbusPoller:
+    def __init__(self, client_factory=ModbusTCPClient, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, device_flush_interval=DEVICE_FLUSH_INTERVAL,
+                 plan_refresh_interval=PLAN_REFRESH_INTERVAL, max_concurrency=MAX_CONCURRENCY):
+        self.pool = ConnectionPool(client_factory)
+        self.batcher = TelemetryBatcher(
+            batch_size, device_flush_interval, name='Modbus poller', protocol='modbus'
+        )
+        self.flush_interval = flush_interval
+        self.plan_refresh_interval = plan_refresh_interval
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.jobs = []
+        self.in_flight = set()  # job_key() of jobs with a poll running
+        self.stats = dict.fromkeys(
+            ('polls', 'requests', 'points', 'rejected', 'errors', 'skipped'), 0
+        )
+        self._stopped = asyncio.Event()
+        self._tasks = set()
+
+    def stop(self):
+        self._stopped.set()
+
+    async def _poll(self, job):
+        async with self.semaphore:
+            self.stats['polls'] += 1
+            now = timezone.now()
+            rows = []
+            try:
+                client = await self.pool.get(job.host, job.port, job.timeout)
+                for block in job.blocks:
+                    registers = await client.read_registers(
+                        block.unit_id, block.function, block.start, block.count
+                    )
+                    self.stats['requests'] += 1
+                    for read in block.sensors:
+                        index = read.register - block.start
+                        try:
+                            raw = decode_registers(registers[index:], read.data_type, read.word_order)
+                            value = _parse_value(raw * read.scale + read.offset)
+                        except (ValueError, InvalidOperation, struct.error):
+                            self.stats['rejected'] += 1
+                            continue
+                        rows.append(TelemetryData(
+                            asset_id=job.asset_id,
+                            metric=read.metric,
+                            value=value,
+                            unit=read.unit,
+                            timestamp=now,
+                            metadata={'source': 'modbus', 'sensor_id': read.sensor_id},
+                        ))
+            except (ModbusError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as exc:
+                self.stats['errors'] += 1
+                self.batcher.mark(job.device_id, 'error')
+                logger.debug('Modbus poll of %s:%s failed: %s', job.host, job.port, exc)
+                await self.pool.discard(job.host, job.port)
+                return
+            finally:
+                self.in_flight.discard(job_key(job))
+
+        self.batcher.add(rows)
+        # A slow poll rate must not read as a dead device
+        self.batcher.mark(job.device_id, timeout=max(HEARTBEAT_TIMEOUT, job.interval * 3))
+        self.stats['points'] += len(rows)
+        if self.batcher.full:
+            await self.batcher.flush()
+
+    def _schedule(self, jobs, loop_time):
+        # Spread first polls over one interval so devices don't fire in lockstep
+        heap = [
+            (loop_time + random.uniform(0, job.interval), index, job)
+            for index, job in enumerate(jobs)
+        ]
+        heapq.heapify(heap)
+        return heap
+
+    async def _periodic(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.batcher.flush()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.jobs = await sync_to_async(load_poll_plan)()
+        heap = self._schedule(self.jobs, loop.time())
+        next_refresh = loop.time() + self.plan_refresh_interval
+        periodic = asyncio.ensure_future(self._periodic())
+
+        try:
+            while not self._stopped.is_set():
+                now = loop.time()
+                if now >= next_refresh:
+                    self.jobs = await sync_to_async(load_poll_plan)()
+                    heap = self._schedule(self.jobs, now)
+                    next_refresh = now + self.plan_refresh_interval
+
+                while heap and heap[0][0] <= now:
+                    due, index, job = heapq.heappop(heap)
+                    key = job_key(job)
+                    if key in self.in_flight:
+                        self.stats['skipped'] += 1
+                    else:
+                        self.in_flight.add(key)
+                        task = asyncio.ensure_future(self._poll(job))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+                    # Fixed rate; a poller that fell behind skips ahead instead of bursting
+                    due += job.interval
+                    if due <= now:
+                        due = now + job.interval
+                    heapq.heappush(heap, (due, index, job))
+
+                wake = min(heap[0][0] if heap else next_refresh, next_refresh)
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), max(wake - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            periodic.cancel()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self.batcher.flush(force=True)
+            await self.pool.close()
+        return {**self.stats, **self.batcher.stats}
+
+
+# -------------------------------------------------------------------
+# In-process simulator
+# -------------------------------------------------------------------
+class ModbusSimulator:
+    """
+    Modbus/TCP server for function codes 3 and 4 backed by dicts:
+    ``registers[(unit_id, 'holding' | 'input')][address] = word``.
+    """
+
+    def __init__(self):
+        self.registers = defaultdict(dict)
+        self.requests = 0
+        self._server = None
+
+    def set_value(self, address, value, data_type='uint16', unit_id=1, table='holding', word_order='big'):
+        raw = struct.pack(STRUCT_FORMATS[data_type], value)
+        words = [int.from_bytes(raw[i:i + 2], 'big') for i in range(0, len(raw), 2)]
+        if word_order == 'little':
+            words.reverse()
+        for offset, word in enumerate(words):
+            self.registers[(unit_id, table)][address + offset] = word
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        tables = {code: name for name, code in FUNCTION_CODES.items()}
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction, protocol, length, unit_id = struct.unpack('>HHHB', header)
+                pdu = await reader.readexactly(length - 1)
+                self.requests += 1
+
+                function = pdu[0]
+                registers = self.registers.get((unit_id, tables.get(function)))
+                if registers is None:
+                    reply = struct.pack('>BB', function | 0x80, 1)
+                else:
+                    address, count = struct.unpack('>HH', pdu[1:5])
+                    words = [registers.get(address + i) for i in range(count)]
+                    if all(word is None for word in words):
+                        reply = struct.pack('>BB', function | 0x80, 2)
+                    else:
+                        data = struct.pack(f'>{count}H', *(word or 0 for word in words))
+                        reply = struct.pack('>BB', function, len(data)) + data
+                writer.write(struct.pack('>HHHB', transaction, protocol, len(reply) + 1, unit_id) + reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
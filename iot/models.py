@@ -37,6 +37,242 @@ class TelemetryData(models.Model):
         return f"{self.asset.asset_id}.{self.metric}={self.value}"
 
 
+# -------------------------------------------------------------------
+# Telemetry rollups (PRE-AGGREGATED – maintained at ingest)
+# -------------------------------------------------------------------
+class TelemetryRollup(models.Model):
+    RESOLUTION_CHOICES = [
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='telemetry_rollups'
+    )
+    metric = models.CharField(max_length=100)
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+
+    count = models.PositiveIntegerField(default=0)
+    sum = models.FloatField(default=0.0)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    last_value = models.FloatField()
+    last_timestamp = models.DateTimeField()
+
+    class Meta:
+        db_table = 'telemetry_rollups'
+        ordering = ['bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['asset', 'metric', 'resolution', 'bucket'],
+                name='unique_telemetry_rollup_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.asset_id}.{self.metric}@{self.resolution}:{self.bucket}"
+
+    @property
+    def avg_value(self):
+        return self.sum / self.count if self.count else None
+
+
+class TelemetryRollupCoverage(models.Model):
+    """
+    Rollups hold every stored point from ``covered_from`` on: of one asset,
+    or of every asset when ``asset`` is null (the global floor, set when
+    ingest first maintains rollups). Earlier ranges are read raw.
+    """
+    id = models.BigAutoField(primary_key=True)
+    asset = models.OneToOneField(
+        Asset,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='telemetry_rollup_coverage'
+    )
+    covered_from = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'telemetry_rollup_coverage'
+
+    def __str__(self):
+        return f"{self.asset_id or '*'}>={self.covered_from}"
+
+
+# -------------------------------------------------------------------
+# Telemetry quality (PER SERIES – maintained at ingest)
+# -------------------------------------------------------------------
+class SeriesQuality(models.Model):
+    """
+    What the quality checks carry between batches for one (asset, metric)
+    series: the last value, its timestamp and the current run length.
+    """
+    id = models.BigAutoField(primary_key=True)
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='telemetry_quality'
+    )
+    metric = models.CharField(max_length=100)
+
+    last_value = models.FloatField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    stuck_run = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'telemetry_series_quality'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['asset', 'metric'],
+                name='unique_series_quality',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.asset_id}.{self.metric}@{self.last_timestamp}"
+
+
+class SeriesQualityDay(models.Model):
+    """
+    Data-quality counters for one (asset, metric) series over one UTC day
+    of point timestamps. Health reads a recent window of days; retention
+    trims old ones.
+    """
+    id = models.BigAutoField(primary_key=True)
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='telemetry_quality_days'
+    )
+    metric = models.CharField(max_length=100)
+    day = models.DateField()
+
+    samples = models.BigIntegerField(default=0)
+    score_sum = models.FloatField(default=0.0)
+    out_of_range = models.BigIntegerField(default=0)
+    stuck = models.BigIntegerField(default=0)
+    gaps = models.BigIntegerField(default=0)
+    duplicates = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'telemetry_series_quality_days'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['asset', 'metric', 'day'],
+                name='unique_series_quality_day',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['asset', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.asset_id}.{self.metric}@{self.day}: {self.score}"
+
+    @property
+    def score(self):
+        return self.score_sum / self.samples if self.samples else None
+
+
+# -------------------------------------------------------------------
+# Compact telemetry store (HIGH VOLUME, NARROW ROWS)
+# -------------------------------------------------------------------
+class TelemetrySeries(models.Model):
+    """Small integer id standing in for an (asset, metric) pair."""
+    id = models.AutoField(primary_key=True)
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name='telemetry_series'
+    )
+    metric = models.CharField(max_length=100)
+    unit = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'telemetry_series'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['asset', 'metric'],
+                name='unique_telemetry_series',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.asset_id}.{self.metric}"
+
+
+class CompactTelemetry(models.Model):
+    """
+    One point per row: series id, epoch-millisecond timestamp and a
+    float64 value. The (series, ts) primary key clusters each series'
+    points together on disk.
+    """
+    pk = models.CompositePrimaryKey('series', 'ts')
+    series = models.ForeignKey(
+        TelemetrySeries,
+        on_delete=models.CASCADE,
+        related_name='points'
+    )
+    ts = models.BigIntegerField(help_text="Epoch milliseconds (UTC)")
+    value = models.FloatField()
+    quality_score = models.FloatField(default=1.0)
+
+    class Meta:
+        db_table = 'telemetry_compact'
+
+    def __str__(self):
+        return f"{self.series_id}@{self.ts}={self.value}"
+
+
+# -------------------------------------------------------------------
+# Telemetry archive (COLD – one columnar chunk per series per day)
+# -------------------------------------------------------------------
+class TelemetryChunk(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    series = models.ForeignKey(
+        TelemetrySeries,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    day = models.DateField()
+
+    count = models.PositiveIntegerField()
+    start_ts = models.BigIntegerField(help_text="Epoch milliseconds (UTC)")
+    end_ts = models.BigIntegerField(help_text="Epoch milliseconds (UTC)")
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    sum = models.FloatField()
+
+    # Delta-of-delta encoded timestamps / XOR encoded float64 values
+    timestamps = models.BinaryField()
+    values = models.BinaryField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'telemetry_chunks'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['series', 'day'],
+                name='unique_telemetry_chunk_day',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.series_id}@{self.day} ({self.count} points)"
+
+
 # -------------------------------------------------------------------
 # Alerts (SYSTEM GENERATED – IMMUTABLE)
 # -------------------------------------------------------------------
@@ -0,0 +1,342 @@
+"""
+MQTT ingestion gateway.
+
+An asyncio subscriber that maps topics to Device/Sensor records and feeds
+the bulk telemetry pipeline (``iot.ingest.write_telemetry``).
+
+Topics, below a device's base topic (``configuration['mqtt_topic']`` or
+``<TELEMETRY_MQTT_TOPIC_PREFIX>/<device uuid>``):
+
+* ``<base>/<sensor_id>`` – a bare number, or ``{"value": .., "timestamp": .., "unit": ..}``
+* ``<base>``             – ``{"timestamp": .., "values": {"<sensor_id>": value, ...}}``
+* ``<base>/status``      – ``online`` / ``offline`` (e.g. as the broker last will)
+* ``<base>/commands/ack`` – ``{"id": .., "status": "executed" | "failed", "response": ..}``
+
+Commands (``iot.commands``) are published to ``<base>/commands`` as
+``{"id": .., "type": .., "payload": ..}``.
+
+Topics resolve through the in-process device registry (``iot.registry``),
+so the table refresh costs no queries unless devices changed.
+Points are buffered and written in batches; device liveness goes through
+the batcher's heartbeat tracker (``iot.heartbeat``).
+The broker client is injected, so tests run against ``InMemoryMQTTClient``.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from .commands import CommandDispatcher
+from .gateway import TelemetryBatcher
+from .ingest import _parse_timestamp, _parse_unit, _parse_value
+from .models import TelemetryData
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+TOPIC_PREFIX = getattr(settings, 'TELEMETRY_MQTT_TOPIC_PREFIX', 'digitwin')
+BATCH_SIZE = getattr(settings, 'TELEMETRY_MQTT_BATCH_SIZE', 500)
+FLUSH_INTERVAL = getattr(settings, 'TELEMETRY_MQTT_FLUSH_MS', 1000) / 1000.0
+DEVICE_FLUSH_INTERVAL = getattr(settings, 'TELEMETRY_MQTT_DEVICE_FLUSH_SECONDS', 5)
+TABLE_REFRESH_INTERVAL = getattr(settings, 'TELEMETRY_MQTT_TABLE_REFRESH_SECONDS', 5)
+
+STATUS_TOPIC = 'status'
+COMMAND_TOPIC = 'commands'
+COMMAND_ACK_TOPIC = f'{COMMAND_TOPIC}/ack'
+
+# sensors: {sensor_id: (metric, unit)}
+DeviceRoute = namedtuple('DeviceRoute', ['device_id', 'asset_id', 'sensors'])
+
+
+# -------------------------------------------------------------------
+# Topic table
+# -------------------------------------------------------------------
+def device_topic(entry, prefix=TOPIC_PREFIX):
+    return (entry.mqtt_topic or f'{prefix}/{entry.id}').rstrip('/')
+
+
+def load_topic_table(prefix=TOPIC_PREFIX):
+    """{base topic: DeviceRoute} for every MQTT device, from the device registry."""
+    return {
+        device_topic(entry, prefix): DeviceRoute(entry.id, entry.asset_id, entry.sensors)
+        for entry in registry.devices(protocol='mqtt')
+    }
+
+
+def topic_matches(pattern, topic):
+    pattern_parts, topic_parts = pattern.split('/'), topic.split('/')
+    for index, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts) or (part != '+' and part != topic_parts[index]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+# -------------------------------------------------------------------
+# Broker clients
+# -------------------------------------------------------------------
+class AiomqttClient:
+    """Adapter over ``aiomqtt`` (optional dependency)."""
+
+    def __init__(self, host, port=1883, username=None, password=None, client_id=None):
+        self.options = {
+            'hostname': host,
+            'port': port,
+            'username': username,
+            'password': password,
+            'identifier': client_id,
+        }
+        self._client = None
+
+    async def __aenter__(self):
+        try:
+            import aiomqtt
+        except ImportError:
+            raise ImproperlyConfigured('The MQTT gateway requires the aiomqtt package')
+        self._client = aiomqtt.Client(**self.options)
+        await self._client.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.__aexit__(*exc_info)
+
+    async def subscribe(self, topic):
+        await self._client.subscribe(topic, qos=1)
+
+    async def send(self, topic, payload):
+        await self._client.publish(topic, payload, qos=1)
+
+    async def messages(self):
+        async for message in self._client.messages:
+            yield str(message.topic), message.payload
+
+
+class InMemoryMQTTClient:
+    """In-process stand-in for a broker connection, for tests and local runs."""
+
+    def __init__(self):
+        self.subscriptions = []
+        self.sent = []
+        self._queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    async def subscribe(self, topic):
+        self.subscriptions.append(topic)
+
+    def publish(self, topic, payload):
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self._queue.put_nowait((topic, payload))
+
+    async def send(self, topic, payload):
+        self.sent.append((topic, payload))
+
+    def close(self):
+        self._queue.put_nowait(None)
+
+    async def messages(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            topic, payload = item
+            if any(topic_matches(pattern, topic) for pattern in self.subscriptions):
+                yield topic, payload
+
+
+# -------------------------------------------------------------------
+# Gateway
+# -------------------------------------------------------------------
+class MQTTGateway:
+    def __init__(self, client_factory, prefix=TOPIC_PREFIX, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, device_flush_interval=DEVICE_FLUSH_INTERVAL,
+                 table_refresh_interval=TABLE_REFRESH_INTERVAL):
+        self.client_factory = client_factory
+        self.prefix = prefix.rstrip('/')
+        self.flush_interval = flush_interval
+        self.table_refresh_interval = table_refresh_interval
+
+        self.table = {}
+        self.topics = {}  # device id -> base topic
+        self.subscribed = set()
+        self.client = None
+        self.batcher = TelemetryBatcher(
+            batch_size, device_flush_interval, name='MQTT gateway', protocol='mqtt'
+        )
+        self.commands = CommandDispatcher('mqtt', self.send_commands)
+        self.stats = dict.fromkeys(('messages', 'points', 'rejected', 'unknown_topic'), 0)
+
+    # ---------------------------
+    # Topic routing
+    # ---------------------------
+    async def refresh_table(self, client):
+        self.table = await sync_to_async(load_topic_table)(self.prefix)
+        self.topics = {route.device_id: base for base, route in self.table.items()}
+        wanted = {f'{self.prefix}/#'} | {
+            f'{base}/#' for base in self.table if not base.startswith(f'{self.prefix}/')
+        }
+        for topic in sorted(wanted - self.subscribed):
+            await client.subscribe(topic)
+            self.subscribed.add(topic)
+
+    def route(self, topic):
+        """(DeviceRoute, leaf) for a topic; leaf is None for the device topic itself."""
+        route = self.table.get(topic)
+        if route is not None:
+            return route, None
+        base, _, leaf = topic.rpartition('/')
+        route = self.table.get(base)
+        return (route, leaf) if route is not None else (None, None)
+
+    # ---------------------------
+    # Message handling
+    # ---------------------------
+    def _point(self, route, sensor_id, raw, now, timestamp=None, unit=None):
+        sensor = route.sensors.get(sensor_id)
+        if sensor is None:
+            raise ValueError(f'unknown sensor {sensor_id}')
+        metric, sensor_unit = sensor
+        return TelemetryData(
+            asset_id=route.asset_id,
+            metric=metric,
+            value=_parse_value(raw),
+            unit=_parse_unit(unit or sensor_unit),
+            timestamp=_parse_timestamp(timestamp, now),
+            metadata={'source': 'mqtt', 'sensor_id': sensor_id},
+        )
+
+    def handle_ack(self, route, text):
+        try:
+            body = json.loads(text)
+            command_id = uuid.UUID(str(body['id']))
+        except (ValueError, TypeError, KeyError):
+            self.stats['rejected'] += 1
+            return
+        self.batcher.mark(route.device_id)
+        self.commands.acknowledge(
+            command_id, ok=body.get('status', 'executed') == 'executed', response=body.get('response'),
+        )
+
+    def handle(self, topic, payload):
+        """Parse one message into buffered rows; never raises for bad input."""
+        self.stats['messages'] += 1
+        text = payload.decode('utf-8', 'replace') if isinstance(payload, bytes) else str(payload)
+
+        if topic.endswith(f'/{COMMAND_ACK_TOPIC}'):
+            route = self.table.get(topic[:-len(COMMAND_ACK_TOPIC) - 1])
+            if route is not None:
+                return self.handle_ack(route, text)
+        route, leaf = self.route(topic)
+        if route is None:
+            self.stats['unknown_topic'] += 1
+            return
+        if leaf == COMMAND_TOPIC and COMMAND_TOPIC not in route.sensors:
+            # Our own command publications, echoed by the broker
+            return
+
+        now = timezone.now()
+
+        if leaf == STATUS_TOPIC and STATUS_TOPIC not in route.sensors:
+            online = text.strip().lower() in ('online', 'connected', '1', 'true')
+            self.batcher.mark(route.device_id, 'connected' if online else 'disconnected')
+            return
+
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = text.strip()
+
+        rows = []
+        try:
+            if leaf is not None:
+                if isinstance(body, dict):
+                    rows.append(self._point(route, leaf, body.get('value'), now,
+                                            body.get('timestamp'), body.get('unit')))
+                else:
+                    rows.append(self._point(route, leaf, body, now))
+            elif isinstance(body, dict):
+                values = body.get('values')
+                if not isinstance(values, dict):
+                    values = {k: v for k, v in body.items() if k != 'timestamp'}
+                for sensor_id, raw in values.items():
+                    rows.append(self._point(route, sensor_id, raw, now, body.get('timestamp')))
+            else:
+                raise ValueError('device topic payload must be an object')
+        except ValueError as exc:
+            self.stats['rejected'] += 1
+            logger.debug('Rejected MQTT message on %s: %s', topic, exc)
+            return
+
+        self.batcher.add(rows)
+        self.batcher.mark(route.device_id)
+        self.stats['points'] += len(rows)
+
+    async def send_commands(self, commands):
+        """Protocol adapter for the command dispatcher."""
+        errors = {}
+        for command in commands:
+            base = self.topics.get(command.device_id)
+            if base is None or self.client is None:
+                errors[command.id] = 'device has no MQTT topic'
+                continue
+            await self.client.send(f'{base}/{COMMAND_TOPIC}', json.dumps({
+                'id': str(command.id),
+                'type': command.command_type,
+                'payload': command.payload,
+            }))
+        return errors
+
+    async def _periodic(self, client):
+        last_refresh = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.batcher.flush()
+                if time.monotonic() - last_refresh >= self.table_refresh_interval:
+                    last_refresh = time.monotonic()
+                    await self.refresh_table(client)
+            except Exception:
+                # A failed refresh keeps the previous table; flushing goes on
+                logger.exception('MQTT gateway periodic task failed')
+
+    async def run(self):
+        async with self.client_factory() as client:
+            self.client = client
+            await self.refresh_table(client)
+            periodic = asyncio.ensure_future(self._periodic(client))
+            commands = asyncio.ensure_future(self.commands.run())
+            try:
+                async for topic, payload in client.messages():
+                    try:
+                        self.handle(topic, payload)
+                    except Exception:
+                        # One message must never stop the gateway
+                        self.stats['rejected'] += 1
+                        logger.exception('Could not handle MQTT message on %s', topic)
+                    if self.batcher.full:
+                        await self.batcher.flush()
+            finally:
+                periodic.cancel()
+                self.commands.stop()
+                await asyncio.gather(commands, return_exceptions=True)
+                await self.batcher.flush(force=True)
+                self.client = None
+        return {**self.stats, **self.batcher.stats, **self.command_stats()}
+
+    def command_stats(self):
+        return {f'commands_{name}': value for name, value in self.commands.stats.items()}
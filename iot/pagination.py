@@ -0,0 +1,125 @@
+"""
+Keyset pagination for telemetry.
+
+Offsets get slower the deeper a client pages and shift under concurrent
+inserts, so telemetry pages are addressed by the last ``(timestamp, id)``
+seen instead. Each page is one index range scan, whatever its depth.
+
+Hot rows carry UUID ids; archived and compact points carry ``series:ms``
+ids (see ``iot.history`` for how the two interleave).
+"""
+import base64
+import re
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+PAGE_SIZE = getattr(settings, 'TELEMETRY_PAGE_SIZE', 1000)
+MAX_PAGE_SIZE = getattr(settings, 'TELEMETRY_MAX_PAGE_SIZE', 10000)
+
+COMPACT_ID = re.compile(r'^\d+:-?\d+$')
+
+
+def encode_cursor(timestamp, pk):
+    raw = f'{timestamp.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.split('|', 1)
+        timestamp = parse_datetime(timestamp)
+        if not COMPACT_ID.match(pk):
+            pk = uuid.UUID(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        timestamp = None
+    if timestamp is None:
+        raise NotFound('Invalid cursor')
+    return timestamp, pk
+
+
+def keyset_position(timestamp, pk, descending=True):
+    """Rows strictly after ``(timestamp, pk)`` in the given order."""
+    if isinstance(pk, str):
+        # Archived / compact points sort before rows at the same timestamp
+        return Q(timestamp__lt=timestamp) if descending else Q(timestamp__gte=timestamp)
+    if descending:
+        return Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+    return Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+
+
+class TelemetryKeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, descending=True):
+        self.descending = descending
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, PAGE_SIZE))
+        except ValueError:
+            size = PAGE_SIZE
+        return max(1, min(size, MAX_PAGE_SIZE))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, pk = decode_cursor(cursor)
+            queryset = queryset.filter(keyset_position(timestamp, pk, self.descending))
+
+        ordering = ('-timestamp', '-id') if self.descending else ('timestamp', 'id')
+        page = list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+        return self._page(page)
+
+    def paginate_history(self, history, request):
+        """One page of a ``TelemetryHistory`` (hot rows merged with the archive)."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        after = decode_cursor(cursor) if cursor else None
+        return self._page(history.read(self.descending, after, self.page_size + 1))
+
+    def _page(self, page):
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = encode_cursor(page[-1].timestamp, page[-1].pk) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('next_cursor', self.next_cursor),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,252 @@
+"""
+Data-quality scoring for ingested telemetry.
+
+Runs on every ingest batch before the rows are written, so each point's
+``quality_score`` goes out with the same bulk INSERT. Points are checked
+per series with NumPy:
+
+* out of range - outside ``AssetMetric.min_value`` / ``max_value``
+* stuck        - part of a run of ``STUCK_RUN`` or more identical values
+* gap          - more than ``GAP_FACTOR`` sampling periods
+                 (``Sensor.sampling_rate``) after the previous point
+* duplicate    - same timestamp as the previous point of the series
+
+Each failed check multiplies the score by its entry in ``PENALTIES``.
+Counters and the score sum are kept per series and UTC day in
+``SeriesQualityDay``, so health calculations read the last
+``TELEMETRY_QUALITY_WINDOW_DAYS`` days instead of rescanning telemetry,
+old problems stop counting against a series, and retention trims the
+days. ``SeriesQuality`` holds the last value, timestamp and run length
+the checks carry across batches. Concurrent batches for the same series
+are last-writer-wins on both, like the last-value cache.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from assets.models import AssetMetric
+from .compact import to_epoch_ms
+from .models import SeriesQuality, SeriesQualityDay, Sensor
+
+STUCK_RUN = getattr(settings, 'TELEMETRY_QUALITY_STUCK_RUN', 10)
+GAP_FACTOR = getattr(settings, 'TELEMETRY_QUALITY_GAP_FACTOR', 3.0)
+WINDOW_DAYS = getattr(settings, 'TELEMETRY_QUALITY_WINDOW_DAYS', 7)
+
+PENALTIES = {
+    'out_of_range': 0.0,
+    'stuck': 0.5,
+    'gap': 0.8,
+    'duplicate': 0.5,
+}
+
+STATE_FIELDS = ['last_value', 'last_timestamp', 'stuck_run', 'updated_at']
+COUNTER_FIELDS = ['samples', 'score_sum', 'out_of_range', 'stuck', 'gaps', 'duplicates']
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+EPOCH_DAY = date(1970, 1, 1)
+
+
+# -------------------------------------------------------------------
+# Configuration lookups (one query each per batch)
+# -------------------------------------------------------------------
+def _limits(asset_ids, metrics):
+    return {
+        (asset_id, name): (
+            np.nan if low is None else low,
+            np.nan if high is None else high,
+        )
+        for asset_id, name, low, high in AssetMetric.objects.filter(
+            asset_id__in=asset_ids, name__in=metrics, is_active=True
+        ).values_list('asset_id', 'name', 'min_value', 'max_value')
+    }
+
+
+def _periods(asset_ids, metrics):
+    """(asset_id, metric) -> expected sampling period in ms, from active sensors."""
+    periods = {}
+    for asset_id, name, rate in Sensor.objects.filter(
+        device__asset_id__in=asset_ids, name__in=metrics, is_active=True
+    ).values_list('device__asset_id', 'name', 'sampling_rate'):
+        if rate and rate > 0:
+            # Several sensors feeding one series: the slowest one sets the bar
+            period = 1000.0 / rate
+            periods[(asset_id, name)] = max(period, periods.get((asset_id, name), 0.0))
+    return periods
+
+
+# -------------------------------------------------------------------
+# Checks
+# -------------------------------------------------------------------
+def run_lengths(same, carried=0):
+    """
+    For each point, how many consecutive ``same`` flags end there;
+    ``carried`` continues a run from the previous batch.
+    """
+    index = np.arange(len(same))
+    resets = np.maximum.accumulate(np.where(same, -1, index))
+    return np.where(resets < 0, index + 1 + carried, index - resets)
+
+
+def check_series(ts, values, state=None, limits=None, period=None):
+    """
+    Flags for one series' time-ordered points. ``state`` is the series'
+    SeriesQuality (or None); returns {check: bool mask} and the run length
+    at the last point.
+    """
+    last_ts = to_epoch_ms(state.last_timestamp) if state and state.last_timestamp else None
+    last_value = state.last_value if state else None
+
+    previous_ts = np.empty(len(ts), dtype=np.float64)
+    previous_ts[1:] = ts[:-1]
+    previous_ts[0] = np.nan if last_ts is None else last_ts
+    previous_values = np.empty(len(values), dtype=np.float64)
+    previous_values[1:] = values[:-1]
+    previous_values[0] = np.nan if last_value is None else last_value
+
+    interval = ts - previous_ts
+    same = values == previous_values
+    runs = run_lengths(same, state.stuck_run if state and same[0] else 0)
+
+    flags = {
+        'duplicate': interval == 0,
+        'stuck': runs + 1 >= STUCK_RUN,
+        'gap': interval > GAP_FACTOR * period if period else np.zeros(len(ts), dtype=bool),
+    }
+    if limits is not None:
+        low, high = limits
+        with np.errstate(invalid='ignore'):
+            flags['out_of_range'] = (values < low) | (values > high)
+    else:
+        flags['out_of_range'] = np.zeros(len(ts), dtype=bool)
+    return flags, int(runs[-1])
+
+
+def combine(flags):
+    score = np.ones(len(next(iter(flags.values()))))
+    for check, mask in flags.items():
+        score *= np.where(mask, PENALTIES[check], 1.0)
+    return score
+
+
+# -------------------------------------------------------------------
+# Batch stage
+# -------------------------------------------------------------------
+def score_rows(rows):
+    """
+    Score TelemetryData rows in place (``quality_score`` is multiplied, so
+    a score supplied by the source is kept as a ceiling) and upsert the
+    per-series state and per-day counters. Call inside the ingest transaction.
+    """
+    if not rows:
+        return rows
+
+    series = defaultdict(list)
+    for index, row in enumerate(rows):
+        series[(row.asset_id, row.metric)].append(index)
+
+    asset_ids = {asset_id for asset_id, _ in series}
+    metrics = {metric for _, metric in series}
+    limits = _limits(asset_ids, metrics)
+    periods = _periods(asset_ids, metrics)
+    states = {
+        (state.asset_id, state.metric): state
+        for state in SeriesQuality.objects.filter(asset_id__in=asset_ids, metric__in=metrics)
+    }
+    timestamps = {
+        key: np.fromiter((to_epoch_ms(rows[i].timestamp) for i in indices), dtype=np.int64, count=len(indices))
+        for key, indices in series.items()
+    }
+    day_numbers = np.unique(np.concatenate(list(timestamps.values())) // MS_PER_DAY)
+    days = {
+        (counters.asset_id, counters.metric, counters.day): counters
+        for counters in SeriesQualityDay.objects.filter(
+            asset_id__in=asset_ids, metric__in=metrics,
+            day__in=[EPOCH_DAY + timedelta(days=int(n)) for n in day_numbers],
+        )
+    }
+
+    now = timezone.now()
+    updated = []
+    for key, indices in series.items():
+        ts = timestamps[key]
+        order = np.argsort(ts, kind='stable')
+        indices = [indices[i] for i in order]
+        ts = ts[order]
+        values = np.fromiter((rows[i].value for i in indices), dtype=np.float64, count=len(indices))
+
+        state = states.get(key)
+        flags, run = check_series(ts, values, state, limits.get(key), periods.get(key))
+        score = combine(flags)
+        for i, row_index in enumerate(indices):
+            row = rows[row_index]
+            row.quality_score = row.quality_score * float(score[i])
+
+        point_days = ts // MS_PER_DAY
+        for number in np.unique(point_days):
+            day = EPOCH_DAY + timedelta(days=int(number))
+            counters = days.get((*key, day))
+            if counters is None:
+                counters = days[(*key, day)] = SeriesQualityDay(asset_id=key[0], metric=key[1], day=day)
+            mask = point_days == number
+            counters.samples += int(mask.sum())
+            counters.score_sum += float(score[mask].sum())
+            counters.out_of_range += int(flags['out_of_range'][mask].sum())
+            counters.stuck += int(flags['stuck'][mask].sum())
+            counters.gaps += int(flags['gap'][mask].sum())
+            counters.duplicates += int(flags['duplicate'][mask].sum())
+
+        if state is None:
+            state = SeriesQuality(asset_id=key[0], metric=key[1])
+        last = rows[indices[-1]]
+        if state.last_timestamp is None or last.timestamp >= state.last_timestamp:
+            state.last_value = float(values[-1])
+            state.last_timestamp = last.timestamp
+            state.stuck_run = run
+        state.updated_at = now
+        updated.append(state)
+
+    SeriesQuality.objects.bulk_create(updated, **_upsert_options(STATE_FIELDS, ['asset', 'metric']))
+    SeriesQualityDay.objects.bulk_create(
+        [counters for counters in days.values() if counters.samples],
+        **_upsert_options(COUNTER_FIELDS, ['asset', 'metric', 'day']),
+    )
+    return rows
+
+
+def _upsert_options(update_fields, unique_fields):
+    options = {'update_conflicts': True, 'update_fields': update_fields}
+    # MySQL upserts on the unique key (ON DUPLICATE KEY UPDATE) and
+    # rejects an explicit conflict target
+    if connection.vendor != 'mysql':
+        options['unique_fields'] = unique_fields
+    return options
+
+
+# -------------------------------------------------------------------
+# Reading
+# -------------------------------------------------------------------
+def asset_quality(asset_id, since=None):
+    """
+    Quality summary over all series of an asset, from the per-day counters
+    of ``since`` (a date; default: the last ``WINDOW_DAYS`` days) onwards.
+    """
+    if since is None:
+        since = timezone.now().date() - timedelta(days=WINDOW_DAYS - 1)
+    totals = SeriesQualityDay.objects.filter(asset_id=asset_id, day__gte=since).aggregate(
+        samples=Sum('samples'),
+        score_sum=Sum('score_sum'),
+        out_of_range=Sum('out_of_range'),
+        stuck=Sum('stuck'),
+        gaps=Sum('gaps'),
+        duplicates=Sum('duplicates'),
+    )
+    samples = totals['samples'] or 0
+    score_sum = totals.pop('score_sum')
+    summary = {key: value or 0 for key, value in totals.items()}
+    summary['score'] = round(score_sum / samples, 4) if samples else None
+    return summary
@@ -0,0 +1,191 @@
+"""
+Batched multi-series telemetry queries for dashboards.
+
+A dashboard of 20 assets x 5 metrics would otherwise make 100 ``latest``
+or ``statistics`` calls. ``query_series`` answers all of them with one
+grouped read - rollup cells when a rollup resolution fits in a bucket,
+from each asset's rollup coverage watermark on, and raw points from the
+row or compact store otherwise or before the watermark - and buckets every
+series on the same grid with NumPy, so the result holds one shared
+``timestamps`` array and an aligned ``values`` array per series.
+"""
+import numpy as np
+from django.conf import settings
+
+from .archive import is_archived_range, series_arrays
+from .compact import from_epoch_ms, reads_compact, series_for, to_epoch_ms
+from .models import CompactTelemetry, TelemetryData, TelemetryRollup
+from .resample import MAX_BUCKETS, SeriesCells, bucket_index, group_aggregates, rollup_resolution
+from .rollups import rollup_coverage
+
+MAX_SERIES = getattr(settings, 'TELEMETRY_QUERY_MAX_SERIES', 200)
+DEFAULT_BUCKETS = getattr(settings, 'TELEMETRY_QUERY_BUCKETS', 60)
+AGGREGATES = ('avg', 'min', 'max', 'sum', 'count', 'last')
+
+
+def _labelled(labels, columns, source):
+    """(series position array, SeriesCells) from (ts, count, sum, min, max, last) rows."""
+    if not labels:
+        return np.empty(0, dtype=np.int64), SeriesCells.from_points(
+            np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        )
+    ts, count, total, low, high, last = zip(*columns)
+    return np.asarray(labels, dtype=np.int64), SeriesCells(
+        np.asarray(ts, dtype=np.int64),
+        np.asarray(count, dtype=np.float64),
+        np.asarray(total, dtype=np.float64),
+        np.asarray(low, dtype=np.float64),
+        np.asarray(high, dtype=np.float64),
+        np.asarray(last, dtype=np.float64),
+        source,
+    )
+
+
+def _rollup_cells(keys, positions, resolution, since, until):
+    rows = TelemetryRollup.objects.filter(
+        asset_id__in={asset_id for asset_id, _ in keys},
+        metric__in={metric for _, metric in keys},
+        resolution=resolution,
+        bucket__gte=since,
+        bucket__lt=until,
+    ).values_list('asset_id', 'metric', 'bucket', 'count', 'sum', 'min_value', 'max_value', 'last_value')
+
+    labels, columns = [], []
+    for asset_id, metric, bucket, *values in rows:
+        position = positions.get((asset_id, metric))
+        if position is not None:
+            labels.append(position)
+            columns.append((to_epoch_ms(bucket), *values))
+    return _labelled(labels, columns, f'rollup:{resolution}')
+
+
+def _point_columns(ts, value):
+    return ts, 1, value, value, value, value
+
+
+def _raw_cells(keys, positions, since, until):
+    labels, columns = [], []
+
+    if is_archived_range(since):
+        # Archived chunks are per series; one merge per requested series
+        for asset_id, metric in keys:
+            ts, values = series_arrays(asset_id, metric, since, until)
+            labels.extend([positions[(asset_id, metric)]] * len(ts))
+            columns.extend(zip(ts, np.ones(len(ts)), values, values, values, values))
+    elif reads_compact():
+        series = series_for(asset_ids={asset_id for asset_id, _ in keys})
+        by_series = {
+            pk: positions[(asset_id, metric)]
+            for pk, (asset_id, metric, _) in series.items()
+            if (asset_id, metric) in positions
+        }
+        rows = CompactTelemetry.objects.filter(
+            series_id__in=list(by_series), ts__gte=to_epoch_ms(since), ts__lt=to_epoch_ms(until),
+        ).values_list('series_id', 'ts', 'value')
+        for series_id, ts, value in rows:
+            labels.append(by_series[series_id])
+            columns.append(_point_columns(ts, value))
+    else:
+        rows = TelemetryData.objects.filter(
+            asset_id__in={asset_id for asset_id, _ in keys},
+            metric__in={metric for _, metric in keys},
+            timestamp__gte=since,
+            timestamp__lt=until,
+        ).values_list('asset_id', 'metric', 'timestamp', 'value')
+        for asset_id, metric, timestamp, value in rows:
+            position = positions.get((asset_id, metric))
+            if position is not None:
+                labels.append(position)
+                columns.append(_point_columns(to_epoch_ms(timestamp), float(value)))
+    return _labelled(labels, columns, 'raw')
+
+
+def _concat(first, second):
+    """Labels and SeriesCells of two ``_labelled`` results, one after the other."""
+    (labels, cells), (more_labels, more) = first, second
+    return np.concatenate((labels, more_labels)), cells.extend(more, cells.source)
+
+
+def _as_list(values):
+    values = values.astype(object)
+    values[np.isnan(values.astype(np.float64))] = None
+    return values.tolist()
+
+
+def query_series(keys, since, until, buckets=DEFAULT_BUCKETS, aggregate='avg'):
+    """
+    Bucket each ``(asset_id, metric)`` in ``keys`` over [since, until).
+
+    Returns ``{'source', 'bucket_seconds', 'timestamps', 'series'}`` where
+    ``series[i]['values'][j]`` is the aggregate of ``keys[i]`` in the bucket
+    starting at ``timestamps[j]`` (None when it has no data). Each series
+    carries its own ``source``; the top-level one is ``mixed`` when they differ.
+    """
+    if aggregate not in AGGREGATES:
+        raise ValueError(f'aggregate must be one of {", ".join(AGGREGATES)}')
+    keys = list(dict.fromkeys(keys))
+    buckets = max(1, min(int(buckets), MAX_BUCKETS))
+    positions = {key: i for i, key in enumerate(keys)}
+    start_ms, end_ms = to_epoch_ms(since), to_epoch_ms(until)
+    width_ms = max(end_ms - start_ms, 1) / buckets
+
+    sources = ['raw'] * len(keys)
+    parts = []
+    raw_until = {key: until for key in keys}
+    resolution = rollup_resolution((until - since) / buckets)
+    if resolution is not None:
+        # Rollups only from each asset's coverage watermark on, raw before it
+        coverage = rollup_coverage({asset_id for asset_id, _ in keys})
+        starts = {}
+        for key in keys:
+            covered = coverage[key[0]]
+            if covered is not None and covered < until:
+                starts.setdefault(max(since, covered), []).append(key)
+                raw_until[key] = max(since, covered)
+                sources[positions[key]] = f'rollup:{resolution}' if covered <= since else 'mixed'
+        for start, covered_keys in starts.items():
+            parts.append(_rollup_cells(
+                covered_keys, {key: positions[key] for key in covered_keys}, resolution, start, until,
+            ))
+
+    ends = {}
+    for key, end in raw_until.items():
+        if end > since:
+            ends.setdefault(end, []).append(key)
+    for end, raw_keys in ends.items():
+        parts.append(_raw_cells(raw_keys, {key: positions[key] for key in raw_keys}, since, end))
+
+    labels, cells = parts[0] if parts else _labelled([], [], 'raw')
+    for part in parts[1:]:
+        labels, cells = _concat((labels, cells), part)
+
+    # One flat group per (series, bucket), ordered by group then time
+    groups = labels * buckets + bucket_index(cells.ts, start_ms, end_ms, buckets)
+    order = np.lexsort((cells.ts, groups))
+    count, mean, low, high, last = group_aggregates(
+        groups[order], cells.take(order), len(keys) * buckets
+    )
+    grid = {
+        'avg': mean,
+        'min': low,
+        'max': high,
+        'sum': mean * count,
+        'count': count,
+        'last': last,
+    }[aggregate].reshape(len(keys), buckets)
+
+    starts = start_ms + (np.arange(buckets) * width_ms).astype(np.int64)
+    return {
+        'source': sources[0] if len(set(sources)) == 1 else 'mixed',
+        'bucket_seconds': width_ms / 1000.0,
+        'timestamps': [from_epoch_ms(int(ts)) for ts in starts],
+        'series': [
+            {
+                'asset_id': asset_id,
+                'metric': metric,
+                'source': source,
+                'values': values.astype(np.int64).tolist() if aggregate == 'count' else _as_list(values),
+            }
+            for (asset_id, metric), source, values in zip(keys, sources, grid)
+        ],
+    }
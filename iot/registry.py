@@ -0,0 +1,232 @@
+"""
+In-process device/sensor registry.
+
+Ingest paths resolve external ``device_id``/``sensor_id`` pairs to an
+asset and metric without touching the database: the whole registry is
+loaded into plain dicts and tuples (two queries) on first use.
+
+Changes are applied incrementally. ``post_save``/``post_delete`` on
+Device and Sensor mark the device dirty locally and, once the transaction
+commits, bump a version counter in the shared cache and record the
+device id under that version. Every process checks the counter at most
+every ``TELEMETRY_REGISTRY_SYNC_SECONDS`` and reloads only the devices
+changed since its own version (or everything, if the change log has
+expired).
+
+Queryset ``update()``/``bulk_create()``/``bulk_update()`` and raw SQL send
+no signals: code that changes registry fields (see ``DEVICE_FIELDS``, and
+sensor id, name, unit and ``is_active``) that way must call
+``registry.invalidate(pk)`` for each device it touched.
+
+Lookups read the maps under the registry lock, so a concurrent sync never
+shows them half-updated.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Device, Sensor
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL = getattr(settings, 'TELEMETRY_REGISTRY_SYNC_SECONDS', 2)
+CHANGE_LOG_TIMEOUT = 60 * 60 * 24
+
+CACHE_PREFIX = 'iot:registry'
+VERSION_KEY = f'{CACHE_PREFIX}:version'
+
+# sensors: {sensor_id: (metric, unit)} for active sensors
+DeviceEntry = namedtuple('DeviceEntry', [
+    'id', 'device_id', 'asset_id', 'organization_id', 'protocol', 'mqtt_topic', 'sensors',
+])
+
+DEVICE_FIELDS = (
+    'id', 'device_id', 'asset_id', 'asset__organization_id', 'protocol', 'configuration__mqtt_topic',
+)
+
+
+def _change_key(version):
+    return f'{CACHE_PREFIX}:change:{version}'
+
+
+class AmbiguousDevice(Exception):
+    """An external device_id matches several devices in scope."""
+
+
+class DeviceRegistry:
+    def __init__(self):
+        self._by_pk = None
+        self._by_external = {}
+        self._dirty = set()
+        self._version = 0
+        self._next_sync = 0.0
+        self._lock = threading.RLock()
+
+    # ---------------------------
+    # Loading
+    # ---------------------------
+    def _entries(self, device_ids=None):
+        devices = Device.objects.all()
+        sensors = Sensor.objects.filter(is_active=True)
+        if device_ids is not None:
+            devices = devices.filter(id__in=device_ids)
+            sensors = sensors.filter(device_id__in=device_ids)
+
+        sensor_map = {}
+        for device_id, sensor_id, name, unit in sensors.values_list(
+            'device_id', 'sensor_id', 'name', 'unit'
+        ).iterator(chunk_size=10000):
+            sensor_map.setdefault(device_id, {})[sensor_id] = (name, unit)
+
+        for pk, device_id, asset_id, organization_id, protocol, topic in devices.values_list(
+            *DEVICE_FIELDS
+        ).iterator(chunk_size=10000):
+            yield DeviceEntry(
+                pk, device_id, asset_id, organization_id, protocol,
+                topic if isinstance(topic, str) and topic else None,
+                sensor_map.get(pk, {}),
+            )
+
+    def _add(self, entry):
+        self._by_pk[entry.id] = entry
+        pks = self._by_external.get(entry.device_id, ())
+        if entry.id not in pks:
+            self._by_external[entry.device_id] = pks + (entry.id,)
+
+    def _remove(self, pk):
+        entry = self._by_pk.pop(pk, None)
+        if entry is not None:
+            pks = tuple(p for p in self._by_external.get(entry.device_id, ()) if p != pk)
+            if pks:
+                self._by_external[entry.device_id] = pks
+            else:
+                self._by_external.pop(entry.device_id, None)
+
+    def load(self):
+        """(Re)load the whole registry."""
+        version = cache.get(VERSION_KEY, 0)
+        with self._lock:
+            self._by_pk, self._by_external = {}, {}
+            for entry in self._entries():
+                self._add(entry)
+            self._dirty.clear()
+            self._version = version
+            self._next_sync = time.monotonic() + SYNC_INTERVAL
+        logger.info('Device registry loaded: %d devices', len(self._by_pk))
+
+    def _reload(self, pks):
+        entries = {entry.id: entry for entry in self._entries(pks)}
+        for pk in pks:
+            self._remove(pk)
+            if pk in entries:
+                self._add(entries[pk])
+
+    def _sync(self):
+        self._next_sync = time.monotonic() + SYNC_INTERVAL
+        version = cache.get(VERSION_KEY, 0)
+        if version < self._version:
+            # Cache was flushed; nothing to replay from
+            return self.load()
+        if version > self._version:
+            changes = cache.get_many([_change_key(v) for v in range(self._version + 1, version + 1)])
+            if len(changes) < version - self._version:
+                return self.load()
+            self._dirty.update(changes.values())
+            self._version = version
+        if self._dirty:
+            pks, self._dirty = set(self._dirty), set()
+            self._reload(pks)
+
+    def _ensure(self):
+        with self._lock:
+            if self._by_pk is None:
+                self.load()
+            elif self._dirty or time.monotonic() >= self._next_sync:
+                self._sync()
+
+    # ---------------------------
+    # Invalidation
+    # ---------------------------
+    def invalidate(self, device_pk):
+        with self._lock:
+            if self._by_pk is not None:
+                self._dirty.add(device_pk)
+        transaction.on_commit(lambda: publish_change(device_pk))
+
+    def clear(self):
+        with self._lock:
+            self._by_pk = None
+            self._by_external = {}
+            self._dirty.clear()
+
+    # ---------------------------
+    # Lookups
+    # ---------------------------
+    def get(self, pk):
+        with self._lock:
+            self._ensure()
+            return self._by_pk.get(pk)
+
+    def find(self, device_id, organization_id=None, asset_id=None):
+        """
+        Device by external ``device_id`` (or primary key), narrowed to an
+        organization and/or asset. Raises AmbiguousDevice when several match
+        and ValueError unless ``device_id`` is a string or integer.
+        """
+        if isinstance(device_id, bool) or not isinstance(device_id, (str, int)):
+            raise ValueError('device_id must be a string or integer')
+        device_id = str(device_id)
+
+        with self._lock:
+            self._ensure()
+            pks = self._by_external.get(device_id)
+            if pks is None:
+                try:
+                    entry = self._by_pk.get(uuid.UUID(device_id))
+                except ValueError:
+                    entry = None
+                pks = (entry.id,) if entry is not None else ()
+            entries = [self._by_pk[pk] for pk in pks]
+
+        matches = [
+            entry for entry in entries
+            if (organization_id is None or entry.organization_id == organization_id)
+            and (asset_id is None or entry.asset_id == asset_id)
+        ]
+        if len(matches) > 1:
+            raise AmbiguousDevice(device_id)
+        return matches[0] if matches else None
+
+    def resolve(self, device_id, sensor_id, organization_id=None, asset_id=None):
+        """(asset_id, metric, unit) for an active sensor, or None."""
+        entry = self.find(device_id, organization_id, asset_id)
+        if entry is None or sensor_id not in entry.sensors:
+            return None
+        metric, unit = entry.sensors[sensor_id]
+        return entry.asset_id, metric, unit
+
+    def devices(self, protocol=None):
+        with self._lock:
+            self._ensure()
+            entries = list(self._by_pk.values())
+        return [entry for entry in entries if protocol is None or entry.protocol == protocol]
+
+
+def publish_change(device_pk):
+    cache.add(VERSION_KEY, 0, timeout=None)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        # Evicted between add and incr; every process reloads in full
+        cache.set(VERSION_KEY, 0, timeout=None)
+        return
+    cache.set(_change_key(version), device_pk, timeout=CHANGE_LOG_TIMEOUT)
+
+
+registry = DeviceRegistry()
@@ -0,0 +1,246 @@
+"""
+Server-side resampling of one telemetry series into a bounded number of points.
+
+The range ``[since, until)`` is cut into ``buckets`` equal buckets.
+Source data is read in the cheapest form that is still exact enough:
+
+* the coarsest rollup resolution no wider than a bucket, when there is
+  one (a 30-day chart at 1000 buckets reads ~720 hourly cells, not raw
+  rows), from the rollup coverage watermark on; rollup cells are assigned
+  to buckets by their start, so a bucket edge is accurate to one rollup step;
+* raw points otherwise, and before the watermark (``iot.archive.series_arrays``,
+  which covers the row, compact and archive stores).
+
+Aggregates, all vectorized with NumPy:
+
+* ``avg``    - mean per bucket (count-weighted over rollup cells)
+* ``minmax`` - min/max envelope per bucket
+* ``lttb``   - Largest-Triangle-Three-Buckets downsampling to real points
+* ``locf``   - mean per bucket, empty buckets carry the last observation forward
+
+Empty buckets are omitted except for ``locf``, so responses never exceed
+``buckets`` points whatever the raw density.
+"""
+import numpy as np
+from django.conf import settings
+
+from .archive import series_arrays
+from .compact import from_epoch_ms, to_epoch_ms
+from .models import TelemetryRollup
+from .rollups import RESOLUTION_ORDER, RESOLUTIONS, covered_from
+
+DEFAULT_BUCKETS = getattr(settings, 'TELEMETRY_RESAMPLE_BUCKETS', 1000)
+MAX_BUCKETS = getattr(settings, 'TELEMETRY_RESAMPLE_MAX_BUCKETS', 1000)
+AGGREGATES = ('avg', 'minmax', 'lttb', 'locf')
+
+
+class SeriesCells:
+    """Per-cell arrays: raw points are cells of count 1."""
+
+    def __init__(self, ts, count, total, low, high, last, source):
+        self.ts = ts
+        self.count = count
+        self.total = total
+        self.low = low
+        self.high = high
+        self.last = last
+        self.source = source
+
+    @classmethod
+    def from_points(cls, ts, values):
+        return cls(ts, np.ones(len(ts)), values, values, values, values, 'raw')
+
+    def take(self, order):
+        return SeriesCells(
+            self.ts[order], self.count[order], self.total[order],
+            self.low[order], self.high[order], self.last[order], self.source,
+        )
+
+    def extend(self, other, source):
+        """These cells followed by ``other``'s."""
+        return SeriesCells(
+            *(np.concatenate((getattr(self, name), getattr(other, name)))
+              for name in ('ts', 'count', 'total', 'low', 'high', 'last')),
+            source,
+        )
+
+    @property
+    def mean(self):
+        return self.total / self.count
+
+    def __len__(self):
+        return len(self.ts)
+
+
+def rollup_resolution(bucket_width):
+    """Coarsest rollup resolution that fits inside one bucket, or None."""
+    for resolution in RESOLUTION_ORDER:
+        if RESOLUTIONS[resolution] <= bucket_width:
+            return resolution
+    return None
+
+
+def load_cells(asset_id, metric, since, until, buckets):
+    resolution = rollup_resolution((until - since) / buckets)
+    covered = covered_from([asset_id]) if resolution is not None else None
+    if covered is None or covered >= until:
+        ts, values = series_arrays(asset_id, metric, since, until)
+        return SeriesCells.from_points(ts, values)
+
+    rows = list(
+        TelemetryRollup.objects.filter(
+            asset_id=asset_id, metric=metric, resolution=resolution,
+            bucket__gte=max(since, covered), bucket__lt=until,
+        ).order_by('bucket').values_list(
+            'bucket', 'count', 'sum', 'min_value', 'max_value', 'last_value'
+        )
+    )
+    buckets_, count, total, low, high, last = zip(*rows) if rows else ((),) * 6
+    cells = SeriesCells(
+        np.fromiter((to_epoch_ms(b) for b in buckets_), dtype=np.int64, count=len(rows)),
+        np.asarray(count, dtype=np.float64),
+        np.asarray(total, dtype=np.float64),
+        np.asarray(low, dtype=np.float64),
+        np.asarray(high, dtype=np.float64),
+        np.asarray(last, dtype=np.float64),
+        f'rollup:{resolution}',
+    )
+    if covered <= since:
+        return cells
+    # Raw points before the coverage watermark, rollup cells after it
+    ts, values = series_arrays(asset_id, metric, since, covered)
+    return SeriesCells.from_points(ts, values).extend(cells, 'mixed')
+
+
+# -------------------------------------------------------------------
+# Aggregates
+# -------------------------------------------------------------------
+def bucket_index(ts, start_ms, end_ms, buckets):
+    span = max(end_ms - start_ms, 1)
+    return np.clip((ts - start_ms) * buckets // span, 0, buckets - 1)
+
+
+def group_aggregates(index, cells, size):
+    """
+    (count, mean, min, max, last) arrays of length ``size`` for cells
+    grouped by ``index``; NaN where a group is empty. Cells must be sorted
+    by group, then time.
+    """
+    count = np.bincount(index, weights=cells.count, minlength=size)
+    total = np.bincount(index, weights=cells.total, minlength=size)
+
+    low = np.full(size, np.inf)
+    high = np.full(size, -np.inf)
+    np.minimum.at(low, index, cells.low)
+    np.maximum.at(high, index, cells.high)
+
+    # The last cell of each group holds its last value
+    last = np.full(size, np.nan)
+    if len(index):
+        ends = np.append(index[1:] != index[:-1], True)
+        last[index[ends]] = cells.last[ends]
+
+    empty = count == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(empty, np.nan, total / count)
+    low[empty] = np.nan
+    high[empty] = np.nan
+    return count, mean, low, high, last
+
+
+def bucket_aggregates(cells, start_ms, end_ms, buckets):
+    """Per-bucket aggregates of one time-ordered series, see ``group_aggregates``."""
+    return group_aggregates(bucket_index(cells.ts, start_ms, end_ms, buckets), cells, buckets)
+
+
+def locf(mean, last):
+    """Bucket means with empty buckets filled by the last observation before them."""
+    filled = np.isnan(mean)
+    # Most recent non-empty bucket at or before each bucket (-1: none yet)
+    source = np.maximum.accumulate(np.where(filled, -1, np.arange(len(mean))))
+    carried = np.where(source >= 0, last[np.maximum(source, 0)], np.nan)
+    return np.where(filled, carried, mean), filled
+
+
+def lttb(ts, values, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets."""
+    n = len(ts)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = ts.astype(np.float64)
+    y = values
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area)) if end > start else start
+        keep[i + 1] = previous
+    return keep
+
+
+# -------------------------------------------------------------------
+# Entry point
+# -------------------------------------------------------------------
+def _iso(ms):
+    return from_epoch_ms(int(ms))
+
+
+def resample(asset_id, metric, since, until, buckets=DEFAULT_BUCKETS, aggregate='avg'):
+    if aggregate not in AGGREGATES:
+        raise ValueError(f'aggregate must be one of {", ".join(AGGREGATES)}')
+    buckets = max(1, min(int(buckets), MAX_BUCKETS))
+    start_ms, end_ms = to_epoch_ms(since), to_epoch_ms(until)
+    width_ms = max(end_ms - start_ms, 1) / buckets
+
+    cells = load_cells(asset_id, metric, since, until, buckets)
+    result = {'source': cells.source, 'bucket_seconds': width_ms / 1000.0}
+
+    if aggregate == 'lttb':
+        # Keeps real points (or rollup cell means when raw is too dense)
+        values = cells.mean
+        result['points'] = [
+            {'timestamp': _iso(cells.ts[i]), 'value': float(values[i])}
+            for i in lttb(cells.ts, values, buckets)
+        ]
+        return result
+
+    count, mean, low, high, last = bucket_aggregates(cells, start_ms, end_ms, buckets)
+    starts = start_ms + (np.arange(buckets) * width_ms).astype(np.int64)
+
+    if aggregate == 'locf':
+        values, filled = locf(mean, last)
+        points = [
+            {
+                'timestamp': _iso(starts[i]),
+                'value': None if np.isnan(values[i]) else float(values[i]),
+                'filled': bool(filled[i]),
+            }
+            for i in range(buckets)
+        ]
+    elif aggregate == 'minmax':
+        points = [
+            {'timestamp': _iso(starts[i]), 'min': float(low[i]), 'max': float(high[i]), 'count': int(count[i])}
+            for i in np.flatnonzero(count)
+        ]
+    else:
+        points = [
+            {'timestamp': _iso(starts[i]), 'value': float(mean[i]), 'count': int(count[i])}
+            for i in np.flatnonzero(count)
+        ]
+    result['points'] = points
+    return result
@@ -0,0 +1,353 @@
+"""
+Time-bucketed telemetry rollups.
+
+Every ingest batch is pre-aggregated in Python into (asset, metric,
+resolution, bucket) cells holding count / sum / min / max / last, and the
+cells are merged into ``telemetry_rollups`` with a single upsert statement
+per chunk, so concurrent ingests never read-modify-write the same rows.
+
+Read paths call ``choose_resolution`` to pick the coarsest resolution that
+still yields at least ``MIN_BUCKETS`` buckets for the requested range,
+e.g. 30 days -> 1h (720 rows), 24 hours -> 1m (1440 rows).
+
+Rollups are only trusted from the coverage watermark on (see
+``TelemetryRollupCoverage``): history stored before ingest started
+maintaining them is read raw until ``rebuild_rollups`` reaches back over it.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+
+from .compact import from_epoch_ms, reads_compact, to_epoch_ms
+from assets.models import Asset
+from .models import (
+    CompactTelemetry,
+    TelemetryChunk,
+    TelemetryData,
+    TelemetryRollup,
+    TelemetryRollupCoverage,
+)
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {
+    '1m': timedelta(minutes=1),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+# Coarsest first
+RESOLUTION_ORDER = ['1d', '1h', '1m']
+
+MIN_BUCKETS = getattr(settings, 'TELEMETRY_ROLLUP_MIN_BUCKETS', 60)
+UPSERT_CHUNK_SIZE = 500
+REBUILD_CHUNK_SIZE = 5000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def bucket_start(timestamp, resolution):
+    step = RESOLUTIONS[resolution]
+    offset = (timestamp - _EPOCH) // step
+    return _EPOCH + offset * step
+
+
+def choose_resolution(since, until=None):
+    """
+    Coarsest rollup resolution giving at least MIN_BUCKETS buckets over
+    [since, until); None when the range is short enough to read raw rows.
+    """
+    span = (until or timezone.now()) - since
+    for resolution in RESOLUTION_ORDER:
+        if span / RESOLUTIONS[resolution] >= MIN_BUCKETS:
+            return resolution
+    return None
+
+
+# -------------------------------------------------------------------
+# Aggregation
+# -------------------------------------------------------------------
+def aggregate_points(points, resolutions=RESOLUTION_ORDER):
+    """
+    Fold (asset_id, metric, timestamp, value) tuples into rollup cells.
+    Returns {(asset_id, metric, resolution, bucket): [count, sum, min, max, last_ts, last]}.
+    """
+    cells = {}
+    for asset_id, metric, timestamp, value in points:
+        value = float(value)
+        for resolution in resolutions:
+            key = (asset_id, metric, resolution, bucket_start(timestamp, resolution))
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, value, value, value, timestamp, value]
+                continue
+            cell[0] += 1
+            cell[1] += value
+            if value < cell[2]:
+                cell[2] = value
+            if value > cell[3]:
+                cell[3] = value
+            if timestamp >= cell[4]:
+                cell[4] = timestamp
+                cell[5] = value
+    return cells
+
+
+def _upsert_sql(row_count):
+    qn = connection.ops.quote_name
+    columns = [
+        'asset_id', 'metric', 'resolution', 'bucket', 'count', 'sum',
+        'min_value', 'max_value', 'last_timestamp', 'last_value',
+    ]
+    placeholders = ', '.join(['(' + ', '.join(['%s'] * len(columns)) + ')'] * row_count)
+    insert = (
+        f"INSERT INTO {qn(TelemetryRollup._meta.db_table)} "
+        f"({', '.join(qn(c) for c in columns)}) VALUES {placeholders}"
+    )
+
+    if connection.vendor == 'mysql':
+        # Assignments are applied left to right: last_value must be
+        # compared against the old last_timestamp before it is replaced.
+        return insert + (
+            " ON DUPLICATE KEY UPDATE "
+            "`count` = `count` + VALUES(`count`), "
+            "`sum` = `sum` + VALUES(`sum`), "
+            "`min_value` = LEAST(`min_value`, VALUES(`min_value`)), "
+            "`max_value` = GREATEST(`max_value`, VALUES(`max_value`)), "
+            "`last_value` = IF(VALUES(`last_timestamp`) >= `last_timestamp`, "
+            "VALUES(`last_value`), `last_value`), "
+            "`last_timestamp` = GREATEST(`last_timestamp`, VALUES(`last_timestamp`))"
+        )
+
+    # PostgreSQL / SQLite
+    table = qn(TelemetryRollup._meta.db_table)
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    return insert + (
+        ' ON CONFLICT ("asset_id", "metric", "resolution", "bucket") DO UPDATE SET '
+        f'"count" = {table}."count" + excluded."count", '
+        f'"sum" = {table}."sum" + excluded."sum", '
+        f'"min_value" = {least}({table}."min_value", excluded."min_value"), '
+        f'"max_value" = {greatest}({table}."max_value", excluded."max_value"), '
+        f'"last_value" = CASE WHEN excluded."last_timestamp" >= {table}."last_timestamp" '
+        f'THEN excluded."last_value" ELSE {table}."last_value" END, '
+        f'"last_timestamp" = {greatest}({table}."last_timestamp", excluded."last_timestamp")'
+    )
+
+
+def merge_cells(cells):
+    """Merge aggregated cells into telemetry_rollups (atomic upserts)."""
+    if not cells:
+        return 0
+
+    asset_field = TelemetryRollup._meta.get_field('asset')
+    ts_field = TelemetryRollup._meta.get_field('bucket')
+
+    def prep_ts(value):
+        return ts_field.get_db_prep_value(value, connection)
+
+    items = sorted(cells.items(), key=lambda item: (str(item[0][0]), item[0][1], item[0][2], item[0][3]))
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+            chunk = items[start:start + UPSERT_CHUNK_SIZE]
+            params = []
+            for (asset_id, metric, resolution, bucket), cell in chunk:
+                count, total, low, high, last_ts, last = cell
+                params.extend([
+                    asset_field.get_db_prep_value(asset_id, connection),
+                    metric, resolution, prep_ts(bucket),
+                    count, total, low, high, prep_ts(last_ts), last,
+                ])
+            cursor.execute(_upsert_sql(len(chunk)), params)
+    return len(items)
+
+
+def update_rollups(rows):
+    """Fold freshly ingested TelemetryData rows into the rollup tables."""
+    if rows:
+        _ensure_floor(rows)
+    return merge_cells(aggregate_points(
+        (row.asset_id, row.metric, row.timestamp, row.value) for row in rows
+    ))
+
+
+# -------------------------------------------------------------------
+# Coverage
+# -------------------------------------------------------------------
+def _has_other_points(rows):
+    """True when telemetry other than ``rows`` is already stored."""
+    if TelemetryChunk.objects.exists():
+        return True
+    if reads_compact():
+        stored = CompactTelemetry.objects.exclude(ts__in={to_epoch_ms(row.timestamp) for row in rows})
+    else:
+        stored = TelemetryData.objects.exclude(pk__in=[row.pk for row in rows])
+    return stored.exists()
+
+
+def _ensure_floor(rows):
+    """
+    Start global coverage the first time ingest maintains rollups: from
+    the beginning on an empty store, else from the next whole day (earlier
+    days may hold points the rollups never saw).
+    """
+    if TelemetryRollupCoverage.objects.filter(asset__isnull=True).exists():
+        return
+    covered_from = _EPOCH
+    if _has_other_points(rows):
+        covered_from = bucket_start(timezone.now(), '1d') + RESOLUTIONS['1d']
+    TelemetryRollupCoverage.objects.create(covered_from=covered_from)
+
+
+def rollup_coverage(asset_ids):
+    """
+    {asset_id: start of rollup coverage, or None when nothing is covered}.
+    An asset is covered from its own watermark or the global floor,
+    whichever is earlier.
+    """
+    marks = dict(
+        TelemetryRollupCoverage.objects
+        .filter(Q(asset__isnull=True) | Q(asset_id__in=asset_ids))
+        .order_by('covered_from')
+        .values_list('asset_id', 'covered_from')
+    )
+    floor = marks.get(None)
+    coverage = {}
+    for asset_id in asset_ids:
+        starts = [mark for mark in (floor, marks.get(asset_id)) if mark is not None]
+        coverage[asset_id] = min(starts) if starts else None
+    return coverage
+
+
+def covered_from(asset_ids):
+    """Start of the range rollups cover for all of ``asset_ids``, or None."""
+    starts = rollup_coverage(asset_ids).values()
+    if not starts or None in starts:
+        return None
+    return max(starts)
+
+
+def organization_coverage(organization_id, asset_id=None):
+    """``covered_from`` over one asset, or every asset of the organization."""
+    asset_ids = [asset_id] if asset_id else list(
+        Asset.objects.filter(organization_id=organization_id).values_list('id', flat=True)
+    )
+    return covered_from(asset_ids) if asset_ids else None
+
+
+def _extend_coverage(since, until, asset_ids):
+    """
+    After a rebuild of [since, until), move coverage back to ``since``
+    where the rebuilt range reaches the existing coverage (or now).
+    """
+    now = timezone.now()
+    if asset_ids is None:
+        floors = TelemetryRollupCoverage.objects.filter(asset__isnull=True)
+        floor = floors.aggregate(floor=Max('covered_from'))['floor']
+        if floor is None:
+            if until >= now:
+                TelemetryRollupCoverage.objects.create(covered_from=since)
+        elif until >= floor:
+            floors.filter(covered_from__gt=since).update(covered_from=since, updated_at=now)
+        return
+
+    for asset_id, start in rollup_coverage(asset_ids).items():
+        if until >= (start or now) and (start is None or since < start):
+            TelemetryRollupCoverage.objects.update_or_create(
+                asset_id=asset_id, defaults={'covered_from': since},
+            )
+
+
+def _stored_points(since, until, asset_ids=None):
+    """
+    (asset_id, metric, timestamp, value) for every stored point in
+    [since, until): archived chunks plus the hot store reads are served from.
+    """
+    from .archive import decode_chunk
+
+    chunks = TelemetryChunk.objects.filter(day__gte=since.date(), day__lt=until.date())
+    if asset_ids is not None:
+        chunks = chunks.filter(series__asset_id__in=asset_ids)
+    for chunk in chunks.select_related('series').iterator(chunk_size=100):
+        ts, values = decode_chunk(chunk)
+        asset_id, metric = chunk.series.asset_id, chunk.series.metric
+        for point_ts, value in zip(ts.tolist(), values.tolist()):
+            yield asset_id, metric, from_epoch_ms(point_ts), value
+
+    if reads_compact():
+        hot = CompactTelemetry.objects.filter(ts__gte=to_epoch_ms(since), ts__lt=to_epoch_ms(until))
+        if asset_ids is not None:
+            hot = hot.filter(series__asset_id__in=asset_ids)
+        points = hot.order_by().values_list('series__asset_id', 'series__metric', 'ts', 'value')
+        for asset_id, metric, ts, value in points.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+            yield asset_id, metric, from_epoch_ms(ts), value
+        return
+
+    raw = TelemetryData.objects.filter(timestamp__gte=since, timestamp__lt=until)
+    if asset_ids is not None:
+        raw = raw.filter(asset_id__in=asset_ids)
+    points = raw.order_by().values_list('asset_id', 'metric', 'timestamp', 'value')
+    yield from points.iterator(chunk_size=REBUILD_CHUNK_SIZE)
+
+
+def rebuild_rollups(since, until, asset_ids=None):
+    """
+    Recompute rollups for [since, until) from stored telemetry (backfill /
+    repair), including archived days and the compact store. The range is
+    widened to whole days so no bucket is left half-rebuilt.
+    """
+    since = bucket_start(since, '1d')
+    until = bucket_start(until, '1d') + RESOLUTIONS['1d']
+
+    rollups = TelemetryRollup.objects.filter(bucket__gte=since, bucket__lt=until)
+    if asset_ids is not None:
+        rollups = rollups.filter(asset_id__in=asset_ids)
+
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        merged = 0
+        for point in _stored_points(since, until, asset_ids):
+            batch.append(point)
+            if len(batch) >= REBUILD_CHUNK_SIZE:
+                merged += merge_cells(aggregate_points(batch))
+                batch = []
+        merged += merge_cells(aggregate_points(batch))
+        _extend_coverage(since, until, asset_ids)
+
+    logger.info('Rebuilt %d telemetry rollup cells for %s..%s', merged, since, until)
+    return merged
+
+
+# -------------------------------------------------------------------
+# Query helpers
+# -------------------------------------------------------------------
+def rollup_queryset(resolution, since, until=None):
+    queryset = TelemetryRollup.objects.filter(
+        resolution=resolution,
+        bucket__gte=bucket_start(since, resolution),
+    )
+    if until is not None:
+        queryset = queryset.filter(bucket__lt=until)
+    return queryset
+
+
+def rollup_statistics(queryset):
+    """
+    Same keys as the raw ``statistics`` aggregate. Bounds are aligned to
+    the rollup bucket, so the first bucket may include slightly older points.
+    """
+    stats = queryset.aggregate(
+        count=Sum('count'),
+        total=Sum('sum'),
+        max_value=Max('max_value'),
+        min_value=Min('min_value'),
+        latest_timestamp=Max('last_timestamp'),
+    )
+    count = stats['count'] or 0
+    total = stats.pop('total')
+    stats['count'] = count
+    stats['avg_value'] = total / count if count else None
+    return stats
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import (
     TelemetryData,
+    TelemetryRollup,
     Alert,
     Device,
     Sensor,
@@ -13,6 +14,25 @@ class TelemetryDataSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class TelemetryRollupSerializer(serializers.ModelSerializer):
+    # Chart clients read timestamp/value from raw points; rollups keep those keys
+    timestamp = serializers.DateTimeField(source='bucket', read_only=True)
+    value = serializers.FloatField(source='avg_value', read_only=True)
+
+    class Meta:
+        model = TelemetryRollup
+        fields = [
+            'timestamp',
+            'value',
+            'resolution',
+            'count',
+            'min_value',
+            'max_value',
+            'last_value',
+            'last_timestamp',
+        ]
+
+
 class AlertSerializer(serializers.ModelSerializer):
     class Meta:
         model = Alert
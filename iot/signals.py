@@ -1,8 +1,40 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Alert, TelemetryData
+import logging
+
+import numpy as np
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .models import Alert, Device, Sensor, TelemetryData, TelemetrySeries
+from .registry import registry
+from . import lastvalue
+from .compact import forget_series
+from .fanout import publish_telemetry
+from .rollups import update_rollups
 from core.models import AuditLog
 
+logger = logging.getLogger(__name__)
+
+# Sent once per ingested batch from inside the write transaction, like
+# post_save. Row-level signals never fire for telemetry (bulk_create), so
+# everything that reacts to new points hooks in here. Receivers that talk to
+# caches, brokers or clients should defer their work to transaction.on_commit.
+#
+# kwargs: rows (TelemetryData), ids, asset_ids, metrics, values (float64
+# ndarray) and timestamps, all aligned by index.
+telemetry_batch_ingested = Signal()
+
+
+def send_batch_ingested(rows, ids):
+    telemetry_batch_ingested.send(
+        sender=TelemetryData,
+        rows=rows,
+        ids=ids,
+        asset_ids=[row.asset_id for row in rows],
+        metrics=[row.metric for row in rows],
+        values=np.fromiter((row.value for row in rows), dtype=np.float64, count=len(rows)),
+        timestamps=[row.timestamp for row in rows],
+    )
+
 @receiver(post_save, sender=Alert)
 def alert_created_handler(sender, instance, created, **kwargs):
     if created:
@@ -25,9 +57,72 @@ def alert_created_handler(sender, instance, created, **kwargs):
         # Here you could add notification logic
         # send_alert_notification.delay(str(instance.id))
 
+# -------------------------------------------------------------------
+# Telemetry batch hooks
+# -------------------------------------------------------------------
+def _update_last_values(rows, ids):
+    try:
+        lastvalue.record(rows, ids)
+    except Exception:
+        # Reads rebuild missing rings from the database
+        logger.exception('Could not update last-value cache for %d telemetry points', len(rows))
+
+
+def _schedule_anomaly_check(rows, ids):
+    from .tasks import check_telemetry_batch_anomalies
+
+    points = [
+        [telemetry_id, str(row.asset_id), row.metric, str(row.value), row.timestamp.isoformat()]
+        for telemetry_id, row in zip(ids, rows)
+    ]
+    try:
+        check_telemetry_batch_anomalies.delay(points)
+    except Exception:
+        # The batch is committed; never fail ingest because the broker is down
+        logger.exception('Could not queue anomaly check for %d telemetry points', len(rows))
+
+
+@receiver(telemetry_batch_ingested)
+def telemetry_batch_rollups(sender, rows, **kwargs):
+    # Inside the transaction: rollups commit or roll back with the points
+    update_rollups(rows)
+
+
 @receiver(post_save, sender=TelemetryData)
-def telemetry_anomaly_check(sender, instance, created, **kwargs):
-    if created:
-        # Basic anomaly detection
-        from .tasks import check_telemetry_anomaly
-        check_telemetry_anomaly.delay(str(instance.id))
+def telemetry_saved_rollups(sender, instance, created, raw=False, **kwargs):
+    # A point saved on its own bypasses the batch signal; rollups must
+    # still hold it or the coverage watermark would be wrong
+    if created and not raw:
+        update_rollups([instance])
+
+
+@receiver(telemetry_batch_ingested)
+def telemetry_batch_last_values(sender, rows, ids, **kwargs):
+    transaction.on_commit(lambda: _update_last_values(rows, ids))
+
+
+@receiver(telemetry_batch_ingested)
+def telemetry_batch_fanout(sender, rows, **kwargs):
+    transaction.on_commit(lambda: publish_telemetry(rows))
+
+
+@receiver(telemetry_batch_ingested)
+def telemetry_batch_anomaly_check(sender, rows, ids, **kwargs):
+    # One Celery message per batch
+    transaction.on_commit(lambda: _schedule_anomaly_check(rows, ids))
+
+
+@receiver([post_save, post_delete], sender=Device)
+def device_registry_invalidate(sender, instance, **kwargs):
+    registry.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Sensor)
+def sensor_registry_invalidate(sender, instance, **kwargs):
+    registry.invalidate(instance.device_id)
+
+
+@receiver(post_delete, sender=TelemetrySeries)
+def telemetry_series_forget(sender, instance, **kwargs):
+    # Also fires for series removed with their asset (cascade)
+    forget_series(instance.asset_id, instance.metric)
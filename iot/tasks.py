@@ -1,91 +1,145 @@
 from celery import shared_task
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import timedelta
-from decimal import Decimal, getcontext
+from decimal import Decimal
 import logging
+import uuid
 
 from .models import TelemetryData, Alert
+from .anomaly import save_windows, score_batch
+from .anomaly import ANOMALY_STD_THRESHOLD, HISTORY_LIMIT, MIN_HISTORY_REQUIRED  # noqa: F401
+from .rollups import rebuild_rollups
+from .archive import ARCHIVE_AFTER_DAYS, archive_cold_telemetry as archive_cold_days
+from .commands import STALE_AFTER, expire_stale_commands as expire_commands
 
 logger = logging.getLogger(__name__)
 
-# Ensure high precision for Decimal calculations
-getcontext().prec = 28
 
-ANOMALY_STD_THRESHOLD = Decimal('3.0')
-HISTORY_LIMIT = 20
-MIN_HISTORY_REQUIRED = 10
+def _detect_and_alert(rows):
+    # Windows are saved only once the alerts exist: a retry scores the batch
+    # again from the previous state instead of pushing its points twice
+    anomalies, windows = score_batch(rows)
+    created = _raise_anomaly_alerts(anomalies)
+    save_windows(windows)
+    return created
+
+
+def _raise_anomaly_alerts(anomalies):
+    if not anomalies:
+        return 0
+
+    # Prevent duplicate anomaly alerts (task retries)
+    flagged_ids = [str(row['id']) for row, _ in anomalies]
+    existing = set(
+        Alert.objects.filter(
+            source='anomaly_detection',
+            metadata__telemetry_id__in=flagged_ids,
+        ).values_list('metadata__telemetry_id', flat=True)
+    )
+
+    created = 0
+    for row, anomaly in anomalies:
+        telemetry_id = str(row['id'])
+        if telemetry_id in existing:
+            continue
+
+        Alert.objects.create(
+            asset_id=row['asset_id'],
+            title=f"Anomaly detected: {row['metric']}",
+            message=(
+                f"Value {row['value']} deviates significantly from "
+                f"expected average {anomaly['average']}"
+            ),
+            severity='warning',
+            source='anomaly_detection',
+            metadata={
+                'telemetry_id': telemetry_id,
+                'metric': row['metric'],
+                'value': str(row['value']),
+                'average': str(anomaly['average']),
+                'std_dev': str(anomaly['std_dev']),
+                'threshold': str(anomaly['threshold']),
+            }
+        )
+        created += 1
+
+    return created
 
 
 @shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=30, retry_kwargs={'max_retries': 3})
 def check_telemetry_anomaly(self, telemetry_id):
     """
-    Detect simple statistical anomalies for telemetry data.
-    Runs asynchronously after telemetry ingestion.
+    Detect simple statistical anomalies for a single telemetry row.
+    Kept for per-row producers; uses the streaming detector state.
     """
     try:
-        telemetry = TelemetryData.objects.select_related('asset').get(id=telemetry_id)
-
-        since = timezone.now() - timedelta(hours=24)
-
-        historical_qs = (
+        rows = list(
             TelemetryData.objects
-            .filter(
-                asset=telemetry.asset,
-                metric=telemetry.metric,
-                timestamp__gte=since
-            )
-            .exclude(id=telemetry.id)
-            .order_by('-timestamp')[:HISTORY_LIMIT]
+            .filter(id=telemetry_id)
+            .values('id', 'asset_id', 'metric', 'value', 'timestamp')
         )
+        if not rows:
+            logger.warning(f"Telemetry {telemetry_id} not found for anomaly check")
+            return 0
 
-        values = [t.value for t in historical_qs]
-
-        if len(values) < MIN_HISTORY_REQUIRED:
-            return  # Not enough data for anomaly detection
-
-        avg_value = sum(values) / Decimal(len(values))
-
-        variance = sum((v - avg_value) ** 2 for v in values) / Decimal(len(values))
-        std_dev = variance.sqrt()
-
-        if std_dev == 0:
-            return  # Avoid division by zero / meaningless anomaly
-
-        threshold = ANOMALY_STD_THRESHOLD * std_dev
-
-        if abs(telemetry.value - avg_value) > threshold:
-            # Prevent duplicate anomaly alerts
-            exists = Alert.objects.filter(
-                asset=telemetry.asset,
-                source='anomaly_detection',
-                metadata__telemetry_id=str(telemetry.id)
-            ).exists()
-
-            if exists:
-                return
-
-            Alert.objects.create(
-                asset=telemetry.asset,
-                title=f'Anomaly detected: {telemetry.metric}',
-                message=(
-                    f'Value {telemetry.value} deviates significantly from '
-                    f'expected average {avg_value}'
-                ),
-                severity='warning',
-                source='anomaly_detection',
-                metadata={
-                    'telemetry_id': str(telemetry.id),
-                    'metric': telemetry.metric,
-                    'value': str(telemetry.value),
-                    'average': str(avg_value),
-                    'std_dev': str(std_dev),
-                    'threshold': str(threshold),
-                }
-            )
-
-    except TelemetryData.DoesNotExist:
-        logger.warning(f"Telemetry {telemetry_id} not found for anomaly check")
+        return _detect_and_alert(rows)
+
+    except Exception as exc:
+        logger.exception("Telemetry anomaly detection failed")
+        raise exc
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=30, retry_kwargs={'max_retries': 3})
+def check_telemetry_batch_anomalies(self, points):
+    """
+    Detect statistical anomalies for a whole ingest batch.
+    ``points`` carry [id, asset_id, metric, value, timestamp] so the batch
+    is never re-read; per-series statistics come from the streaming
+    detector state (see iot.anomaly).
+    """
+    try:
+        rows = [
+            {
+                'id': telemetry_id,
+                'asset_id': uuid.UUID(asset_id),
+                'metric': metric,
+                'value': Decimal(value),
+                'timestamp': parse_datetime(timestamp),
+            }
+            for telemetry_id, asset_id, metric, value, timestamp in points
+        ]
+        return _detect_and_alert(rows)
 
     except Exception as exc:
         logger.exception("Telemetry anomaly detection failed")
         raise exc
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=60, retry_kwargs={'max_retries': 3})
+def rebuild_telemetry_rollups(self, hours=24, asset_ids=None):
+    """
+    Recompute rollups from raw telemetry for the last ``hours``.
+    Ingest keeps rollups current; this backfills history and repairs
+    rows written outside the ingest pipeline.
+    """
+    until = timezone.now()
+    return rebuild_rollups(until - timedelta(hours=hours), until, asset_ids=asset_ids)
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=300, retry_kwargs={'max_retries': 3})
+def archive_cold_telemetry(self, after_days=ARCHIVE_AFTER_DAYS):
+    """
+    Compact whole days older than ``after_days`` into columnar chunks
+    (see iot.archive). Safe to re-run; already archived days are skipped.
+    """
+    return archive_cold_days(after_days)
+
+
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=60, retry_kwargs={'max_retries': 3})
+def expire_stale_commands(self, stale_after=STALE_AFTER):
+    """
+    Time out commands no gateway delivered or acknowledged within
+    ``stale_after`` seconds (see iot.commands). Schedule periodically.
+    """
+    return expire_commands(stale_after)
@@ -1,11 +1,55 @@
+from django.db import DatabaseError, transaction
 from django.test import TestCase
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 from decimal import Decimal
+import json
+import uuid
+from unittest import mock
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+from rest_framework import status
 
 from core.models import Organization
-from assets.models import Asset, AssetType
-from iot.models import TelemetryData, Alert, Device
+from assets.models import Asset, AssetMetric, AssetType
+from iot.models import TelemetryData, Alert, Device, Command
+from iot.ingest import build_telemetry_rows, ingest_telemetry
+from iot.anomaly import SeriesWindow, _load_window, detect_batch, series_cache_key
+from iot.tasks import check_telemetry_batch_anomalies
+from iot.models import TelemetryRollup, TelemetryRollupCoverage
+from iot.rollups import choose_resolution, rebuild_rollups
+from iot.compact import _series_ids, compact_points, resolve_series, series_for, write_compact
+from iot.serializers import AlertSerializer, TelemetryDataSerializer
+from iot.fastjson import dumps
+from iot.views import ALERT_ROWS, TELEMETRY_ROWS
+from rest_framework.renderers import JSONRenderer
+from iot.archive import archive_cold_telemetry, archive_day, build_chunk, decode_timestamps, decode_values, encode_timestamps, encode_values, series_arrays
+from iot.lastvalue import clear_local, latest_points
+from iot.fanout import TelemetryFanout, asset_group, encode_frame, merge_frames
+from iot.backpressure import QueueOverflow, SendQueue
+from iot import metrics
+from iot.mqtt import InMemoryMQTTClient, MQTTGateway
+from iot.models import Sensor
+from iot.modbus import ModbusPoller, ModbusSimulator, job_key, load_poll_plan
+from iot.registry import AmbiguousDevice, registry
+from iot.heartbeat import HeartbeatTracker, write_device_status
+from iot.wheel import TimingWheel
+from iot.commands import CommandDispatcher, expire_stale_commands, issue_commands
+from iot.signals import telemetry_batch_ingested
+from iot.consumers import TelemetryConsumer
+from iot.resample import resample
+from iot.query import query_series
+from iot.quality import asset_quality, score_rows
+from iot.models import CompactTelemetry, SeriesQuality, SeriesQualityDay, TelemetryChunk, TelemetrySeries
+from core.retention import RETENTION_TARGETS, apply_retention, plan_retention
+from core.audit import audit_buffer
+import asyncio
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from asgiref.testing import ApplicationCommunicator
+from django.test import override_settings
+import numpy as np
 
 User = get_user_model()
 
@@ -94,3 +138,1327 @@ class AlertModelTest(TestCase):
         self.assertFalse(alert.acknowledged)
         self.assertFalse(alert.resolved)
         self.assertEqual(alert.asset, self.asset)
+
+
+class TelemetryTestMixin:
+    """Organization, operator and asset shared by the telemetry feature tests."""
+
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Test Org',
+            domain='testorg.com',
+            slug='testorg',
+            contact_email='test@testorg.com',
+        )
+
+        self.user = User.objects.create_user(
+            email='gateway@test.com',
+            password='Test@12345',
+            organization=self.org,
+            role='operator',
+        )
+
+        self.asset_type = AssetType.objects.create(
+            name='Test Type',
+            category='electronic',
+        )
+
+        self.asset = Asset.objects.create(
+            asset_id='ASSET003',
+            name='Test Asset',
+            asset_type=self.asset_type,
+            organization=self.org,
+            created_by=self.user,
+        )
+
+
+class TelemetryIngestTest(TelemetryTestMixin, APITestCase):
+    def test_build_rows_resolves_assets_and_reports_errors(self):
+        result = build_telemetry_rows(self.org, [
+            {'asset': str(self.asset.id), 'metric': 'temperature', 'value': 21.5},
+            {'asset_id': 'ASSET003', 'metric': 'pressure', 'value': '1.2'},
+            {'asset_id': 'UNKNOWN', 'metric': 'pressure', 'value': 1},
+            {'asset_id': 'ASSET003', 'metric': 'pressure', 'value': 'abc'},
+        ])
+
+        self.assertEqual(result.accepted, 2)
+        self.assertEqual(result.rejected, 2)
+        self.assertEqual([e['index'] for e in result.errors], [2, 3])
+        self.assertEqual(result.rows[1].value, Decimal('1.200000'))
+
+    def test_build_rows_rejects_out_of_range_values_and_timestamps(self):
+        result = build_telemetry_rows(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 1e30},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': '-1e400'},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 1, 'timestamp': 1e20},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 1, 'timestamp': 1e300},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 99999999.9999999},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 2},
+        ])
+
+        self.assertEqual(result.accepted, 1)
+        self.assertEqual(
+            [e['error'] for e in result.errors],
+            ['value out of range'] * 2 + ['timestamp out of range'] * 2 + ['value out of range'],
+        )
+
+    def test_ingest_writes_rows(self):
+        ingest_telemetry(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': i}
+            for i in range(50)
+        ])
+        self.assertEqual(TelemetryData.objects.filter(asset=self.asset).count(), 50)
+
+    def test_ingest_endpoint_accepts_ndjson(self):
+        self.client.force_authenticate(user=self.user)
+        body = '\n'.join(
+            '{"asset_id": "ASSET003", "metric": "temperature", "value": %d}' % i
+            for i in range(3)
+        )
+        response = self.client.post(
+            '/api/iot/telemetry/ingest/',
+            data=body,
+            content_type='application/x-ndjson',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 3)
+
+
+class TelemetryRollupTest(TelemetryTestMixin, APITestCase):
+    def test_ingest_maintains_rollups(self):
+        base = timezone.now().replace(minute=0, second=0, microsecond=0)
+        points = [
+            {
+                'asset_id': 'ASSET003',
+                'metric': 'temperature',
+                'value': value,
+                'timestamp': (base + timedelta(seconds=10 * i)).isoformat(),
+            }
+            for i, value in enumerate([5, 1, 9, 3])
+        ]
+        ingest_telemetry(self.org, points[:2])
+        ingest_telemetry(self.org, points[2:])
+
+        minute = TelemetryRollup.objects.get(asset=self.asset, resolution='1m')
+        self.assertEqual(minute.count, 4)
+        self.assertEqual(minute.sum, 18.0)
+        self.assertEqual((minute.min_value, minute.max_value), (1.0, 9.0))
+        self.assertEqual(minute.last_value, 3.0)
+        self.assertEqual(
+            TelemetryRollup.objects.filter(asset=self.asset).count(), 3
+        )
+
+        rebuild_rollups(base, base + timedelta(minutes=1))
+        rebuilt = TelemetryRollup.objects.get(asset=self.asset, resolution='1h')
+        self.assertEqual((rebuilt.count, rebuilt.sum, rebuilt.last_value), (4, 18.0, 3.0))
+
+    def test_rollups_are_read_only_from_their_coverage_watermark(self):
+        start = (timezone.now() - timedelta(days=3)).replace(minute=0, second=0, microsecond=0)
+        # History stored before ingest maintained any rollups
+        TelemetryData.objects.bulk_create([
+            TelemetryData(asset=self.asset, metric='temperature', value=1, timestamp=start + timedelta(minutes=i))
+            for i in range(3)
+        ])
+        ingest_telemetry(self.org, [{'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 5,
+                                     'timestamp': timezone.now().isoformat()}])
+        floor = TelemetryRollupCoverage.objects.get(asset__isnull=True).covered_from
+        self.assertGreater(floor, timezone.now())
+
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/iot/telemetry/statistics/?metric=temperature&time_range=7d')
+        self.assertEqual(response.data['count'], 4)
+        until = start + timedelta(hours=2)
+        self.assertEqual(resample(self.asset.id, 'temperature', start, until, buckets=4)['source'], 'raw')
+
+        rebuild_rollups(start, timezone.now())
+        self.assertLessEqual(
+            TelemetryRollupCoverage.objects.get(asset__isnull=True).covered_from, start
+        )
+        self.assertEqual(resample(self.asset.id, 'temperature', start, until, buckets=4)['source'], 'rollup:1m')
+        result = query_series([(self.asset.id, 'temperature')], start, until, buckets=4, aggregate='count')
+        self.assertEqual((result['source'], result['series'][0]['values']), ('rollup:1m', [3, 0, 0, 0]))
+
+        # Coverage starting mid-range: rollups after the watermark, raw points before it
+        TelemetryRollupCoverage.objects.filter(asset__isnull=True).update(covered_from=start + timedelta(hours=1))
+        TelemetryData.objects.bulk_create([TelemetryData(asset=self.asset, metric='temperature', value=7,
+                                                         timestamp=start + timedelta(minutes=90))])
+        result = query_series([(self.asset.id, 'temperature')], start, until, buckets=4, aggregate='count')
+        self.assertEqual((result['source'], result['series'][0]['values']), ('mixed', [3, 0, 0, 0]))
+        cells = resample(self.asset.id, 'temperature', start, until, buckets=4)
+        self.assertEqual((cells['source'], len(cells['points'])), ('mixed', 1))
+
+    def test_sensor_telemetry_returns_raw_points_unless_a_resolution_is_requested(self):
+        device = Device.objects.create(device_id='dev-3', asset=self.asset, device_type='sensor', protocol='mqtt')
+        sensor = Sensor.objects.create(device=device, sensor_id='t-1', name='temperature',
+                                       sensor_type='temperature', unit='C', sampling_rate=1.0)
+        base = timezone.now() - timedelta(hours=2)
+        ingest_telemetry(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': i,
+             'timestamp': (base + timedelta(minutes=i)).isoformat()}
+            for i in range(3)
+        ])
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+        url = f'/api/iot/sensors/{sensor.pk}/telemetry/'
+
+        response = self.client.get(url)
+        self.assertEqual([p['value'] for p in response.data['results']], ['0.000000', '1.000000', '2.000000'])
+
+        response = self.client.get(url, {'resolution': 'auto'})
+        self.assertEqual([r['count'] for r in response.data], [1, 1, 1])
+
+        # Outside rollup coverage 'auto' falls back to raw points
+        TelemetryRollupCoverage.objects.all().delete()
+        response = self.client.get(url, {'resolution': 'auto'})
+        self.assertEqual(len(response.data['results']), 3)
+
+        # Archived and compact points page with the same keyset shape
+        old = timezone.now() - timedelta(days=40)
+        ingest_telemetry(self.org, [{'asset_id': 'ASSET003', 'metric': 'temperature', 'value': -1,
+                                     'timestamp': old.isoformat()}])
+        archive_day(old.date())
+
+        def pages(params):
+            values, cursor = [], None
+            while True:
+                response = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})})
+                self.assertEqual(list(response.data), ['next', 'next_cursor', 'results'])
+                values.extend(float(p['value']) for p in response.data['results'])
+                cursor = response.data['next_cursor']
+                if cursor is None:
+                    return values
+
+        self.assertEqual(pages({'time_range': '90d', 'page_size': 2}), [-1, 0, 1, 2])
+
+        with mock.patch('iot.compact.STORAGE_MODE', 'compact'):
+            write_compact(build_telemetry_rows(self.org, [
+                {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 10 + i,
+                 'timestamp': (base + timedelta(minutes=i)).isoformat()}
+                for i in range(3)
+            ]).rows)
+            self.assertEqual(pages({'time_range': '90d', 'page_size': 2}), [-1, 10, 11, 12])
+
+    def test_choose_resolution(self):
+        now = timezone.now()
+        self.assertEqual(choose_resolution(now - timedelta(days=30), now), '1h')
+        self.assertEqual(choose_resolution(now - timedelta(days=1), now), '1m')
+        self.assertIsNone(choose_resolution(now - timedelta(minutes=30), now))
+
+
+class CompactTelemetryTest(TelemetryTestMixin, APITestCase):
+    def test_compact_store_round_trips_through_serializer(self):
+        rows = build_telemetry_rows(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 21.25, 'unit': 'C'},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 22.5, 'unit': 'C',
+             'timestamp': (timezone.now() + timedelta(seconds=1)).isoformat()},
+        ]).rows
+        write_compact(rows)
+
+        points = compact_points(series_for(asset_ids=[self.asset.id]), descending=True)
+        data = TelemetryDataSerializer(points, many=True).data
+
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[0]['value'], '22.500000')
+        self.assertEqual(data[0]['asset'], self.asset.id)
+        self.assertEqual(data[0]['unit'], 'C')
+
+    def test_compact_ingest_reports_duplicates_instead_of_their_ids(self):
+        stamp = timezone.now().isoformat()
+        received = []
+        telemetry_batch_ingested.connect(lambda sender, **kw: received.append(kw['ids']), weak=False,
+                                         dispatch_uid='test-duplicates')
+        self.addCleanup(telemetry_batch_ingested.disconnect, dispatch_uid='test-duplicates')
+        with mock.patch('iot.compact.STORAGE_MODE', 'compact'):
+            ingest_telemetry(self.org, [{'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 1,
+                                         'timestamp': stamp}])
+            result = ingest_telemetry(self.org, [
+                {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': v, 'timestamp': stamp}
+                for v in (2, 3)
+            ] + [{'asset_id': 'ASSET003', 'metric': 'pressure', 'value': 4, 'timestamp': stamp}])
+
+        self.assertEqual((result.accepted, result.duplicates), (3, 2))
+        self.assertEqual(len(received[1]), 1)
+        self.assertEqual(sorted(CompactTelemetry.objects.values_list('value', flat=True)), [1.0, 4.0])
+
+    def test_series_ids_are_cached_only_after_commit(self):
+        key = (self.asset.id, 'flow')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            resolve_series({key: 'l/s'})
+            raise RuntimeError
+        self.assertNotIn(key, _series_ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            series = resolve_series({key: 'l/s'})
+        self.assertEqual(_series_ids[key], series[key])
+        self.assertTrue(TelemetrySeries.objects.filter(pk=series[key]).exists())
+
+    def test_compact_mode_lists_and_exports_compact_points(self):
+        TelemetryData.objects.bulk_create([TelemetryData(asset=self.asset, metric='temperature', value=99)])
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+        with mock.patch('iot.compact.STORAGE_MODE', 'compact'):
+            ingest_telemetry(self.org, [
+                {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': i,
+                 'timestamp': (timezone.now() - timedelta(minutes=i)).isoformat()}
+                for i in range(5)
+            ])
+
+            values, url = [], '/api/iot/telemetry/?page_size=2&metric=temperature'
+            while url:
+                response = self.client.get(url)
+                values.extend(float(p['value']) for p in response.data['results'])
+                url = response.data['next']
+            self.assertEqual(values, [0, 1, 2, 3, 4])
+
+            with mock.patch('iot.export.EXPORT_CHUNK_SIZE', 2):
+                response = self.client.get('/api/iot/telemetry/?export=csv')
+                lines = b''.join(response.streaming_content).decode().splitlines()[1:]
+            self.assertEqual([float(line.split(',')[3]) for line in lines], [4, 3, 2, 1, 0])
+
+            response = self.client.get('/api/iot/telemetry/statistics/?metric=temperature')
+            self.assertEqual(response.data['count'], 5)
+
+    def test_compact_mode_rebuilds_rollups_and_windows_from_stored_points(self):
+        old = (timezone.now() - timedelta(days=40)).replace(hour=12, minute=0, second=0, microsecond=0)
+        now = timezone.now().replace(second=0, microsecond=0) - timedelta(minutes=30)
+        with mock.patch('iot.compact.STORAGE_MODE', 'compact'):
+            write_compact(build_telemetry_rows(self.org, [
+                {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': v,
+                 'timestamp': (start + timedelta(seconds=i)).isoformat()}
+                for start in (old, now) for i, v in enumerate([1, 2, 3])
+            ]).rows)
+            archive_day(old.date())
+            self.assertFalse(TelemetryData.objects.exists())
+
+            rebuild_rollups(old, now)
+            days = TelemetryRollup.objects.filter(asset=self.asset, resolution='1d').order_by('bucket')
+            self.assertEqual([(d.count, d.sum) for d in days], [(3, 6.0), (3, 6.0)])
+
+            window = _load_window(self.asset.id, 'temperature', now + timedelta(minutes=1))
+            self.assertEqual([v for _, v in window.points], [Decimal('1.000000'), Decimal('2.000000'),
+                                                             Decimal('3.000000')])
+
+        TelemetrySeries.objects.filter(asset=self.asset).delete()
+        self.assertNotIn((self.asset.id, 'temperature'), _series_ids)
+
+
+class TelemetryArchiveTest(TelemetryTestMixin, APITestCase):
+    def test_archive_day_moves_rows_into_chunks(self):
+        day = (timezone.now() - timedelta(days=40)).date()
+        start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+        ingest_telemetry(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 20 + i,
+             'timestamp': (start + timedelta(minutes=i)).isoformat()}
+            for i in range(10)
+        ])
+
+        self.assertEqual(archive_day(day), 1)
+        self.assertFalse(TelemetryData.objects.filter(asset=self.asset).exists())
+
+        ts, values = series_arrays(self.asset.id, 'temperature', start, start + timedelta(days=1))
+        self.assertEqual(values.tolist(), [20.0 + i for i in range(10)])
+        self.assertEqual(int(ts[1] - ts[0]), 60000)
+
+    def test_archive_cold_telemetry_visits_only_days_with_points(self):
+        ingest_telemetry(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 1, 'timestamp': '1970-01-02T00:00:00Z'},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 2,
+             'timestamp': (timezone.now() - timedelta(days=40)).isoformat()},
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 3},
+        ])
+
+        with mock.patch('iot.archive.archive_day', wraps=archive_day) as archive:
+            self.assertEqual(archive_cold_telemetry(after_days=30), 2)
+        self.assertEqual(archive.call_count, 2)
+        self.assertEqual(list(TelemetryData.objects.values_list('value', flat=True)), [Decimal('3')])
+
+    def test_reads_merge_archived_days_with_hot_rows(self):
+        day = (timezone.now() - timedelta(days=40)).date()
+        start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+        ingest_telemetry(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': i,
+             'timestamp': (start + timedelta(minutes=i)).isoformat()}
+            for i in range(4)
+        ])
+        archive_day(day)
+        ingest_telemetry(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 10 + i,
+             'timestamp': (timezone.now() - timedelta(minutes=i)).isoformat()}
+            for i in range(5)
+        ])
+        TelemetryRollupCoverage.objects.all().delete()
+        cache.clear()
+        clear_local()
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+
+        values, url = [], '/api/iot/telemetry/?page_size=4&metric=temperature'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            values.extend(float(point['value']) for point in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(values, [10, 11, 12, 13, 14, 3, 2, 1, 0])
+
+        with mock.patch('iot.export.EXPORT_CHUNK_SIZE', 3):
+            response = self.client.get('/api/iot/telemetry/?export=ndjson')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['value'] for line in lines],
+                         [0, 1, 2, 3, 14, 13, 12, 11, 10])
+
+        response = self.client.get('/api/iot/telemetry/latest/?limit=8')
+        self.assertEqual([float(p['value']) for p in response.json()], [10, 11, 12, 13, 14, 3, 2, 1])
+
+        response = self.client.get(f'/api/iot/telemetry/statistics/?asset_id={self.asset.id}&time_range=90d')
+        self.assertEqual(response.data['count'], 9)
+        self.assertEqual(response.data['min_value'], 0.0)
+        self.assertEqual(response.data['max_value'], 14.0)
+        self.assertAlmostEqual(response.data['avg_value'], 66 / 9)
+
+
+class TelemetryRetentionTest(TelemetryTestMixin, APITestCase):
+    def test_retention_expires_archive_chunks_and_compact_rows(self):
+        old = timezone.now() - timedelta(days=40)
+        ingest_telemetry(self.org, [{'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 1,
+                                     'timestamp': old.isoformat()}])
+        archive_day(old.date())
+        write_compact(build_telemetry_rows(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'pressure', 'value': 1, 'timestamp': old.isoformat()},
+            {'asset_id': 'ASSET003', 'metric': 'pressure', 'value': 2},
+        ]).rows)
+        Organization.objects.filter(pk=self.org.pk).update(data_retention_days=30)
+
+        targets = [t for t in RETENTION_TARGETS if t.table in ('telemetry_compact', 'telemetry_chunks')]
+        apply_retention(plan_retention(targets=targets))
+
+        self.assertFalse(TelemetryChunk.objects.exists())
+        self.assertEqual(list(CompactTelemetry.objects.values_list('value', flat=True)), [2.0])
+
+    def test_batch_hooks_run_once_per_batch(self):
+        received = []
+
+        def hook(sender, **kwargs):
+            received.append(kwargs)
+
+        telemetry_batch_ingested.connect(hook)
+        self.addCleanup(telemetry_batch_ingested.disconnect, hook)
+        with mock.patch('iot.signals._schedule_anomaly_check') as schedule, \
+                self.captureOnCommitCallbacks(execute=True):
+            ingest_telemetry(self.org, [
+                {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': i} for i in range(50)
+            ])
+
+        self.assertEqual(len(received), 1)
+        self.assertEqual(len(received[0]['ids']), 50)
+        self.assertEqual(received[0]['values'].sum(), sum(range(50)))
+        self.assertEqual(set(received[0]['asset_ids']), {self.asset.id})
+        schedule.assert_called_once()
+
+
+class TelemetryPaginationTest(TelemetryTestMixin, APITestCase):
+    def test_list_pages_by_keyset_and_exports_stream(self):
+        base = timezone.now() - timedelta(minutes=10)
+        # Equal timestamps force the id tie-break
+        TelemetryData.objects.bulk_create([
+            TelemetryData(asset=self.asset, metric='temperature', value=i, timestamp=base + timedelta(seconds=i // 2))
+            for i in range(25)
+        ])
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+
+        seen, url = [], '/api/iot/telemetry/?page_size=10&metric=temperature'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(point['id'] for point in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+        # Chunks of 4 split runs of equal timestamps
+        with mock.patch('iot.export.EXPORT_CHUNK_SIZE', 4):
+            response = self.client.get('/api/iot/telemetry/?export=csv&metric=temperature')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'asset_id', 'metric', 'value'])
+        self.assertEqual(len(lines), 26)
+        self.assertEqual(len({line.split(',')[0] for line in lines[1:]}), 25)
+
+        response = self.client.get('/api/iot/telemetry/?cursor=bogus')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FastJSONTest(TelemetryTestMixin, APITestCase):
+    def test_fast_rows_match_model_serializers(self):
+        TelemetryData.objects.bulk_create([
+            TelemetryData(asset=self.asset, metric='temperature', value=Decimal('21.5') + i, unit='C',
+                          metadata={'i': i}, quality_score=0.5)
+            for i in range(3)
+        ])
+        Alert.objects.create(asset=self.asset, title='Hot', message='m', severity='warning', source='test')
+        queryset = TelemetryData.objects.order_by('-timestamp')
+
+        def via_drf(serializer_class, data):
+            return json.loads(JSONRenderer().render(serializer_class(data, many=True).data))
+
+        self.assertEqual(
+            json.loads(dumps(TELEMETRY_ROWS.rows(queryset))), via_drf(TelemetryDataSerializer, queryset)
+        )
+        self.assertEqual(
+            json.loads(dumps(TELEMETRY_ROWS.rows(list(queryset)))), via_drf(TelemetryDataSerializer, queryset)
+        )
+        self.assertEqual(
+            json.loads(dumps(ALERT_ROWS.rows(Alert.objects.all()))), via_drf(AlertSerializer, Alert.objects.all())
+        )
+
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f'/api/iot/telemetry/latest/?asset_id={self.asset.id}&fields=value,timestamp')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(json.loads(response.content)[0]), {'value', 'timestamp'})
+        response = self.client.get('/api/iot/telemetry/latest/?fields=bogus')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TelemetryResampleTest(TelemetryTestMixin, APITestCase):
+    def test_resample_bounds_points_and_fills_gaps(self):
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        # 10 minutes at 1 Hz with the middle 4 minutes missing
+        TelemetryData.objects.bulk_create([
+            TelemetryData(asset=self.asset, metric='temperature', value=i % 60, timestamp=start + timedelta(seconds=i))
+            for i in list(range(180)) + list(range(420, 600))
+        ])
+        until = start + timedelta(minutes=10)
+
+        result = resample(self.asset.id, 'temperature', start, until, buckets=10, aggregate='avg')
+        self.assertEqual(result['source'], 'raw')
+        self.assertEqual(len(result['points']), 6)
+        self.assertEqual(result['points'][0], {'timestamp': start, 'value': 29.5, 'count': 60})
+
+        points = resample(self.asset.id, 'temperature', start, until, buckets=10, aggregate='minmax')['points']
+        self.assertEqual((points[0]['min'], points[0]['max']), (0.0, 59.0))
+
+        points = resample(self.asset.id, 'temperature', start, until, buckets=10, aggregate='locf')['points']
+        self.assertEqual(len(points), 10)
+        self.assertEqual([p['filled'] for p in points[2:8]], [False, True, True, True, True, False])
+        self.assertEqual(points[5]['value'], 59.0)
+
+        points = resample(self.asset.id, 'temperature', start, until, buckets=50, aggregate='lttb')['points']
+        self.assertEqual(len(points), 50)
+        # The sawtooth peaks survive downsampling
+        self.assertIn(59.0, [p['value'] for p in points])
+
+        # A rebuild up to now extends rollup coverage back to its start
+        rebuild_rollups(start, timezone.now())
+        result = resample(self.asset.id, 'temperature', start, until, buckets=5, aggregate='avg')
+        self.assertEqual(result['source'], 'rollup:1m')
+        self.assertEqual(result['points'][0]['count'], 120)
+
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(
+            f'/api/iot/telemetry/resample/?asset_id={self.asset.id}&metric=temperature'
+            f'&since={start.isoformat().replace("+00:00", "Z")}&until={until.isoformat().replace("+00:00", "Z")}'
+            f'&buckets=5000&aggregate=minmax'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = json.loads(response.content)
+        self.assertEqual(body['aggregate'], 'minmax')
+        self.assertEqual(len(body['points']), 360)
+        response = self.client.get(f'/api/iot/telemetry/resample/?asset_id={self.asset.id}&metric=t&aggregate=median')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TelemetryQueryTest(TelemetryTestMixin, APITestCase):
+    def test_query_returns_aligned_series_in_one_read(self):
+        other = Asset.objects.create(
+            asset_id='ASSET004', name='Other', asset_type=self.asset_type,
+            organization=self.org, created_by=self.user,
+        )
+        start = timezone.now().replace(microsecond=0) - timedelta(minutes=5)
+        TelemetryData.objects.bulk_create(
+            [TelemetryData(asset=self.asset, metric='temperature', value=i, timestamp=start + timedelta(seconds=i))
+             for i in range(120)]
+            + [TelemetryData(asset=other, metric='pressure', value=2, timestamp=start + timedelta(seconds=90))]
+        )
+        until = start + timedelta(minutes=2)
+        keys = [(self.asset.id, 'temperature'), (other.id, 'pressure'), (other.id, 'temperature')]
+
+        with self.assertNumQueries(1):
+            result = query_series(keys, start, until, buckets=4, aggregate='avg')
+        self.assertEqual(len(result['timestamps']), 4)
+        self.assertEqual(result['series'][0]['values'], [14.5, 44.5, 74.5, 104.5])
+        self.assertEqual(result['series'][1]['values'], [None, None, None, 2.0])
+        self.assertEqual(result['series'][2]['values'], [None] * 4)
+        counts = query_series(keys, start, until, buckets=2, aggregate='count')['series']
+        self.assertEqual([s['values'] for s in counts], [[60, 60], [0, 1], [0, 0]])
+
+        self.user.role = 'manager'
+        self.client.force_authenticate(user=self.user)
+        body = {
+            'series': [{'asset_id': str(a), 'metric': m} for a, m in keys],
+            'since': start.isoformat(), 'until': until.isoformat(), 'buckets': 2, 'aggregate': 'max',
+        }
+        response = self.client.post('/api/iot/telemetry/query/', body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['series'][0]['values'], [59.0, 119.0])
+
+        body['series'].append({'asset_id': str(uuid.uuid4()), 'metric': 'temperature'})
+        response = self.client.post('/api/iot/telemetry/query/', body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/iot/telemetry/query/', [body], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/iot/telemetry/query/', {**body, 'time_range': ['24h']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('time_range', response.data)
+
+        # Rollups for one series only: the other is still read raw
+        rebuild_rollups(start, until, asset_ids=[self.asset.id])
+        since = start.replace(second=0)
+        result = query_series(keys[:2], since, since + timedelta(minutes=4), buckets=4, aggregate='count')
+        self.assertEqual([s['source'] for s in result['series']], ['rollup:1m', 'raw'])
+        self.assertEqual(result['source'], 'mixed')
+        self.assertEqual([sum(s['values']) for s in result['series']], [120, 1])
+
+
+class TelemetryQualityTest(TelemetryTestMixin, APITestCase):
+    def test_quality_scores_and_series_counters(self):
+        AssetMetric.objects.create(asset=self.asset, name='temperature', unit='C', min_value=0, max_value=50)
+        device = Device.objects.create(device_id='q-1', asset=self.asset, device_type='plc', protocol='http')
+        Sensor.objects.create(
+            device=device, sensor_id='t1', name='temperature', sensor_type='temperature',
+            unit='C', sampling_rate=1.0,
+        )
+        start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        offsets = [0, 1, 2, 12, 12] + list(range(13, 23))
+        values = [10, 60, 11, 12, 13] + [5] * 10
+
+        ingest_telemetry(self.org, [
+            {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': value,
+             'timestamp': (start + timedelta(seconds=offset)).isoformat()}
+            for offset, value in zip(offsets, values)
+        ])
+        scores = list(
+            TelemetryData.objects.order_by('timestamp', 'value').values_list('quality_score', flat=True)
+        )
+        # in range, out of range, ok, gap, duplicate, then a stuck run flagged at its 10th point
+        self.assertEqual(scores[:5], [1.0, 0.0, 1.0, 0.8, 0.5])
+        self.assertEqual(scores[5:], [1.0] * 9 + [0.5])
+
+        # The run continues across batches
+        ingest_telemetry(self.org, [{'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 5,
+                                     'timestamp': (start + timedelta(seconds=23)).isoformat()}])
+        state = SeriesQuality.objects.get(asset=self.asset, metric='temperature')
+        day = SeriesQualityDay.objects.get(asset=self.asset, metric='temperature')
+        self.assertEqual(
+            (day.day, day.samples, day.out_of_range, day.gaps, day.duplicates, day.stuck, state.stuck_run),
+            (start.date(), 16, 1, 1, 1, 2, 10),
+        )
+
+        with self.assertNumQueries(1):
+            summary = asset_quality(self.asset.id, since=start.date())
+        self.assertAlmostEqual(summary['score'], (16 - 1 - 0.2 - 0.5 - 1) / 16, places=4)
+
+        # Health reads a recent window of days, and retention trims old ones
+        self.assertIsNone(asset_quality(self.asset.id)['score'])
+        Organization.objects.filter(pk=self.org.pk).update(data_retention_days=30)
+        targets = [t for t in RETENTION_TARGETS if t.table == 'telemetry_series_quality_days']
+        apply_retention(plan_retention(targets=targets))
+        self.assertFalse(SeriesQualityDay.objects.exists())
+
+    def test_quality_upsert_has_no_conflict_target_on_mysql(self):
+        from django.db import connection
+        with mock.patch.object(connection, 'vendor', 'mysql'), \
+                mock.patch.object(SeriesQuality.objects, 'bulk_create') as bulk_create, \
+                mock.patch.object(SeriesQualityDay.objects, 'bulk_create') as bulk_create_days:
+            score_rows(build_telemetry_rows(self.org, [
+                {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': 1},
+            ]).rows)
+
+        for upsert in (bulk_create, bulk_create_days):
+            (states,), options = upsert.call_args
+            self.assertEqual([s.metric for s in states], ['temperature'])
+            self.assertTrue(options['update_conflicts'])
+            self.assertNotIn('unique_fields', options)
+
+
+class LastValueCacheTest(TelemetryTestMixin, APITestCase):
+    def test_latest_points_served_from_last_value_cache(self):
+        base = timezone.now()
+        with mock.patch('iot.signals._schedule_anomaly_check'), \
+                self.captureOnCommitCallbacks(execute=True):
+            ingest_telemetry(self.org, [
+                {'asset_id': 'ASSET003', 'metric': 'temperature', 'value': i,
+                 'timestamp': (base + timedelta(seconds=i)).isoformat()}
+                for i in range(5)
+            ] + [{'asset_id': 'ASSET003', 'metric': 'pressure', 'value': 7}])
+
+        with self.assertNumQueries(0):
+            points = latest_points(
+                self.org.id, asset_id=self.asset.id, metric='temperature', limit=3
+            )
+        self.assertEqual([p.value for p in points], [Decimal(4), Decimal(3), Decimal(2)])
+
+        # Rebuilt from the database on a miss, then cached
+        cache.clear()
+        clear_local()
+        self.assertEqual(len(latest_points(self.org.id, limit=10)), 6)
+        with self.assertNumQueries(0):
+            data = TelemetryDataSerializer(latest_points(self.org.id, limit=10), many=True).data
+        self.assertEqual(data[0]['value'], '4.000000')
+        self.assertIsNone(latest_points(uuid.uuid4(), asset_id=self.asset.id))
+
+
+class MQTTGatewayTest(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(
+            name='Test Org', domain='testorg.com', slug='testorg', contact_email='test@testorg.com',
+        )
+        user = User.objects.create_user(email='mqtt@test.com', password='Test@12345', organization=org)
+        self.asset = Asset.objects.create(
+            asset_id='ASSET010', name='Pump', organization=org, created_by=user,
+            asset_type=AssetType.objects.create(name='Test Type', category='electronic'),
+        )
+        self.device = Device.objects.create(
+            device_id='gw-1', asset=self.asset, device_type='plc', protocol='mqtt',
+        )
+        for sensor_id, name in (('t1', 'temperature'), ('p1', 'pressure')):
+            Sensor.objects.create(
+                device=self.device, sensor_id=sensor_id, name=name,
+                sensor_type=name, unit='u', sampling_rate=1.0,
+            )
+
+    def test_messages_are_batched_into_telemetry_and_device_status(self):
+        client = InMemoryMQTTClient()
+        base = f'digitwin/{self.device.id}'
+        client.publish(f'{base}/t1', '21.5')
+        client.publish(f'{base}/p1', {'value': 3, 'unit': 'bar'})
+        client.publish(base, {'values': {'t1': 22, 'p1': 4}})
+        client.publish(f'{base}/unknown', '1')
+        client.publish('digitwin/elsewhere/t1', '1')
+        client.close()
+
+        gateway = MQTTGateway(lambda: client, batch_size=2, flush_interval=60)
+        with mock.patch('iot.signals._schedule_anomaly_check'):
+            stats = async_to_sync(gateway.run)()
+
+        self.assertEqual((stats['points'], stats['rejected'], stats['unknown_topic']), (4, 1, 1))
+        self.assertEqual(stats['batches'], 2)
+        self.assertEqual(
+            sorted(TelemetryData.objects.values_list('metric', 'value')),
+            [('pressure', Decimal(3)), ('pressure', Decimal(4)),
+             ('temperature', Decimal('21.5')), ('temperature', Decimal(22))],
+        )
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.connection_status, 'connected')
+        self.assertIsNotNone(self.device.last_seen)
+
+    def test_bad_messages_are_rejected_without_stopping_the_gateway(self):
+        client = InMemoryMQTTClient()
+        base = f'digitwin/{self.device.id}'
+        client.publish(f'{base}/t1', '1e30')
+        client.publish(f'{base}/p1', {'value': 1, 'unit': 'u' * 30})
+        client.publish(f'{base}/p1', {'value': 1, 'timestamp': 1e300})
+        client.publish(f'{base}/t1', 'boom')
+        client.publish(f'{base}/t1', '7')
+        client.close()
+
+        gateway = MQTTGateway(lambda: client, flush_interval=60)
+        handle = gateway.handle
+
+        def flaky(topic, payload):
+            if payload == b'boom':
+                raise RuntimeError('unexpected')
+            return handle(topic, payload)
+
+        gateway.handle = flaky
+        with mock.patch('iot.signals._schedule_anomaly_check'):
+            stats = async_to_sync(gateway.run)()
+
+        self.assertEqual((stats['points'], stats['rejected']), (1, 4))
+        self.assertEqual(list(TelemetryData.objects.values_list('value', flat=True)), [Decimal(7)])
+
+    def test_commands_are_published_and_acknowledged(self):
+        command = Command.objects.create(device=self.device, command_type='reboot', payload={'delay': 5})
+        client = InMemoryMQTTClient()
+        base = f'digitwin/{self.device.id}'
+
+        async def scenario():
+            gateway = MQTTGateway(lambda: client, flush_interval=60)
+            task = asyncio.ensure_future(gateway.run())
+            while not client.sent:
+                await asyncio.sleep(0.01)
+            client.publish(f'{base}/commands/ack', {'id': str(command.id), 'response': {'ok': True}})
+            client.close()
+            return await task
+
+        stats = async_to_sync(scenario)()
+
+        topic, payload = client.sent[0]
+        self.assertEqual(topic, f'{base}/commands')
+        self.assertEqual(json.loads(payload)['type'], 'reboot')
+        self.assertEqual((stats['commands_sent'], stats['commands_executed']), (1, 1))
+        command.refresh_from_db()
+        self.assertEqual(command.status, 'executed')
+        self.assertEqual(command.response, {'ok': True})
+        self.assertIsNotNone(command.response_received_at)
+
+
+class DeviceRegistryTest(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Test Org', domain='testorg.com', slug='testorg', contact_email='test@testorg.com',
+        )
+        user = User.objects.create_user(email='registry@test.com', password='Test@12345', organization=self.org)
+        asset_type = AssetType.objects.create(name='Test Type', category='electronic')
+        self.assets = [
+            Asset.objects.create(asset_id=f'ASSET01{i}', name='Line', organization=self.org,
+                                 created_by=user, asset_type=asset_type)
+            for i in range(2)
+        ]
+        self.device = Device.objects.create(
+            device_id='dev-1', asset=self.assets[0], device_type='plc', protocol='http',
+        )
+        Sensor.objects.create(
+            device=self.device, sensor_id='s1', name='temperature', sensor_type='temperature',
+            unit='C', sampling_rate=1.0,
+        )
+        registry.load()
+
+    def test_lookups_are_served_from_memory(self):
+        with self.assertNumQueries(0):
+            resolved = registry.resolve('dev-1', 's1', organization_id=self.org.id)
+            by_pk = registry.find(str(self.device.id))
+        self.assertEqual(resolved, (self.assets[0].id, 'temperature', 'C'))
+        self.assertEqual(by_pk.id, self.device.id)
+        self.assertIsNone(registry.resolve('dev-1', 's1', organization_id=uuid.uuid4()))
+
+    def test_saves_invalidate_incrementally(self):
+        Sensor.objects.create(
+            device=self.device, sensor_id='s2', name='humidity', sensor_type='humidity',
+            unit='%', sampling_rate=1.0,
+        )
+        self.assertEqual(registry.resolve('dev-1', 's2')[1], 'humidity')
+
+        # device_id is only unique per asset
+        Device.objects.create(device_id='dev-1', asset=self.assets[1], device_type='plc', protocol='http')
+        with self.assertRaises(AmbiguousDevice):
+            registry.find('dev-1')
+        self.assertEqual(registry.find('dev-1', asset_id=self.assets[0].id).id, self.device.id)
+
+        self.device.delete()
+        self.assertEqual(registry.find('dev-1').asset_id, self.assets[1].id)
+
+    def test_ingest_accepts_device_and_sensor_ids(self):
+        result = build_telemetry_rows(self.org, [
+            {'device_id': 'dev-1', 'sensor_id': 's1', 'value': 20},
+            {'device_id': 'dev-1', 'sensor_id': 'nope', 'value': 20},
+            {'device_id': ['dev-1'], 'sensor_id': 's1', 'value': 20},
+            {'device_id': 7, 'sensor_id': 's1', 'value': 20},
+        ])
+        self.assertEqual(result.accepted, 1)
+        self.assertEqual((result.rows[0].metric, result.rows[0].unit), ('temperature', 'C'))
+        self.assertEqual(
+            [e['error'] for e in result.errors],
+            ['unknown device or sensor', 'device_id must be a string or integer', 'unknown device or sensor'],
+        )
+
+
+class ModbusPollerTest(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(
+            name='Test Org', domain='testorg.com', slug='testorg', contact_email='test@testorg.com',
+        )
+        user = User.objects.create_user(email='modbus@test.com', password='Test@12345', organization=org)
+        self.asset = Asset.objects.create(
+            asset_id='ASSET011', name='Boiler', organization=org, created_by=user,
+            asset_type=AssetType.objects.create(name='Test Type', category='electronic'),
+        )
+        self.device = Device.objects.create(
+            device_id='plc-1', asset=self.asset, device_type='plc', protocol='modbus',
+        )
+        Sensor.objects.create(
+            device=self.device, sensor_id='t', name='temperature', sensor_type='temperature',
+            unit='C', sampling_rate=20, configuration={'register': 0, 'scale': 0.1},
+        )
+        Sensor.objects.create(
+            device=self.device, sensor_id='p', name='pressure', sensor_type='pressure',
+            unit='bar', sampling_rate=20, configuration={'register': 4, 'data_type': 'float32'},
+        )
+
+    def test_sensors_share_one_read_per_poll(self):
+        async def scenario():
+            simulator = ModbusSimulator()
+            simulator.set_value(0, 215)
+            simulator.set_value(4, 2.5, data_type='float32')
+            host, port = await simulator.start()
+            await sync_to_async(Device.objects.filter(pk=self.device.pk).update)(
+                configuration={'host': host, 'port': port}
+            )
+
+            poller = ModbusPoller(flush_interval=60)
+            task = asyncio.ensure_future(poller.run())
+            await asyncio.sleep(0.3)
+            poller.stop()
+            stats = await task
+            await simulator.close()
+            return stats, simulator.requests
+
+        with mock.patch('iot.signals._schedule_anomaly_check'):
+            stats, requests = async_to_sync(scenario)()
+
+        self.assertGreaterEqual(stats['polls'], 2)
+        self.assertEqual(stats['requests'], stats['polls'])
+        self.assertEqual(requests, stats['requests'])
+        self.assertEqual(stats['errors'], 0)
+        values = set(TelemetryData.objects.values_list('metric', 'value'))
+        self.assertEqual(values, {('temperature', Decimal('21.5')), ('pressure', Decimal('2.5'))})
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.connection_status, 'connected')
+
+    def test_plan_merges_nearby_registers(self):
+        self.device.configuration = {'host': '127.0.0.1'}
+        self.device.save()
+        (job,) = load_poll_plan()
+        self.assertEqual(job.interval, 0.1)
+        self.assertEqual([(b.start, b.count) for b in job.blocks], [(0, 6)])
+        # Jobs rebuilt by a plan refresh keep their in-flight identity
+        (rebuilt,) = load_poll_plan()
+        self.assertEqual(job_key(rebuilt), job_key(job))
+
+    def test_plan_skips_misconfigured_sensors_and_devices(self):
+        self.device.configuration = {'host': '127.0.0.1'}
+        self.device.save()
+        for sensor_id, configuration in (
+            ('bad-register', {'register': 'abc'}),
+            ('bad-scale', {'register': 10, 'scale': 'x'}),
+            ('bad-unit', {'register': 12, 'unit_id': 'z'}),
+            ('bad-table', {'register': 14, 'table': ['holding']}),
+        ):
+            Sensor.objects.create(
+                device=self.device, sensor_id=sensor_id, name=sensor_id, sensor_type='temperature',
+                unit='C', sampling_rate=20, configuration=configuration,
+            )
+        broken = Device.objects.create(
+            device_id='plc-2', asset=self.asset, device_type='plc', protocol='modbus',
+            configuration={'host': '127.0.0.1', 'port': 'abc'},
+        )
+        Sensor.objects.create(
+            device=broken, sensor_id='t', name='temperature', sensor_type='temperature',
+            unit='C', sampling_rate=1, configuration={'register': 0},
+        )
+
+        with self.assertLogs('iot.modbus', 'WARNING') as logs:
+            (job,) = load_poll_plan()
+        self.assertEqual(len(logs.output), 5)
+        self.assertEqual(job.device_id, self.device.id)
+        self.assertEqual([r.sensor_id for b in job.blocks for r in b.sensors], ['t', 'p'])
+
+    def test_out_of_range_readings_are_rejected(self):
+        async def scenario():
+            simulator = ModbusSimulator()
+            simulator.set_value(0, 215)
+            simulator.set_value(4, 3e38, data_type='float32')
+            host, port = await simulator.start()
+            await sync_to_async(Device.objects.filter(pk=self.device.pk).update)(
+                configuration={'host': host, 'port': port}
+            )
+            (job,) = await sync_to_async(load_poll_plan)()
+            poller = ModbusPoller(flush_interval=60)
+            await poller._poll(job)
+            await poller.pool.close()
+            await simulator.close()
+            return poller
+
+        poller = async_to_sync(scenario)()
+        self.assertEqual((poller.stats['points'], poller.stats['rejected']), (1, 1))
+        self.assertEqual(poller.in_flight, set())
+
+
+class HeartbeatTrackerTest(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(
+            name='Test Org', domain='testorg.com', slug='testorg', contact_email='test@testorg.com',
+        )
+        user = User.objects.create_user(email='beat@test.com', password='Test@12345', organization=org)
+        self.asset = Asset.objects.create(
+            asset_id='ASSET013', name='Fan', organization=org, created_by=user,
+            asset_type=AssetType.objects.create(name='Test Type', category='electronic'),
+        )
+        self.device = Device.objects.create(
+            device_id='hb-1', asset=self.asset, device_type='plc', protocol='mqtt',
+        )
+        self.clock = mock.Mock(return_value=1000.0)
+        self.tracker = HeartbeatTracker(timeout=30, wheel=TimingWheel(tick=1.0, slots=16, clock=self.clock))
+
+    def test_heartbeats_flush_in_bulk_and_silent_devices_expire(self):
+        updated_at = self.device.updated_at
+        for _ in range(50):
+            self.tracker.beat(self.device.id)
+        with self.assertNumQueries(1):
+            write_device_status(self.tracker.take_pending())
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.connection_status, 'connected')
+        self.assertIsNotNone(self.device.last_seen)
+        self.assertEqual(self.device.updated_at, updated_at)
+
+        self.clock.return_value = 1020.0
+        self.tracker.beat(self.device.id)
+        self.clock.return_value = 1045.0
+        self.assertEqual(self.tracker.expire(), [])
+        self.clock.return_value = 1051.0
+        self.assertEqual(self.tracker.expire(), [self.device.id])
+
+        write_device_status(self.tracker.take_pending())
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.connection_status, 'disconnected')
+        self.assertIsNotNone(self.device.last_seen)
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_only_transitions_are_pushed_to_asset_consumers(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'assets_{self.asset.organization_id}', channel)
+
+        self.tracker.beat(self.device.id)
+        self.tracker.beat(self.device.id)
+        self.tracker.mark(self.device.id, 'error')
+        async_to_sync(self.tracker.publish)()
+
+        statuses = [
+            async_to_sync(layer.receive)(channel)['data']['connection_status'] for _ in range(2)
+        ]
+        self.assertEqual(statuses, ['connected', 'error'])
+        self.assertEqual(self.tracker.take_transitions(), [])
+
+
+class CommandDispatchTest(APITestCase):
+    def setUp(self):
+        org = Organization.objects.create(
+            name='Test Org', domain='testorg.com', slug='testorg', contact_email='test@testorg.com',
+        )
+        self.user = User.objects.create_user(
+            email='fleet@test.com', password='Test@12345', organization=org, role='operator',
+        )
+        asset = Asset.objects.create(
+            asset_id='ASSET014', name='Line', organization=org, created_by=self.user,
+            asset_type=AssetType.objects.create(name='Test Type', category='electronic'),
+        )
+        self.devices = [
+            Device.objects.create(
+                device_id=f'fleet-{i}', asset=asset, device_type='sensor', protocol='mqtt',
+                firmware_version='1.0' if i < 2 else '2.0',
+            )
+            for i in range(3)
+        ]
+        # Commit callbacks captured around a request run after its audit flush
+        self.addCleanup(audit_buffer.take)
+
+    def test_commands_leave_in_order_per_device_and_time_out(self):
+        first, second = self.devices[:2]
+        issued = issue_commands([(first.id, 'mqtt'), (second.id, 'mqtt')], 'set')
+        (follow_up,) = issue_commands([(first.id, 'mqtt')], 'apply')
+
+        batches = []
+
+        async def adapter(commands):
+            batches.append([c.id for c in commands])
+            return {}
+
+        clock = mock.Mock(return_value=0.0)
+        dispatcher = CommandDispatcher(
+            'mqtt', adapter, ack_timeout=10, wheel=TimingWheel(tick=1.0, slots=32, clock=clock),
+        )
+        dispatcher.enqueue(dispatcher.load())
+        async_to_sync(dispatcher.deliver)()
+        async_to_sync(dispatcher.deliver)()
+        self.assertEqual(batches, [[issued[0].id, issued[1].id]])
+
+        dispatcher.acknowledge(issued[0].id, response={'ok': True})
+        async_to_sync(dispatcher.deliver)()
+        self.assertEqual(batches[-1], [follow_up.id])
+
+        clock.return_value = 11.0
+        dispatcher.expire()
+        async_to_sync(dispatcher.flush)()
+
+        statuses = dict(Command.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[issued[0].id], 'executed')
+        self.assertEqual(statuses[issued[1].id], 'timeout')
+        self.assertEqual(statuses[follow_up.id], 'timeout')
+
+    def test_failed_flush_keeps_updates_for_the_next_one(self):
+        issued = issue_commands([(self.devices[0].id, 'mqtt'), (self.devices[1].id, 'mqtt')], 'set')
+
+        async def adapter(commands):
+            return {}
+
+        dispatcher = CommandDispatcher('mqtt', adapter)
+        dispatcher.enqueue(dispatcher.load())
+        async_to_sync(dispatcher.deliver)()
+        dispatcher.acknowledge(issued[0].id, response={'ok': True})
+        with mock.patch.object(dispatcher, '_write', side_effect=DatabaseError('down')):
+            async_to_sync(dispatcher.flush)()
+        self.assertEqual(set(Command.objects.values_list('status', flat=True)), {'pending'})
+
+        async_to_sync(dispatcher.flush)()
+        statuses = dict(Command.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[issued[0].id], 'executed')
+        self.assertEqual(statuses[issued[1].id], 'sent')
+
+    def test_bulk_command_fans_out_to_filtered_devices(self):
+        self.client.force_authenticate(user=self.user)
+        with mock.patch('iot.commands.dispatch_commands') as dispatch, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/iot/devices/bulk_command/', {
+                'command_type': 'set_config',
+                'payload': {'sampling_rate': 5},
+                'filter': {'firmware_version': '1.0'},
+            }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['devices'], 2)
+        commands = Command.objects.filter(metadata__bulk_id=response.data['bulk_id'])
+        self.assertEqual(
+            set(commands.values_list('device_id', flat=True)), {d.id for d in self.devices[:2]}
+        )
+        self.assertTrue(all(c.status == 'pending' for c in commands))
+        self.assertEqual(len(dispatch.call_args[0][0]), 2)
+
+    def test_unsupported_protocols_are_rejected_and_stale_commands_time_out(self):
+        modbus = Device.objects.create(
+            device_id='plc-1', asset=self.devices[0].asset, device_type='controller', protocol='modbus',
+        )
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(f'/api/iot/devices/{modbus.pk}/send_command/', {'command_type': 'reset'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/iot/devices/bulk_command/', {
+            'command_type': 'reset', 'device_ids': [str(self.devices[0].pk), str(modbus.pk)],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Command.objects.exists())
+
+        stale, fresh = issue_commands([(d.id, 'mqtt') for d in self.devices[:2]], 'set')
+        Command.objects.filter(pk=stale.pk).update(issued_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(expire_stale_commands(stale_after=3600), 1)
+        statuses = dict(Command.objects.values_list('id', 'status'))
+        self.assertEqual((statuses[stale.id], statuses[fresh.id]), ('timeout', 'pending'))
+
+    def test_sensor_detail_is_scoped_through_its_device(self):
+        sensor = Sensor.objects.create(
+            device=self.devices[0], sensor_id='s-1', name='temperature', sensor_type='temperature',
+            unit='C', sampling_rate=1.0,
+        )
+        manager = User.objects.create_user(
+            email='manager@test.com', password='Test@12345',
+            organization=self.user.organization, role='manager',
+        )
+        outsider = User.objects.create_user(
+            email='outsider@test.com', password='Test@12345', role='manager',
+            organization=Organization.objects.create(
+                name='Other Org', domain='other.com', slug='other', contact_email='x@other.com',
+            ),
+        )
+
+        self.client.force_authenticate(user=manager)
+        response = self.client.get(f'/api/iot/sensors/{sensor.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(f'/api/iot/sensors/{sensor.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class TelemetryFanoutTest(TestCase):
+    def setUp(self):
+        self.asset_id = uuid.uuid4()
+        self.now = timezone.now()
+
+    def _rows(self, count):
+        return [
+            TelemetryData(asset_id=self.asset_id, metric='temperature', value=Decimal(i),
+                          unit='C', timestamp=self.now + timedelta(seconds=i))
+            for i in range(count)
+        ]
+
+    def test_points_are_coalesced_into_one_frame_per_asset(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(asset_group(self.asset_id), channel)
+
+        fanout = TelemetryFanout(window_ms=10000)
+        fanout.add(self._rows(2))
+        fanout.add(self._rows(3)[2:])
+        fanout._timer.cancel()
+        fanout.flush()
+
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event['type'], 'asset.telemetry')
+        frame = json.loads(event['text'])
+        self.assertEqual([p['value'] for p in frame['data']], [0.0, 1.0, 2.0])
+
+    def test_consumer_honours_max_rate(self):
+        user = mock.Mock(is_authenticated=True, organization_id=uuid.uuid4())
+        asset_id = str(self.asset_id)
+
+        async def scenario():
+            communicator = ApplicationCommunicator(TelemetryConsumer.as_asgi(), {
+                'type': 'websocket', 'path': '/ws/iot/telemetry/', 'user': user,
+            })
+
+            async def receive_json(timeout=1):
+                return json.loads((await communicator.receive_output(timeout))['text'])
+
+            with mock.patch.object(TelemetryConsumer, '_asset_belongs_to_org', return_value=True):
+                await communicator.send_input({'type': 'websocket.connect'})
+                await communicator.receive_output()  # accept
+                await receive_json()  # connected
+                await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(
+                    {'type': 'subscribe_asset', 'asset_id': asset_id, 'max_rate': 5}
+                )})
+                await receive_json()  # subscription_confirmed
+
+            layer = get_channel_layer()
+            for value in range(3):
+                await layer.group_send(asset_group(asset_id), {
+                    'type': 'asset.telemetry',
+                    'asset_id': asset_id,
+                    'text': json.dumps({'type': 'telemetry', 'data': [value]}),
+                })
+            first = await receive_json()
+            held = await receive_json()
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait()
+            return first, held
+
+        first, held = async_to_sync(scenario)()
+        self.assertEqual(first, {'type': 'telemetry', 'data': [0]})
+        self.assertEqual(held['type'], 'telemetry_batch')
+        self.assertEqual([f['data'] for f in held['frames']], [[1], [2]])
+
+
+class SendQueueTest(TestCase):
+    def test_drop_oldest(self):
+        queue = SendQueue(maxsize=2, policy='drop_oldest')
+        self.assertEqual([queue.put(t) for t in 'abc'], [(0, 0), (0, 0), (1, 0)])
+        self.assertEqual([queue.pop(), queue.pop(), queue.pop()], ['b', 'c', None])
+        self.assertFalse(queue.ready.is_set())
+
+    def test_latest_per_series_replaces_in_place_once_full(self):
+        queue = SendQueue(maxsize=3, policy='latest_per_series')
+        queue.put('a1', series='a')
+        queue.put('control')
+        # Below the limit nothing is coalesced
+        self.assertEqual(queue.put('a2', series='a'), (0, 0))
+        self.assertEqual(queue.put('a3', series='a'), (0, 1))
+        self.assertEqual(queue.put('b1', series='b'), (1, 0))
+        self.assertEqual([queue.pop(), queue.pop(), queue.pop(), queue.pop()], ['control', 'a3', 'b1', None])
+
+    def test_disconnect_policy_raises_when_full(self):
+        queue = SendQueue(maxsize=1, policy='disconnect')
+        queue.put('a')
+        with self.assertRaises(QueueOverflow):
+            queue.put('b')
+
+    def test_merge_frames_keeps_latest_point_per_metric(self):
+        now = timezone.now()
+
+        def point(metric, value, seconds):
+            return TelemetryData(asset_id=uuid.UUID(int=1), metric=metric, value=Decimal(value),
+                                 unit='', timestamp=now + timedelta(seconds=seconds))
+
+        merged = json.loads(merge_frames(
+            encode_frame(uuid.UUID(int=1), [point('t', 1, 0), point('p', 5, 0)]),
+            encode_frame(uuid.UUID(int=1), [point('t', 2, 1)]),
+        ))
+        self.assertEqual({p['metric']: p['value'] for p in merged['data']}, {'t': 2.0, 'p': 5.0})
+
+    def test_metrics_snapshot_reports_queue_depth(self):
+        queue = SendQueue(maxsize=10)
+        metrics.register_queue('TestConsumer', queue)
+        queue.put('a')
+        queue.put('b')
+        metrics.incr('TestConsumer', 'frames_dropped')
+
+        stats = metrics.snapshot()['TestConsumer']
+        self.assertEqual((stats['connections'], stats['queue_depth']), (1, 2))
+        self.assertEqual(stats['frames_dropped'], 1)
+        metrics.unregister_queue('TestConsumer', queue)
+
+
+class ArchiveCodecTest(TestCase):
+    def test_codecs_round_trip(self):
+        ts = np.arange(1_700_000_000_000, 1_700_000_000_000 + 1000 * 500, 1000, dtype='<i8')
+        ts[10] += 7  # jitter
+        values = np.sin(np.linspace(0, 10, ts.size)) * 100
+
+        self.assertTrue(np.array_equal(decode_timestamps(encode_timestamps(ts)), ts))
+        self.assertTrue(np.array_equal(decode_values(encode_values(values), values.size), values))
+        self.assertLess(len(encode_timestamps(ts)), ts.nbytes // 20)
+
+    def test_chunk_keeps_first_point_per_timestamp(self):
+        chunk = build_chunk(1, None, np.array([2000, 1000, 2000], dtype='<i8'), np.array([1.0, 2.0, 3.0]))
+        self.assertEqual((chunk.count, chunk.sum), (2, 3.0))
+        self.assertEqual(decode_values(chunk.values, chunk.count).tolist(), [2.0, 1.0])
+
+
+class StreamingAnomalyDetectorTest(TestCase):
+    def test_window_matches_two_pass_statistics(self):
+        now = timezone.now()
+        values = [Decimal(v) for v in range(1, 31)]
+        window = SeriesWindow.from_history(
+            (now, value) for value in values
+        )
+
+        tail = values[-20:]
+        mean = sum(tail) / Decimal(len(tail))
+        variance = sum((v - mean) ** 2 for v in tail) / Decimal(len(tail))
+
+        self.assertEqual(len(window), 20)
+        self.assertEqual(window.mean, mean)
+        self.assertAlmostEqual(float(window.std_dev()), float(variance.sqrt()), places=12)
+
+    def test_detect_batch_flags_outlier(self):
+        now = timezone.now()
+        asset_id = uuid.uuid4()
+        rows = [
+            {
+                'id': i,
+                'asset_id': asset_id,
+                'metric': 'temperature',
+                'value': Decimal('20') + Decimal(i % 2),
+                'timestamp': now + timedelta(seconds=i),
+            }
+            for i in range(15)
+        ]
+        rows.append({
+            'id': 99,
+            'asset_id': asset_id,
+            'metric': 'temperature',
+            'value': Decimal('90'),
+            'timestamp': now + timedelta(seconds=20),
+        })
+
+        anomalies = detect_batch(rows)
+
+        self.assertEqual([row['id'] for row, _ in anomalies], [99])
+
+    def test_retried_batch_does_not_push_points_twice(self):
+        now = timezone.now()
+        asset_id = uuid.uuid4()
+        points = [
+            [i, str(asset_id), 'temperature', str(20 + i % 2), (now + timedelta(seconds=i)).isoformat()]
+            for i in range(12)
+        ]
+
+        with mock.patch('iot.tasks._raise_anomaly_alerts', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError), self.assertLogs('iot.tasks', 'ERROR'):
+                check_telemetry_batch_anomalies.run(points)
+        self.assertIsNone(cache.get(series_cache_key(asset_id, 'temperature')))
+
+        with mock.patch('iot.tasks._raise_anomaly_alerts', return_value=0):
+            check_telemetry_batch_anomalies.run(points)
+        self.assertEqual(len(cache.get(series_cache_key(asset_id, 'temperature'))), 12)
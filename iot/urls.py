@@ -7,6 +7,7 @@ from .views import (
     DeviceViewSet,
     SensorViewSet,
     CommandViewSet,telemetry_view,alerts_view,
+    WebSocketMetricsView,
 )
 
 app_name = 'iot'
@@ -20,6 +21,7 @@ router.register(r'commands', CommandViewSet, basename='command')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('ws-metrics/', WebSocketMetricsView.as_view(), name='ws-metrics'),
     path("telemetry/", telemetry_view, name="telemetry"),
     path("alerts/", alerts_view, name="alerts"),
 ]
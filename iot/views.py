@@ -1,27 +1,70 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser
+from rest_framework.views import APIView
 
+from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.dateparse import parse_datetime
+from django.db import transaction
 from django.utils import timezone
 from django.db.models import Count, Avg, Max, Min, Q
 from datetime import timedelta
+import uuid
 
 from .models import TelemetryData, Alert, Device, Sensor, Command
 from .serializers import (
     TelemetryDataSerializer,
+    TelemetryRollupSerializer,
     AlertSerializer,
     DeviceSerializer,
     SensorSerializer,
     CommandSerializer,
 )
-from core.permissions import CanViewAnalytics, CanEditAssets
+from .commands import BULK_MAX_DEVICES, COMMAND_PROTOCOLS, issue_commands
+from .ingest import TelemetryBatchError, ingest_telemetry
+from .parsers import NDJSONParser
+from .compact import reads_compact, series_for
+from .export import EXPORT_FORMATS, export_response
+from .history import TelemetryHistory, combine_statistics
+from .fastjson import FastJSONResponse, RowEncoder, format_datetime
+from .lastvalue import latest_points
+from .pagination import TelemetryKeysetPagination
+from .query import (
+    AGGREGATES as QUERY_AGGREGATES,
+    DEFAULT_BUCKETS as QUERY_BUCKETS,
+    MAX_SERIES as QUERY_MAX_SERIES,
+    query_series,
+)
+from .resample import AGGREGATES, DEFAULT_BUCKETS, resample
+from .rollups import (
+    RESOLUTIONS,
+    choose_resolution,
+    covered_from,
+    organization_coverage,
+    rollup_queryset,
+    rollup_statistics,
+)
+from assets.models import Asset
+from core.permissions import CanViewAnalytics, CanEditAssets, IsSuperAdmin
+from core.mixins import OrgScopedQuerysetMixin
+from . import metrics
+
+
+# Hot read paths skip DRF field-by-field serialization (see iot.fastjson)
+TELEMETRY_ROWS = RowEncoder(TelemetryDataSerializer)
+ALERT_ROWS = RowEncoder(AlertSerializer)
 
 
 # -------------------------------------------------------------------
 # Helper: centralized time filter (NO duplication)
 # -------------------------------------------------------------------
 def get_time_filter(time_range: str):
+    if not isinstance(time_range, str):
+        raise ValidationError({'time_range': 'must be a string such as "24h"'})
     now = timezone.now()
     mapping = {
         '1h': timedelta(hours=1),
@@ -30,40 +73,110 @@ def get_time_filter(time_range: str):
         '24h': timedelta(days=1),
         '7d': timedelta(days=7),
         '30d': timedelta(days=30),
+        '90d': timedelta(days=90),
+        '1y': timedelta(days=365),
     }
     return now - mapping.get(time_range, timedelta(days=1))
 
 
+def telemetry_filters(params):
+    """``asset_id``, ``metric`` and the ``since``/``until`` bounds (``time_range``, ``since``, ``until``)."""
+    filters = {'asset_id': None, 'metric': params.get('metric') or None, 'since': None, 'until': None}
+    try:
+        if params.get('asset_id'):
+            filters['asset_id'] = uuid.UUID(params['asset_id'])
+    except ValueError:
+        raise ValidationError({'asset_id': 'must be an asset UUID'})
+    if params.get('time_range'):
+        filters['since'] = get_time_filter(params['time_range'])
+    for param in ('since', 'until'):
+        if params.get(param):
+            moment = parse_datetime(params[param])
+            if moment is None:
+                raise ValidationError({param: 'must be an ISO 8601 timestamp'})
+            filters[param] = timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+    return filters
+
+
+def time_window(params, default='24h'):
+    """``(since, until)`` from ``since``/``until`` or ``time_range`` (ending now)."""
+    window = {'since': get_time_filter(params.get('time_range') or default), 'until': timezone.now()}
+    for param in window:
+        if params.get(param):
+            moment = parse_datetime(str(params[param]))
+            if moment is None:
+                raise ValidationError({param: 'must be an ISO 8601 timestamp'})
+            window[param] = timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+    if window['since'] >= window['until']:
+        raise ValidationError({'since': 'must be before until'})
+    return window['since'], window['until']
+
+
+def export_format(params):
+    """Requested ``export`` format, or None for a paginated JSON response."""
+    export = params.get('export')
+    if export and export not in EXPORT_FORMATS:
+        raise ValidationError({'export': f'must be one of {sorted(EXPORT_FORMATS)}'})
+    return export or None
+
+
 # -------------------------------------------------------------------
-# Telemetry (READ-ONLY — ingest happens elsewhere)
+# Telemetry (READ-ONLY + bulk ingest)
 # -------------------------------------------------------------------
-class TelemetryDataViewSet(viewsets.ReadOnlyModelViewSet):
+class TelemetryDataViewSet(OrgScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = TelemetryDataSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
+    pagination_class = TelemetryKeysetPagination
+    queryset = TelemetryData.objects.select_related('asset')
+    organization_field = 'asset__organization'
+
+    def history(self, asset_id=None, metric=None, since=None, until=None):
+        """Scoped TelemetryHistory: hot rows merged with archived chunks."""
+        rows = self.get_queryset()
+        if asset_id:
+            rows = rows.filter(asset_id=asset_id)
+        if metric:
+            rows = rows.filter(metric=metric)
+        return TelemetryHistory.scoped(
+            rows, self.principal.organization_id,
+            asset_id=asset_id, metric=metric, since=since, until=until,
+        )
+
+    def list(self, request, *args, **kwargs):
+        history = self.history(**telemetry_filters(request.query_params))
+        export = export_format(request.query_params)
+        if export:
+            return export_response(history, export)
 
-    def get_queryset(self):
-        return TelemetryData.objects.filter(
-            asset__organization=self.request.user.organization
-        ).select_related('asset')
+        page = self.paginator.paginate_history(history, request)
+        return self.paginator.get_paginated_response(self.get_serializer(page, many=True).data)
 
     @action(detail=False, methods=['get'])
     def latest(self, request):
-        asset_id = request.query_params.get('asset_id')
-        metric = request.query_params.get('metric')
+        filters = telemetry_filters({
+            'asset_id': request.query_params.get('asset_id'),
+            'metric': request.query_params.get('metric'),
+        })
         limit = min(int(request.query_params.get('limit', 100)), 500)
+        fields = TELEMETRY_ROWS.project(request.query_params.get('fields'))
 
-        queryset = self.get_queryset()
-
-        if asset_id:
-            queryset = queryset.filter(asset__id=asset_id)
-        if metric:
-            queryset = queryset.filter(metric=metric)
+        points = latest_points(
+            request.user.organization_id,
+            asset_id=filters['asset_id'], metric=filters['metric'], limit=limit,
+        )
+        if points is not None:
+            return FastJSONResponse(TELEMETRY_ROWS.rows(points, fields))
 
-        queryset = queryset.order_by('-timestamp')[:limit]
-        return Response(self.get_serializer(queryset, many=True).data)
+        history = self.history(asset_id=filters['asset_id'], metric=filters['metric'])
+        points = history.read(descending=True, limit=limit)
+        return FastJSONResponse(TELEMETRY_ROWS.rows(points, fields))
 
     @action(detail=False, methods=['get'])
     def metrics(self, request):
+        if reads_compact():
+            series = series_for(organization=request.user.organization)
+            return Response({'metrics': sorted({m for _, m, _ in series.values()})})
+
         metrics = (
             self.get_queryset()
             .values_list('metric', flat=True)
@@ -71,43 +184,143 @@ class TelemetryDataViewSet(viewsets.ReadOnlyModelViewSet):
         )
         return Response({'metrics': list(metrics)})
 
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAuthenticated, CanEditAssets],
+        parser_classes=[JSONParser, NDJSONParser],
+    )
+    def ingest(self, request):
+        points = request.data
+        if isinstance(points, dict):
+            points = points.get('points')
+
+        try:
+            result = ingest_telemetry(request.user.organization, points)
+        except TelemetryBatchError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not result.accepted and result.rejected:
+            return Response(result.as_dict(), status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        asset_id = request.query_params.get('asset_id')
-        metric = request.query_params.get('metric')
+        filters = telemetry_filters({
+            'asset_id': request.query_params.get('asset_id'),
+            'metric': request.query_params.get('metric'),
+        })
+        asset_id, metric = filters['asset_id'], filters['metric']
         time_range = request.query_params.get('time_range', '24h')
+        since = get_time_filter(time_range)
+
+        # Rollups answer only the part of the range they are known to cover
+        resolution = choose_resolution(since)
+        covered = organization_coverage(self.principal.organization_id, asset_id) if resolution else None
+        if covered is not None and covered < timezone.now():
+            rollups = rollup_queryset(resolution, max(since, covered)).filter(
+                asset__organization_id=self.principal.organization_id
+            )
+            if asset_id:
+                rollups = rollups.filter(asset__id=asset_id)
+            if metric:
+                rollups = rollups.filter(metric=metric)
 
-        queryset = self.get_queryset().filter(
-            timestamp__gte=get_time_filter(time_range)
-        )
+            stats = rollup_statistics(rollups)
+            if covered > since:
+                raw = self.history(asset_id=asset_id, metric=metric, since=since, until=covered)
+                stats = combine_statistics(stats, raw.statistics())
+            return Response(stats)
 
-        if asset_id:
-            queryset = queryset.filter(asset__id=asset_id)
-        if metric:
-            queryset = queryset.filter(metric=metric)
-
-        stats = queryset.aggregate(
-            count=Count('id'),
-            avg_value=Avg('value'),
-            max_value=Max('value'),
-            min_value=Min('value'),
-            latest_timestamp=Max('timestamp'),
-        )
+        return Response(self.history(asset_id=asset_id, metric=metric, since=since).statistics())
 
-        return Response(stats)
+    @action(detail=False, methods=['get'])
+    def resample(self, request):
+        """One series as at most ``buckets`` points over any range (see iot.resample)."""
+        params = request.query_params
+        try:
+            asset_id = uuid.UUID(params.get('asset_id', ''))
+        except ValueError:
+            raise ValidationError({'asset_id': 'must be an asset UUID'})
+        metric = params.get('metric')
+        if not metric:
+            raise ValidationError({'metric': 'required'})
+        aggregate = params.get('aggregate', 'avg')
+        if aggregate not in AGGREGATES:
+            raise ValidationError({'aggregate': f'must be one of {list(AGGREGATES)}'})
+        try:
+            buckets = int(params.get('buckets', DEFAULT_BUCKETS))
+        except ValueError:
+            raise ValidationError({'buckets': 'must be an integer'})
+
+        since, until = time_window(params)
+
+        get_object_or_404(Asset, id=asset_id, organization_id=self.principal.organization_id)
+        result = resample(asset_id, metric, since, until, buckets=buckets, aggregate=aggregate)
+        return FastJSONResponse({
+            'asset_id': asset_id,
+            'metric': metric,
+            'aggregate': aggregate,
+            'since': since,
+            'until': until,
+            **result,
+        })
+
+    @action(detail=False, methods=['post'])
+    def query(self, request):
+        """
+        Many series in one request, bucketed on a shared time grid.
+
+        Body: ``{"series": [{"asset_id", "metric"}, ...], "aggregate",
+        "buckets", "time_range" | "since"/"until"}``.
+        """
+        data = request.data
+        if not isinstance(data, dict):
+            raise ValidationError('body must be an object')
+        series = data.get('series')
+        if not isinstance(series, list) or not series:
+            raise ValidationError({'series': 'must be a non-empty list of {asset_id, metric}'})
+        if len(series) > QUERY_MAX_SERIES:
+            raise ValidationError({'series': f'at most {QUERY_MAX_SERIES} series per query'})
+        keys = []
+        for index, item in enumerate(series):
+            try:
+                keys.append((uuid.UUID(str(item['asset_id'])), str(item['metric'])))
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError({'series': f'item {index} needs an asset UUID and a metric'})
+
+        aggregate = data.get('aggregate', 'avg')
+        if aggregate not in QUERY_AGGREGATES:
+            raise ValidationError({'aggregate': f'must be one of {list(QUERY_AGGREGATES)}'})
+        try:
+            buckets = int(data.get('buckets', QUERY_BUCKETS))
+        except (TypeError, ValueError):
+            raise ValidationError({'buckets': 'must be an integer'})
+        since, until = time_window(data)
+
+        asset_ids = {asset_id for asset_id, _ in keys}
+        allowed = set(Asset.objects.filter(
+            id__in=asset_ids, organization_id=self.principal.organization_id
+        ).values_list('id', flat=True))
+        if asset_ids - allowed:
+            unknown = ', '.join(sorted(str(asset_id) for asset_id in asset_ids - allowed))
+            raise ValidationError({'series': f'unknown assets: {unknown}'})
+
+        result = query_series(keys, since, until, buckets=buckets, aggregate=aggregate)
+        return FastJSONResponse({'aggregate': aggregate, 'since': since, 'until': until, **result})
 
 
 # -------------------------------------------------------------------
 # Alerts (READ-ONLY + controlled actions)
 # -------------------------------------------------------------------
-class AlertViewSet(viewsets.ReadOnlyModelViewSet):
+class AlertViewSet(OrgScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = AlertSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-
-    def get_queryset(self):
-        return Alert.objects.filter(
-            asset__organization=self.request.user.organization
-        ).select_related('asset', 'acknowledged_by', 'resolved_by')
+    queryset = Alert.objects.select_related('asset', 'acknowledged_by', 'resolved_by')
+    organization_field = 'asset__organization'
 
     @action(detail=True, methods=['post'])
     def acknowledge(self, request, pk=None):
@@ -160,20 +373,17 @@ class AlertViewSet(viewsets.ReadOnlyModelViewSet):
 # -------------------------------------------------------------------
 # Devices
 # -------------------------------------------------------------------
-class DeviceViewSet(viewsets.ModelViewSet):
+class DeviceViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = DeviceSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-
-    def get_queryset(self):
-        return Device.objects.filter(
-            asset__organization=self.request.user.organization
-        ).select_related('asset')
+    queryset = Device.objects.select_related('asset')
+    organization_field = 'asset__organization'
 
     @action(detail=True, methods=['post'])
     def send_command(self, request, pk=None):
         device = self.get_object()
 
-        if device.asset.organization != request.user.organization:
+        if not self.principal.owns(device, self.organization_field):
             return Response({'error': 'Forbidden'}, status=403)
 
         command_type = request.data.get('command_type')
@@ -182,13 +392,17 @@ class DeviceViewSet(viewsets.ModelViewSet):
                 {'error': 'command_type is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if device.protocol not in COMMAND_PROTOCOLS:
+            return Response(
+                {'error': f'{device.protocol} devices do not accept commands'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        command = Command.objects.create(
-            device=device,
-            command_type=command_type,
+        (command,) = issue_commands(
+            [(device.id, device.protocol)],
+            command_type,
             payload=request.data.get('payload', {}),
             issued_by=request.user,
-            status='sent',
         )
 
         return Response({
@@ -196,24 +410,86 @@ class DeviceViewSet(viewsets.ModelViewSet):
             'command_id': str(command.id)
         })
 
+    @action(detail=False, methods=['post'])
+    def bulk_command(self, request):
+        """Fan one command out to many devices (``device_ids`` or a ``filter``)."""
+        command_type = request.data.get('command_type')
+        if not command_type:
+            return Response(
+                {'error': 'command_type is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        devices = self.get_queryset()
+        device_ids = request.data.get('device_ids')
+        filters = request.data.get('filter') or {}
+        allowed = {'protocol', 'device_type', 'manufacturer', 'model', 'firmware_version', 'asset'}
+        if not isinstance(filters, dict) or set(filters) - allowed:
+            return Response(
+                {'error': f'filter keys must be among {sorted(allowed)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if device_ids is None and not filters:
+            return Response(
+                {'error': 'device_ids or filter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            if device_ids is not None:
+                devices = devices.filter(id__in=device_ids)
+            targets = list(devices.filter(**filters).values_list('id', 'protocol')[:BULK_MAX_DEVICES + 1])
+        except (ValueError, TypeError, DjangoValidationError):
+            return Response({'error': 'invalid device_ids'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(targets) > BULK_MAX_DEVICES:
+            return Response(
+                {'error': f'at most {BULK_MAX_DEVICES} devices per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        unsupported = sorted({protocol for _, protocol in targets} - set(COMMAND_PROTOCOLS))
+        if unsupported:
+            return Response(
+                {'error': f'{", ".join(unsupported)} devices do not accept commands'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        bulk_id = uuid.uuid4()
+        with transaction.atomic():
+            issue_commands(
+                targets,
+                command_type,
+                payload=request.data.get('payload', {}),
+                issued_by=request.user,
+                metadata={'bulk_id': str(bulk_id)},
+            )
+
+        return Response(
+            {'status': 'commands_queued', 'bulk_id': str(bulk_id), 'devices': len(targets)},
+            status=status.HTTP_202_ACCEPTED
+        )
+
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         device = self.get_object()
 
-        telemetry = TelemetryData.objects.filter(
-            asset=device.asset
-        ).order_by('-timestamp')[:10]
+        telemetry = latest_points(
+            request.user.organization_id, asset_id=device.asset_id, limit=10
+        )
+        if telemetry is None:
+            telemetry = TelemetryHistory(
+                TelemetryData.objects.filter(asset=device.asset),
+                series_for(asset_ids=[device.asset_id]),
+            ).read(descending=True, limit=10)
 
         alerts = Alert.objects.filter(
             asset=device.asset
         ).order_by('-created_at')[:5]
 
-        return Response({
+        return FastJSONResponse({
             'device': DeviceSerializer(device).data,
-            'recent_telemetry': TelemetryDataSerializer(telemetry, many=True).data,
-            'recent_alerts': AlertSerializer(alerts, many=True).data,
+            'recent_telemetry': TELEMETRY_ROWS.rows(telemetry),
+            'recent_alerts': ALERT_ROWS.rows(alerts),
             'connection_status': device.connection_status,
-            'last_seen': device.last_seen,
+            'last_seen': format_datetime(device.last_seen) if device.last_seen else None,
             'uptime': 99.5 if device.connection_status == 'connected' else 0.0,
         })
 
@@ -221,42 +497,68 @@ class DeviceViewSet(viewsets.ModelViewSet):
 # -------------------------------------------------------------------
 # Sensors
 # -------------------------------------------------------------------
-class SensorViewSet(viewsets.ModelViewSet):
+class SensorViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = SensorSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-
-    def get_queryset(self):
-        return Sensor.objects.filter(
-            device__asset__organization=self.request.user.organization
-        ).select_related('device', 'device__asset')
+    queryset = Sensor.objects.select_related('device', 'device__asset')
+    organization_field = 'device__asset__organization'
 
     @action(detail=True, methods=['get'])
     def telemetry(self, request, pk=None):
         sensor = self.get_object()
         time_range = request.query_params.get('time_range', '24h')
+        since = get_time_filter(time_range)
 
-        telemetry = TelemetryData.objects.filter(
-            asset=sensor.device.asset,
-            metric=sensor.name,
-            timestamp__gte=get_time_filter(time_range)
-        ).order_by('timestamp')
+        history = TelemetryHistory(
+            TelemetryData.objects.filter(asset=sensor.device.asset, metric=sensor.name),
+            series_for(asset_ids=[sensor.device.asset_id], metric=sensor.name),
+            since=since,
+        )
 
-        return Response(
-            TelemetryDataSerializer(telemetry, many=True).data
+        export = export_format(request.query_params)
+        if export:
+            # Exports are always raw points, whatever the range
+            return export_response(history, export, filename=f'{sensor.sensor_id}-{time_range}')
+
+        # resolution: raw (default), auto, or an explicit rollup resolution.
+        # auto reads raw points unless rollups cover the whole range.
+        requested = request.query_params.get('resolution', 'raw')
+        resolution = choose_resolution(since) if requested == 'auto' else requested
+        if resolution in RESOLUTIONS:
+            covered = covered_from([sensor.device.asset_id]) if requested == 'auto' else since
+            if covered is not None and covered <= since:
+                rollups = rollup_queryset(resolution, since).filter(
+                    asset=sensor.device.asset,
+                    metric=sensor.name,
+                ).order_by('bucket')
+                return Response(TelemetryRollupSerializer(rollups, many=True).data)
+
+        # Raw points page by keyset over hot rows and archived chunks alike
+        paginator = TelemetryKeysetPagination(descending=False)
+        page = paginator.paginate_history(history, request)
+        return paginator.get_paginated_response(
+            TelemetryDataSerializer(page, many=True).data
         )
 
 
 # -------------------------------------------------------------------
 # Commands (READ-ONLY)
 # -------------------------------------------------------------------
-class CommandViewSet(viewsets.ReadOnlyModelViewSet):
+class CommandViewSet(OrgScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = CommandSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
+    queryset = Command.objects.select_related('device', 'device__asset', 'issued_by')
+    organization_field = 'device__asset__organization'
+
+
+# -------------------------------------------------------------------
+# WebSocket consumer metrics (platform-wide)
+# -------------------------------------------------------------------
+class WebSocketMetricsView(APIView):
+    permission_classes = [IsAuthenticated, IsSuperAdmin]
 
-    def get_queryset(self):
-        return Command.objects.filter(
-            device__asset__organization=self.request.user.organization
-        ).select_related('device', 'issued_by')
+    def get(self, request):
+        return Response(metrics.collect())
 
 
 from django.shortcuts import render
@@ -265,7 +567,13 @@ from .models import TelemetryData, Alert
 
 @login_required
 def telemetry_view(request):
-    telemetry = TelemetryData.objects.order_by("-timestamp")[:100]
+    telemetry = latest_points(request.user.organization_id, limit=100)
+    if telemetry is None:
+        telemetry = TelemetryData.objects.select_related("asset").order_by("-timestamp")[:100]
+    else:
+        assets = Asset.objects.in_bulk({t.asset_id for t in telemetry})
+        for t in telemetry:
+            t.asset = assets.get(t.asset_id)
     return render(request, "iot/telemetry.html", {"telemetry": telemetry})
 
 @login_required
@@ -0,0 +1,66 @@
+"""
+Hashed timing wheel for large numbers of resettable timeouts.
+
+Scheduling and re-scheduling are O(1): a key is dropped into the slot of
+its deadline and stale slot entries are discarded lazily when the wheel
+reaches them, so a device that reports every second never costs more
+than a dict write and a set add.
+"""
+import math
+import time
+
+
+class TimingWheel:
+    def __init__(self, tick=1.0, slots=512, clock=time.monotonic):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.clock = clock
+        self.deadlines = {}
+        self._tick_no = self._ticks(clock())
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def _ticks(self, moment):
+        return math.floor(moment / self.tick)
+
+    def _place(self, key, deadline):
+        # Deadlines past the wheel's horizon land early and are re-placed
+        tick_no = min(math.ceil(deadline / self.tick), self._tick_no + len(self.slots) - 1)
+        self.slots[tick_no % len(self.slots)].add(key)
+
+    def schedule(self, key, delay):
+        deadline = self.clock() + delay
+        self.deadlines[key] = deadline
+        self._place(key, deadline)
+        return deadline
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def advance(self):
+        """Expire every key whose deadline has passed; returns them."""
+        now = self.clock()
+        target = self._ticks(now)
+        expired = []
+        # A stalled loop needs at most one pass over the wheel
+        first = max(self._tick_no + 1, target - len(self.slots) + 1)
+        for tick_no in range(first, target + 1):
+            self._tick_no = tick_no
+            slot = self.slots[tick_no % len(self.slots)]
+            keys = list(slot)
+            slot.clear()
+            for key in keys:
+                deadline = self.deadlines.get(key)
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    del self.deadlines[key]
+                    expired.append(key)
+                else:
+                    self._place(key, deadline)
+        self._tick_no = max(self._tick_no, target)
+        return expired
@@ -15,21 +15,16 @@ from .serializers import (
     DigitalTwinSerializer, PredictiveModelSerializer, PredictionSerializer
 )
 from core.permissions import CanViewAnalytics, CanEditAssets
+from core.mixins import OrgScopedQuerysetMixin
 
 
 # =====================================================
 # Simulation Scenarios
 # =====================================================
-class SimulationScenarioViewSet(viewsets.ModelViewSet):
+class SimulationScenarioViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = SimulationScenarioSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-
-    def get_queryset(self):
-        return SimulationScenario.objects.filter(
-            organization=self.request.user.organization
-        ).select_related(
-            'organization', 'created_by'
-        ).prefetch_related('target_assets')
+    queryset = SimulationScenario.objects.select_related('organization', 'created_by').prefetch_related('target_assets')
 
     def perform_create(self, serializer):
         serializer.save(
@@ -83,27 +78,21 @@ class SimulationScenarioViewSet(viewsets.ModelViewSet):
 # =====================================================
 # Simulation Results
 # =====================================================
-class SimulationResultViewSet(viewsets.ReadOnlyModelViewSet):
+class SimulationResultViewSet(OrgScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = SimulationResultSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-
-    def get_queryset(self):
-        return SimulationResult.objects.filter(
-            scenario__organization=self.request.user.organization
-        ).select_related('scenario')
+    queryset = SimulationResult.objects.select_related('scenario')
+    organization_field = 'scenario__organization'
 
 
 # =====================================================
 # Digital Twins
 # =====================================================
-class DigitalTwinViewSet(viewsets.ModelViewSet):
+class DigitalTwinViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = DigitalTwinSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-
-    def get_queryset(self):
-        return DigitalTwin.objects.filter(
-            asset__organization=self.request.user.organization
-        ).select_related('asset', 'asset__asset_type')
+    queryset = DigitalTwin.objects.select_related('asset', 'asset__asset_type')
+    organization_field = 'asset__organization'
 
     @action(detail=True, methods=['post'])
     def sync(self, request, pk=None):
@@ -143,14 +132,10 @@ class DigitalTwinViewSet(viewsets.ModelViewSet):
 # =====================================================
 # Predictive Models
 # =====================================================
-class PredictiveModelViewSet(viewsets.ModelViewSet):
+class PredictiveModelViewSet(OrgScopedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = PredictiveModelSerializer
     permission_classes = [IsAuthenticated, CanEditAssets]
-
-    def get_queryset(self):
-        return PredictiveModel.objects.filter(
-            organization=self.request.user.organization
-        ).select_related('organization')
+    queryset = PredictiveModel.objects.select_related('organization')
 
     def perform_create(self, serializer):
         serializer.save(organization=self.request.user.organization)
@@ -203,14 +188,11 @@ class PredictiveModelViewSet(viewsets.ModelViewSet):
 # =====================================================
 # Predictions
 # =====================================================
-class PredictionViewSet(viewsets.ReadOnlyModelViewSet):
+class PredictionViewSet(OrgScopedQuerysetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = PredictionSerializer
     permission_classes = [IsAuthenticated, CanViewAnalytics]
-
-    def get_queryset(self):
-        return Prediction.objects.filter(
-            asset__organization=self.request.user.organization
-        ).select_related('model', 'asset')
+    queryset = Prediction.objects.select_related('model', 'asset')
+    organization_field = 'asset__organization'
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):